@@ -0,0 +1,194 @@
+import threading
+import time
+from dataclasses import dataclass, field, replace
+
+
+def _float(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass(frozen=True)
+class Position():
+    tickerId: int
+    symbol: str
+    quantity: float
+    cost_price: float
+    last_price: float
+    market_value: float
+    unrealized_pnl: float
+
+    @classmethod
+    def parse(cls, item):
+        ticker = item.get('ticker') or {}
+        return cls(
+            tickerId=int(ticker.get('tickerId') or item.get('tickerId') or 0),
+            symbol=ticker.get('symbol', ''),
+            quantity=_float(item.get('position')),
+            cost_price=_float(item.get('costPrice')),
+            last_price=_float(item.get('lastPrice')),
+            market_value=_float(item.get('marketValue')),
+            unrealized_pnl=_float(item.get('unrealizedProfitLoss')))
+
+
+@dataclass(frozen=True)
+class Order():
+    orderId: str
+    tickerId: int
+    symbol: str
+    action: str
+    order_type: str
+    time_in_force: str
+    limit_price: float
+    quantity: float
+    filled_quantity: float
+    status: str
+
+    @classmethod
+    def parse(cls, item):
+        ticker = item.get('ticker') or {}
+        return cls(
+            orderId=str(item.get('orderId')),
+            tickerId=int(ticker.get('tickerId') or item.get('tickerId') or 0),
+            symbol=ticker.get('symbol', ''),
+            action=item.get('action', ''),
+            order_type=item.get('orderType', ''),
+            time_in_force=item.get('timeInForce', ''),
+            limit_price=_float(item.get('lmtPrice')),
+            quantity=_float(item.get('totalQuantity')),
+            filled_quantity=_float(item.get('filledQuantity')),
+            status=item.get('statusStr') or item.get('status', ''))
+
+
+@dataclass(frozen=True)
+class AccountSnapshot():
+    '''
+    one parsed account / paper_account response
+    positions are keyed by tickerId, orders by orderId
+    '''
+    positions: dict
+    orders: dict
+    portfolio: dict
+    raw: dict = field(repr=False)
+    fetched_at: float = 0.0
+
+    @classmethod
+    def parse(cls, raw, fetched_at=None):
+        positions = [Position.parse(p) for p in raw.get('positions') or []]
+        orders = [Order.parse(o) for o in raw.get('openOrders') or []]
+        if 'accountMembers' in raw:
+            portfolio = {m['key']: m['value'] for m in raw['accountMembers']}
+        else:
+            # paper accounts report the totals at the top level
+            portfolio = {k: v for k, v in raw.items()
+                         if not isinstance(v, (list, dict))}
+        return cls(
+            positions={p.tickerId: p for p in positions},
+            orders={o.orderId: o for o in orders},
+            portfolio=portfolio,
+            raw=raw,
+            fetched_at=time.time() if fetched_at is None else fetched_at)
+
+
+def _diff(old, new):
+    return {
+        'added': [new[k] for k in new.keys() - old.keys()],
+        'removed': [old[k] for k in old.keys() - new.keys()],
+        'changed': [new[k] for k in new.keys() & old.keys()
+                    if new[k] != old[k]],
+    }
+
+
+def diff_snapshots(old, new):
+    '''
+    which positions and orders were added, removed or changed
+    '''
+    old_positions = old.positions if old is not None else {}
+    old_orders = old.orders if old is not None else {}
+    return {
+        'positions': _diff(old_positions, new.positions),
+        'orders': _diff(old_orders, new.orders),
+    }
+
+
+class AccountCache():
+    '''
+    coalesces account requests: a snapshot younger than ttl is reused and
+    callers arriving during a refresh wait for that refresh instead of
+    sending their own
+    '''
+
+    def __init__(self, fetch, ttl=1.0):
+        '''
+        fetch: callable returning the raw account json
+        ttl: seconds a snapshot is served without a new request
+        '''
+        self.fetch = fetch
+        self.ttl = ttl
+        self.current = None
+        self.previous = None
+        self._refreshing = False
+        self._generation = 0
+        self._invalidations = 0
+        self._error = None
+        self._cond = threading.Condition()
+
+    def get(self, max_age=None):
+        '''
+        AccountSnapshot no older than max_age (ttl by default)
+        '''
+        max_age = self.ttl if max_age is None else max_age
+        with self._cond:
+            snap = self.current
+            if snap is not None and time.time() - snap.fetched_at <= max_age:
+                return snap
+            if self._refreshing:
+                # single flight: wait for the refresh already under way
+                generation = self._generation
+                while self._generation == generation:
+                    self._cond.wait()
+                if self._error is not None:
+                    raise self._error
+                return self.current
+            self._refreshing = True
+            invalidations = self._invalidations
+        error = None
+        try:
+            snap = AccountSnapshot.parse(self.fetch())
+        except Exception as exc:
+            error = exc
+        with self._cond:
+            if error is None:
+                cached = snap
+                if self._invalidations != invalidations:
+                    # invalidated mid-flight: the response may predate the
+                    # change, so it is kept but never served as fresh
+                    cached = replace(snap, fetched_at=0.0)
+                self.previous, self.current = self.current, cached
+            self._error = error
+            self._refreshing = False
+            self._generation += 1
+            self._cond.notify_all()
+        if error is not None:
+            raise error
+        return snap
+
+    def invalidate(self):
+        '''
+        force the next get() to refetch, e.g. after an order was sent,
+        including when a refresh is already in flight
+        '''
+        with self._cond:
+            self._invalidations += 1
+            if self.current is not None:
+                self.current = replace(self.current, fetched_at=0.0)
+
+    def diff(self, since=None, max_age=None):
+        '''
+        changes between `since` (the snapshot before the latest refresh by
+        default) and a current snapshot
+        '''
+        snap = self.get(max_age)
+        return diff_snapshots(self.previous if since is None else since, snap)
@@ -0,0 +1,170 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from endpoints import Urls
+from ratelimit import RateLimiter
+from ticker_cache import TickerCache
+from transport import Transport
+from webull_open import WeBullApi
+from webull_paper import PaperApi
+
+POSITION_COLUMNS = ['account', 'tickerId', 'symbol', 'quantity',
+                    'cost_price', 'last_price', 'market_value',
+                    'unrealized_pnl']
+
+
+class AccountManager():
+    '''
+    many brokerage / paper accounts in one process. every api object has
+    its own tokens but they share one Transport (keep-alive pools, rate
+    limiter, metrics) and one TickerCache, and the accounts are fetched
+    concurrently, so refreshing 20 accounts costs about one round trip
+
+        manager = AccountManager()
+        manager.add('main', session_path='session-main.json')
+        manager.add('paper', paper=True, session_path='session-paper.json')
+        manager.refresh()                 # {name: AccountSnapshot}
+        manager.exposure()                # long / short / net per ticker
+
+    the default transport is sized for the fan-out: max_workers pooled
+    connections per host and a RateLimiter whose burst lets one request
+    per account go out at once, still paced per host (and backing off on
+    429) whatever account the requests belong to
+    '''
+
+    def __init__(self,
+                 urls=None,
+                 transport=None,
+                 ticker_cache=None,
+                 account_ttl=1.0,
+                 max_workers=32):
+        '''
+        params:
+            transport: Transport shared by every account, one paced for
+                max_workers concurrent accounts by default; a custom one
+                should keep pool_maxsize and the limiter burst at least
+                max_workers
+            account_ttl: seconds one snapshot per account is reused
+            max_workers: accounts fetched at the same time
+        '''
+        self.urls = urls or Urls()
+        self.transport = transport or Transport(
+            pool_maxsize=max(32, max_workers),
+            limiter=RateLimiter(urls=self.urls, burst=max(50, max_workers)))
+        self.ticker_cache = ticker_cache or TickerCache.shared(
+            self.urls.root)
+        self.account_ttl = account_ttl
+        self.max_workers = max_workers
+        self.apis = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, api=None, paper=False, **kwargs):
+        '''
+        register an account, building a WeBullApi (PaperApi when paper)
+        on the shared transport and ticker cache unless api is given.
+        kwargs go to the api, e.g. session_path. returns the api
+        '''
+        if api is None:
+            cls = PaperApi if paper else WeBullApi
+            api = cls(urls=self.urls,
+                      transport=self.transport,
+                      ticker_cache=self.ticker_cache,
+                      account_ttl=self.account_ttl,
+                      **kwargs)
+        with self._lock:
+            self.apis[name] = api
+        return api
+
+    def remove(self, name):
+        with self._lock:
+            self.errors.pop(name, None)
+            return self.apis.pop(name, None)
+
+    def __getitem__(self, name):
+        return self.apis[name]
+
+    def __len__(self):
+        return len(self.apis)
+
+    def names(self):
+        with self._lock:
+            return list(self.apis)
+
+    def _map(self, call, names=None):
+        '''
+        {name: call(api)} over the accounts in parallel; failures are kept
+        in self.errors and left out of the result
+        '''
+        with self._lock:
+            apis = [(n, self.apis[n]) for n in (names or self.apis)]
+        if not apis:
+            return {}
+
+        def run(item):
+            name, api = item
+            try:
+                return name, call(api), None
+            except Exception as exc:
+                return name, None, exc
+
+        result = {}
+        with ThreadPoolExecutor(
+                max_workers=min(self.max_workers, len(apis))) as pool:
+            for name, value, error in pool.map(run, apis):
+                with self._lock:
+                    if error is None:
+                        self.errors.pop(name, None)
+                        result[name] = value
+                    else:
+                        self.errors[name] = error
+        return result
+
+    def refresh(self, max_age=0, names=None):
+        '''
+        {name: AccountSnapshot} no older than max_age (account_ttl when
+        None) for every account (account or paper_account), fetched
+        concurrently
+        '''
+        return self._map(lambda api: api.get_account_snapshot(max_age),
+                         names)
+
+    def accounts(self, names=None):
+        '''
+        raw get_account json of every account, fetched concurrently
+        '''
+        return self._map(lambda api: api.get_account(), names)
+
+    def positions(self, max_age=None, names=None):
+        '''
+        DataFrame of every position, one row per (account, tickerId)
+        '''
+        import pandas as pd
+        snapshots = self.refresh(max_age, names)
+        rows = [(name, p.tickerId, p.symbol, p.quantity, p.cost_price,
+                 p.last_price, p.market_value, p.unrealized_pnl)
+                for name, snap in snapshots.items()
+                for p in snap.positions.values()]
+        return pd.DataFrame(rows, columns=POSITION_COLUMNS)
+
+    def exposure(self, max_age=None, names=None):
+        '''
+        positions netted across accounts, one row per tickerId: net
+        quantity, long and short market value (by the sign of the
+        quantity), net and gross market value, unrealized_pnl and the
+        number of accounts holding it
+        '''
+        positions = self.positions(max_age, names)
+        value = positions['market_value'].abs()
+        positions['long'] = value.where(positions['quantity'] > 0, 0.0)
+        positions['short'] = value.where(positions['quantity'] < 0, 0.0)
+        frame = positions.groupby('tickerId').agg(
+            symbol=('symbol', 'first'),
+            quantity=('quantity', 'sum'),
+            long=('long', 'sum'),
+            short=('short', 'sum'),
+            unrealized_pnl=('unrealized_pnl', 'sum'),
+            accounts=('account', 'nunique'))
+        frame['net'] = frame['long'] - frame['short']
+        frame['gross'] = frame['long'] + frame['short']
+        return frame.sort_values('gross', ascending=False)
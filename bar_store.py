@@ -0,0 +1,220 @@
+import datetime
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bars import BAR_FIELDS
+
+COLUMNS = ['timestamp'] + list(BAR_FIELDS)
+
+
+class ColumnStore():
+    '''
+    a directory of .npy files, one per column, all the same length and
+    sorted by the key column. reads are memory-mapped, writes are atomic
+    '''
+
+    def __init__(self, directory, key='timestamp'):
+        self.directory = directory
+        self.key = key
+
+    def _file(self, column):
+        return os.path.join(self.directory, column + '.npy')
+
+    def exists(self):
+        return os.path.exists(self._file(self.key))
+
+    def columns(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(f[:-4] for f in os.listdir(self.directory)
+                      if f.endswith('.npy'))
+
+    def read(self, mmap=True):
+        '''
+        {column: array}, memory-mapped read only arrays when mmap is True
+        '''
+        mode = 'r' if mmap else None
+        return {c: np.load(self._file(c), mmap_mode=mode)
+                for c in self.columns()}
+
+    def last_key(self):
+        if not self.exists():
+            return None
+        keys = np.load(self._file(self.key), mmap_mode='r')
+        return keys[-1].item() if len(keys) else None
+
+    def merge(self, new):
+        '''
+        append rows sorted by key; stored rows with a key at or after the
+        first new key are replaced, so a re-fetched last bar overwrites the
+        incomplete one. returns the number of rows written
+        '''
+        if len(new[self.key]) == 0:
+            return 0
+        old = self.read(mmap=True) if self.exists() else {}
+        cut = 0
+        if old:
+            cut = int(np.searchsorted(old[self.key], new[self.key][0]))
+        for column, values in new.items():
+            if column in old:
+                values = np.concatenate([old[column][:cut], values])
+            self._save(column, values)
+        return len(new[self.key])
+
+    def write(self, columns):
+        '''
+        replace every stored row, returns the number of rows written
+        '''
+        for column, values in columns.items():
+            self._save(column, values)
+        return len(columns[self.key])
+
+    def _save(self, column, values):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self._file(column) + '.tmp'
+        with open(tmp, 'wb') as fh:
+            np.save(fh, values)
+        os.replace(tmp, self._file(column))
+
+
+class BarStore():
+    '''
+    local history of bars keyed by (tickerId, interval)
+    sync() backfills by chaining tickerChartDatas requests backwards and
+    afterwards only fetches bars after the last stored timestamp. read()
+    slices the memory-mapped columns by date with no network.
+    '''
+
+    def __init__(self, root='bars', api=None, page=1200, dtype='float64'):
+        '''
+        params:
+            root: directory holding <interval>/<tickerId>/<column>.npy
+            api: WeBullApi used by sync, not needed to read
+            page: bars requested per tickerChartDatas call
+        '''
+        self.root = root
+        self.api = api
+        self.page = page
+        self.dtype = dtype
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def store(self, tId, interval):
+        return ColumnStore(os.path.join(self.root, interval, str(tId)))
+
+    def _lock(self, tId, interval):
+        with self._locks_lock:
+            return self._locks.setdefault((str(tId), interval),
+                                          threading.Lock())
+
+    def last_timestamp(self, tId, interval='m1'):
+        return self.store(tId, interval).last_key()
+
+    def sync(self, tId, interval='m1', max_pages=None, extendTrading=0):
+        '''
+        fetch bars newer than the last stored one (everything on the first
+        sync, up to max_pages pages back) and append them.
+        returns the number of bars written
+        '''
+        with self._lock(tId, interval):
+            store = self.store(tId, interval)
+            last = store.last_key()
+            chunks = []
+            end = None
+            pages = 0
+            while True:
+                cols = self.api.get_bars(
+                    tId=tId,
+                    interval=interval,
+                    count=self.page,
+                    extendTrading=extendTrading,
+                    timestamp=end,
+                    as_numpy=True,
+                    dtype=self.dtype)
+                ts = cols['timestamp']
+                if chunks and len(ts) and ts[-1] >= chunks[-1]['timestamp'][0]:
+                    # the server ignored the end time, nothing older exists
+                    keep = ts < chunks[-1]['timestamp'][0]
+                    cols = {k: v[keep] for k, v in cols.items()}
+                    ts = cols['timestamp']
+                if last is not None:
+                    keep = ts >= last
+                    cols = {k: v[keep] for k, v in cols.items()}
+                if len(cols['timestamp']):
+                    chunks.append(cols)
+                pages += 1
+                if (len(ts) < self.page or last is not None and ts[0] <= last
+                        or max_pages is not None and pages >= max_pages):
+                    break
+                end = int(ts[0]) - 1
+            if not chunks:
+                return 0
+            new = {c: np.concatenate([chunk[c] for chunk in chunks[::-1]])
+                   for c in COLUMNS}
+            return store.merge(new)
+
+    def sync_many(self, tIds, interval='m1', max_workers=8, **kwargs):
+        '''
+        sync many tickers concurrently, returns {tickerId: bars written}
+        '''
+        tIds = list(dict.fromkeys(tIds))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            counts = pool.map(
+                lambda tId: self.sync(tId, interval, **kwargs), tIds)
+            return dict(zip(tIds, counts))
+
+    def read(self, tId, interval='m1', start=None, end=None, as_numpy=False,
+             tz='America/New_York'):
+        '''
+        bars between start and end (inclusive, anything pd.Timestamp takes
+        or epoch seconds), read from disk only. naive bounds are in tz and
+        a date-only end ('2023-11-14') covers that whole day
+        '''
+        cols = self.store(tId, interval).read(mmap=True)
+        cols = {c: cols[c] for c in COLUMNS if c in cols}
+        if not cols:
+            cols = {c: np.empty(0, dtype='int64' if c == 'timestamp'
+                                else self.dtype) for c in COLUMNS}
+        ts = cols['timestamp']
+        lo = 0 if start is None else np.searchsorted(
+            ts, _epoch(start, tz), side='left')
+        hi = len(ts)
+        if end is not None and _date_only(end):
+            # up to, not including, the next midnight
+            hi = np.searchsorted(ts, _epoch(pd.Timestamp(end) +
+                                            pd.Timedelta(days=1), tz),
+                                 side='left')
+        elif end is not None:
+            hi = np.searchsorted(ts, _epoch(end, tz), side='right')
+        cols = {k: v[lo:hi] for k, v in cols.items()}
+        if as_numpy:
+            return cols
+        index = pd.to_datetime(cols.pop('timestamp'), unit='s', utc=True)
+        index = index.tz_convert(tz)
+        index.name = 'timestamp'
+        return pd.DataFrame(cols, index=index, copy=False)
+
+
+def _date_only(value):
+    if isinstance(value, datetime.datetime):
+        return False
+    if isinstance(value, datetime.date):
+        return True
+    return (isinstance(value, str) and ':' not in value
+            and pd.Timestamp(value) == pd.Timestamp(value).normalize())
+
+
+def _epoch(value, tz='UTC'):
+    '''
+    epoch seconds of a bound, naive times taken as wall time in tz
+    '''
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return int(value)
+    stamp = pd.Timestamp(value)
+    if stamp.tzinfo is None:
+        stamp = stamp.tz_localize(tz)
+    return int(stamp.timestamp())
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+# positions in the comma separated tickerChartDatas rows
+# timestamp, open, close, high, low, preClose, volume, vwap
+BAR_FIELDS = {
+    'open': 1,
+    'high': 3,
+    'low': 4,
+    'close': 2,
+    'volume': 6,
+    'vwap': 7,
+}
+
+
+def parse_rows(rows, dtype='float64'):
+    '''
+    one pass columnar parse of tickerChartDatas rows (newest first)
+    returns (timestamps as int64 seconds, {field: array}), ascending in time
+    'null' fields become NaN
+    '''
+    if not rows:
+        empty = np.empty(0, dtype=dtype)
+        return np.empty(0, dtype='int64'), {k: empty for k in BAR_FIELDS}
+    ncols = rows[0].count(',') + 1
+    text = ','.join(rows).replace('null', 'nan')
+    # epoch seconds are exact in float64, so the whole block parses at once
+    table = np.fromstring(text, dtype='float64', sep=',')
+    table = table.reshape(len(rows), ncols)[::-1]
+    timestamps = table[:, 0].astype('int64')
+    columns = {}
+    for name, pos in BAR_FIELDS.items():
+        if pos < ncols:
+            columns[name] = table[:, pos].astype(dtype)
+        else:
+            columns[name] = np.full(len(rows), np.nan, dtype=dtype)
+    return timestamps, columns
+
+
+def parse_bars(result, as_numpy=False, dtype='float64'):
+    '''
+    tickerChartDatas json -> DataFrame indexed by tz-aware timestamp
+    params:
+        as_numpy: return a dict of arrays with 'timestamp' (epoch seconds)
+            instead of a DataFrame
+        dtype: float dtype of the price columns, e.g. 'float32'
+    '''
+    rows = result[0]['data'] if result else []
+    timestamps, columns = parse_rows(rows, dtype=dtype)
+    if as_numpy:
+        columns['timestamp'] = timestamps
+        return columns
+    index = pd.to_datetime(timestamps, unit='s', utc=True)
+    if result:
+        index = index.tz_convert(result[0]['timeZone'])
+    index.name = 'timestamp'
+    return pd.DataFrame(columns, index=index, copy=False)
@@ -0,0 +1,173 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import requests
+
+
+@dataclass
+class OrderResult():
+    serialId: str
+    tickerId: int
+    stock: str = None
+    orderId: str = None
+    ok: bool = False
+    latency: float = None  # seconds from submit to ack
+    attempts: int = 0
+    error: str = None
+    response: object = field(default=None, repr=False)
+
+
+class Pacer():
+    '''
+    caps the rate of calls across threads: at most `rate` per second
+    '''
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class Basket():
+    '''
+    a list of orders submitted concurrently under a rate cap
+
+        basket = Basket(api, rate=10)
+        basket.add('AAPL', price=150, quant=10)
+        basket.add(tId=913256135, price=90, action='SELL', quant=1)
+        results = basket.submit()
+        basket.cancel()
+
+    every order keeps its serialId, so submitting again only resends the
+    orders that were not acknowledged and the broker can drop duplicates.
+    works with WeBullApi and PaperApi alike
+    '''
+
+    def __init__(self, api, max_workers=8, rate=10.0, retries=2):
+        '''
+        params:
+            max_workers: orders in flight at once
+            rate: max order submissions (and cancels) per second
+            retries: extra attempts with the same serialId on network errors
+        '''
+        self.api = api
+        self.max_workers = max_workers
+        self.pacer = Pacer(rate)
+        self.retries = retries
+        self.orders = {}
+        self.results = {}
+
+    def add(self,
+            stock=None,
+            tId=None,
+            price=0,
+            action='BUY',
+            orderType='LMT',
+            enforce='GTC',
+            quant=0,
+            serialId=None):
+        '''
+        queue one order, returns its serialId
+        '''
+        if stock is None and tId is None:
+            raise ValueError('Must provide a stock symbol or a stock id')
+        serialId = serialId or str(uuid.uuid4())
+        self.orders[serialId] = {
+            'stock': stock,
+            'tId': tId,
+            'price': price,
+            'action': action,
+            'orderType': orderType,
+            'enforce': enforce,
+            'quant': quant,
+        }
+        return serialId
+
+    def _resolve(self):
+        stocks = [o['stock'] for o in self.orders.values()
+                  if o['tId'] is None]
+        if stocks:
+            ids = self.api.warm_tickers(stocks, max_workers=self.max_workers)
+            for order in self.orders.values():
+                if order['tId'] is None:
+                    order['tId'] = ids.get(order['stock']) or None
+
+    def _submit_one(self, serialId):
+        order = self.orders[serialId]
+        result = self.results.get(serialId) or OrderResult(
+            serialId, order['tId'], order['stock'])
+        self.results[serialId] = result
+        if order['tId'] is None:
+            result.error = 'unknown symbol'
+            return result
+        for _ in range(self.retries + 1):
+            self.pacer.wait()
+            result.attempts += 1
+            start = time.perf_counter()
+            try:
+                response = self.api.place_order(
+                    tId=order['tId'],
+                    price=order['price'],
+                    action=order['action'],
+                    orderType=order['orderType'],
+                    enforce=order['enforce'],
+                    quant=order['quant'],
+                    serialId=serialId)
+            except requests.RequestException as error:
+                result.error = repr(error)
+                continue
+            except (KeyError, ValueError) as error:
+                # the broker answered without an orderId: rejected
+                result.error = repr(error)
+                break
+            result.latency = time.perf_counter() - start
+            result.response = response
+            result.orderId = (response.get('orderId')
+                              if isinstance(response, dict) else response)
+            result.ok = result.orderId is not None
+            result.error = None if result.ok else 'rejected'
+            break
+        return result
+
+    def submit(self):
+        '''
+        send every order not acknowledged yet, returns [OrderResult] in the
+        order the orders were added
+        '''
+        self._resolve()
+        pending = [s for s in self.orders
+                   if not (s in self.results and self.results[s].ok)]
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                list(pool.map(self._submit_one, pending))
+        return [self.results[s] for s in self.orders if s in self.results]
+
+    def cancel(self):
+        '''
+        cancel every acknowledged order concurrently,
+        returns {serialId: cancel result}
+        '''
+        acked = [r for r in self.results.values() if r.ok]
+
+        def cancel_one(result):
+            self.pacer.wait()
+            try:
+                return result.serialId, self.api.cancel_order(result.orderId)
+            except requests.RequestException:
+                return result.serialId, False
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return dict(pool.map(cancel_one, acked))
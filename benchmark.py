@@ -0,0 +1,471 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+
+from account_manager import AccountManager
+from bars import parse_bars
+from endpoints import Urls
+from paper_engine import PaperEngine
+from ratelimit import RateLimiter
+from standin import StandInServer, bar_rows
+from transport import Transport
+from webull_async import AsyncWeBullApi
+from webull_open import WeBullApi
+from webull_paper import PaperApi
+
+# the network benches run the client as users get it (default Transport
+# and the shared RateLimiter); bench_limiter compares pacing explicitly.
+# regression gates on the flattened results ('bench.label.metric'):
+# ('min', bound) for rates, ('max', bound) for times. generous on purpose,
+# they catch a lost vectorization or a connection per request, not noise
+THRESHOLDS = {
+    'transport.after.req_per_sec': ('min', 300.0),
+    'async.async.req_per_sec': ('min', 300.0),
+    'endpoints.bars.p99_ms': ('max', 50.0),
+    'endpoints.paper_account.p99_ms': ('max', 50.0),
+    'endpoints.quote.p99_ms': ('max', 50.0),
+    'endpoints.account.p99_ms': ('max', 50.0),
+    'endpoints.order.p99_ms': ('max', 100.0),
+    'endpoints.paper_order.p99_ms': ('max', 100.0),
+    'bars.parse.ms_per_1k': ('max', 5.0),
+    'bars.numpy.ms_per_1k': ('max', 3.0),
+    'bars.get_bars.ms_per_1k': ('max', 30.0),
+    'research.features.ms_per_10k': ('max', 50.0),
+    'research.grid.ms_per_10k': ('max', 200.0),
+    'paper.place.orders_per_sec': ('min', 20000.0),
+    'accounts.all.wall_ms': ('max', 250.0),
+    'options.cold.list_requests': ('max', 1.0),
+    'options.cold.wall_ms': ('max', 2000.0),
+    'options.refresh.wall_ms': ('max', 1500.0),
+    'startup.api.total_ms': ('max', 500.0),
+    'startup.paper.total_ms': ('max', 500.0),
+}
+
+# run in a fresh interpreter: import time + construction, against a closed
+# port so a request sent while constructing fails the bench
+STARTUP = '''
+import time
+start = time.perf_counter()
+from endpoints import Urls
+from {module} import {cls}
+imported = time.perf_counter()
+{cls}(urls=Urls(root='http://127.0.0.1:9'))
+built = time.perf_counter()
+print((imported - start) * 1000, (built - imported) * 1000)
+'''
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    idx = min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def timed_calls(call, n):
+    '''
+    run call() n times, return requests/sec, p50 and p99 latency in ms
+    '''
+    samples = []
+    start = time.perf_counter()
+    for _ in range(n):
+        t0 = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    return {
+        'req_per_sec': n / elapsed,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+    }
+
+
+def bench_endpoints(n=500, latency=0.0):
+    '''
+    throughput and latency per route of the stand-in: quote, bars, account,
+    place + cancel, and the same for a paper account
+    '''
+    with StandInServer(latency=latency) as server:
+        urls = Urls(root=server.root)
+        api = WeBullApi(urls=urls)
+        api.account_id = '1'
+        paper = PaperApi(urls=urls)
+        paper.paper_account_id = '1'
+        calls = {
+            'quote': lambda: api.get_quote(tId=913256135),
+            'bars': lambda: api.get_bars(tId=913256135, count=100),
+            'account': api.get_account,
+            'order': lambda: api.cancel_order(
+                api.place_order(tId=913256135, price=100, quant=1)),
+            'paper_account': paper.get_account,
+            'paper_order': lambda: paper.cancel_order(
+                paper.place_order(tId=913256135, price=100,
+                                  quant=1)['orderId']),
+        }
+        return {label: timed_calls(call, n) for label, call in calls.items()}
+
+
+def bench_transport(n=2000, latency=0.0):
+    '''
+    quotes against a local stand-in server:
+    before = module level requests.get (new connection per call)
+    after = WeBullApi.get_quote over the pooled keep-alive Transport
+    the stand-in speaks plain http, so the TLS handshake that dominates
+    against the real hosts is not even part of the "before" numbers
+    '''
+    results = {}
+    with StandInServer(latency=latency) as server:
+        urls = Urls(root=server.root)
+        url = urls.quotes(913256135)
+        results['before'] = timed_calls(
+            lambda: requests.get(url, timeout=10).json(), n)
+        api = WeBullApi(urls=urls)
+        results['after'] = timed_calls(
+            lambda: api.get_quote(tId=913256135), n)
+    return results
+
+
+def bench_async(n=200, latency=0.02):
+    '''
+    wall time to fetch n quotes: serial sync client vs gathered async client
+    with `latency` seconds per request on the stand-in server
+    '''
+    tIds = list(range(1, n + 1))
+    with StandInServer(latency=latency) as server:
+        urls = Urls(root=server.root)
+        api = WeBullApi(urls=urls)
+        start = time.perf_counter()
+        for tId in tIds:
+            api.get_quote(tId=tId)
+        serial = time.perf_counter() - start
+
+        async def gathered():
+            async with AsyncWeBullApi(urls=urls) as aapi:
+                start = time.perf_counter()
+                await asyncio.gather(*[aapi.get_quote(tId=t) for t in tIds])
+                return time.perf_counter() - start
+
+        concurrent = asyncio.run(gathered())
+    return {
+        'sync': {'req_per_sec': n / serial, 'wall_ms': serial * 1000},
+        'async': {'req_per_sec': n / concurrent,
+                  'wall_ms': concurrent * 1000},
+    }
+
+
+def bench_limiter(n=400, rate_limit=100, workers=16):
+    '''
+    n quotes from `workers` threads against a stand-in that answers 429 over
+    `rate_limit` req/s: unpaced transport vs the adaptive RateLimiter.
+    counts the throttled responses and the wall time to get every quote
+    '''
+    results = {}
+    for label, limiter in (('unpaced', False),
+                           ('adaptive', RateLimiter(rate=rate_limit / 2))):
+        with StandInServer(rate_limit=rate_limit) as server:
+            api = WeBullApi(urls=Urls(root=server.root),
+                            transport=Transport(limiter=limiter, retries=8))
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(lambda t: api.get_quote(tId=t), range(n)))
+            wall = time.perf_counter() - start
+            results[label] = {
+                'req_per_sec': n / wall,
+                'throttled': server.httpd.throttle.rejected,
+                'quote_rate': (limiter.rates()['base_quote_url']
+                               if limiter else 0.0),
+            }
+    return results
+
+
+def bench_options(latency=0.01, rounds=5):
+    '''
+    SPY sized chain (standin.OPTION_EXPIRIES x OPTION_STRIKES x call/put):
+    cold = one expiry listing (every contract) + every quote, refresh =
+    contracts from the per-expiry cache and every quote through
+    option_quotes. list_requests counts the listing / per-expiry requests
+    of the cold chain
+    '''
+    with StandInServer(latency=latency) as server:
+        api = WeBullApi(urls=Urls(root=server.root))
+        calls = api.metrics.calls
+        listed = calls.get('options', 0) + calls.get('options_exp_date', 0)
+        start = time.perf_counter()
+        chain = api.get_option_chain(tId=913256135)
+        cold = time.perf_counter() - start
+        listed = (calls.get('options', 0) + calls.get('options_exp_date', 0)
+                  - listed)
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            api.get_option_chain(tId=913256135)
+            samples.append(time.perf_counter() - start)
+    return {
+        'cold': {'contracts': len(chain), 'list_requests': listed,
+                 'wall_ms': cold * 1000},
+        'refresh': {'contracts': len(chain),
+                    'wall_ms': percentile(samples, 50) * 1000},
+    }
+
+
+def bench_paper_engine(n=100000, tickers=100):
+    '''
+    orders per second into the local PaperEngine and fills per second when
+    one bar per ticker sweeps the books
+    '''
+    engine = PaperEngine(cash=1e12)
+    prices = [90 + (i * 7919 % 2000) / 100.0 for i in range(n)]
+    start = time.perf_counter()
+    for i, price in enumerate(prices):
+        engine.place_order(tId=i % tickers, price=price,
+                           action='BUY' if i % 2 else 'SELL', quant=1)
+        if i % 10 == 0:
+            engine.cancel_order(i)
+    placed = time.perf_counter() - start
+    start = time.perf_counter()
+    for tId in range(tickers):
+        engine.on_bar(tId, 100.0, 105.0, 95.0, 100.0)
+    matched = time.perf_counter() - start
+    return {
+        'place': {'orders_per_sec': n / placed},
+        'match': {'fills_per_sec': len(engine.fills) / matched,
+                  'fills': len(engine.fills)},
+    }
+
+
+def bench_accounts(accounts=20, latency=0.02, rounds=5):
+    '''
+    wall ms to refresh one account vs `accounts` accounts through one
+    AccountManager (shared transport, concurrent fetch), with `latency`
+    seconds per request on the stand-in
+    '''
+    with StandInServer(latency=latency) as server:
+        manager = AccountManager(urls=Urls(root=server.root))
+        for i in range(accounts):
+            api = manager.add(f'acc{i}', paper=bool(i % 2))
+            api.account_id = api.paper_account_id = str(i + 1)
+        results = {}
+        for label, names in (('one', ['acc0']), ('all', None)):
+            samples = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                manager.refresh(names=names)
+                samples.append(time.perf_counter() - start)
+            results[label] = {'accounts': len(names or manager),
+                              'wall_ms': percentile(samples, 50) * 1000}
+    return results
+
+
+def bench_bars(count=10000, rounds=20, latency=0.0):
+    '''
+    ms per 1k bars: parse_bars to a DataFrame and to arrays, and get_bars
+    end to end (request, json decode, parse) against the stand-in
+    '''
+    result = [{'tickerId': 913256135, 'timeZone': 'America/New_York',
+               'data': bar_rows(count)}]
+    per_1k = 1000.0 / count
+    results = {}
+    for label, as_numpy in (('parse', False), ('numpy', True)):
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            parse_bars(result, as_numpy=as_numpy)
+            samples.append(time.perf_counter() - start)
+        results[label] = {
+            'ms_per_1k': percentile(samples, 50) * 1000 * per_1k}
+    with StandInServer(latency=latency) as server:
+        api = WeBullApi(urls=Urls(root=server.root))
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            api.get_bars(tId=913256135, count=count)
+            samples.append(time.perf_counter() - start)
+    results['get_bars'] = {
+        'ms_per_1k': percentile(samples, 50) * 1000 * per_1k}
+    return results
+
+
+def daily_history(rows, seed=0):
+    '''
+    random walk with the columns get_hist_and_preprocess returns
+    '''
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, rows)))
+    open_ = close * (1 + rng.normal(0, 0.005, rows))
+    pv = pd.DataFrame({
+        'Date': pd.date_range('1900-01-01', periods=rows, freq='D'),
+        'Open': open_,
+        'High': np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, rows)),
+        'Low': np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, rows)),
+        'Close': close,
+        'Volume': rng.integers(1000, 100000, rows).astype('float64'),
+    })
+    pv['Year'] = pv['Date'].dt.year
+    return pv
+
+
+def bench_research(rows=100000, rounds=3):
+    '''
+    ms per 10k daily rows of the research.py pipeline: add_features, then
+    backtest_grid over the 4 x 3 x 3 grid of its __main__
+    '''
+    import research
+    pv = daily_history(rows)
+    per_10k = 10000.0 / rows
+    features, grid = [], []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        frame = research.add_features(pv)
+        features.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        research.backtest_grid(frame,
+                               take_profits=[0.01, 0.02, 0.03, 0.05],
+                               stop_losses=[0.02, 0.05, 0.1],
+                               thresholds=[0.003, 0.005, 0.01])
+        grid.append(time.perf_counter() - start)
+    return {
+        'features': {'ms_per_10k': min(features) * 1000 * per_10k},
+        'grid': {'ms_per_10k': min(grid) * 1000 * per_10k},
+    }
+
+
+def bench_startup(rounds=5):
+    '''
+    ms from a cold interpreter to a constructed client, split in import
+    and construction (median of rounds); construction must not touch the
+    network
+    '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for label, module, cls in (('api', 'webull_open', 'WeBullApi'),
+                               ('paper', 'webull_paper', 'PaperApi')):
+        samples = []
+        for _ in range(rounds):
+            out = subprocess.run(
+                [sys.executable, '-c', STARTUP.format(module=module, cls=cls)],
+                cwd=here, capture_output=True, text=True, check=True)
+            samples.append([float(v) for v in out.stdout.split()])
+        imported = percentile([i for i, _ in samples], 50)
+        built = percentile([b for _, b in samples], 50)
+        results[label] = {'import_ms': imported, 'construct_ms': built,
+                          'total_ms': percentile([i + b for i, b in samples],
+                                                 50)}
+    return results
+
+
+def flatten(results):
+    '''
+    {bench: {label: {metric: value}}} -> {'bench.label.metric': value}
+    '''
+    return {f'{name}.{label}.{metric}': value
+            for name, rows in results.items()
+            for label, row in rows.items()
+            for metric, value in row.items()}
+
+
+def _direction(metric):
+    # rates must not drop, times must not grow, other counts are not gated
+    if metric.endswith('per_sec'):
+        return 'min'
+    if metric.endswith('_ms') or metric.startswith('ms_per'):
+        return 'max'
+    return None
+
+
+def regressions(flat, thresholds=THRESHOLDS, baseline=None, tolerance=0.25):
+    '''
+    failed gates: absolute thresholds, and with a baseline (flattened
+    results of an earlier run) any time or rate more than `tolerance`
+    worse than it was
+    '''
+    failed = []
+    for key, (op, bound) in thresholds.items():
+        value = flat.get(key)
+        if value is None:
+            continue
+        if value < bound if op == 'min' else value > bound:
+            failed.append({'metric': key, 'value': value, op: bound})
+    for key, before in (baseline or {}).items():
+        op, value = _direction(key.rsplit('.', 1)[-1]), flat.get(key)
+        if op is None or value is None or not before:
+            continue
+        bound = before * (1 - tolerance if op == 'min' else 1 + tolerance)
+        if value < bound if op == 'min' else value > bound:
+            failed.append({'metric': key, 'value': value, 'baseline': before,
+                           op: bound})
+    return failed
+
+
+BENCHES = {
+    'startup': bench_startup,
+    'transport': bench_transport,
+    'endpoints': bench_endpoints,
+    'async': bench_async,
+    'limiter': bench_limiter,
+    'accounts': bench_accounts,
+    'options': bench_options,
+    'bars': bench_bars,
+    'research': bench_research,
+    'paper': bench_paper_engine,
+}
+
+
+def run(path='bench_results.json', names=None, baseline=None,
+        tolerance=0.25, thresholds=THRESHOLDS):
+    '''
+    run the benches, print them and write the results, thresholds and
+    failed gates as json to `path`. baseline: path of an earlier results
+    file to compare against. returns the failed gates
+    '''
+    results = {}
+    for name in names or BENCHES:
+        results[name] = BENCHES[name]()
+        report(name, results[name])
+    flat = flatten(results)
+    before = None
+    if baseline is not None:
+        with open(baseline) as f:
+            before = json.load(f)['metrics']
+    failed = regressions(flat, thresholds, before, tolerance)
+    with open(path, 'w') as f:
+        json.dump({
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': results,
+            'metrics': flat,
+            'thresholds': thresholds,
+            'regressions': failed,
+        }, f, indent=2)
+    for gate in failed:
+        print('REGRESSION', gate)
+    return failed
+
+
+def report(name, results):
+    for label, row in results.items():
+        print(f'{name:<12} {label:<14} ' + '  '.join(
+            f'{key} {value:>10.3f}' for key, value in row.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benches', nargs='*',
+                        help='subset of ' + ', '.join(BENCHES))
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='results file of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+    sys.exit(1 if run(args.output, args.benches, args.baseline,
+                      args.tolerance) else 0)
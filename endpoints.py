@@ -1,5 +1,11 @@
 class Urls():
-    def __init__(self):
+    def __init__(self, root=None):
+        '''
+        root: optional scheme://host[:port], reroutes every base url under it
+        (https://quoteapi.webull.com/api -> {root}/quoteapi.webull.com/api)
+        so the client can be pointed at a local stand-in server
+        '''
+        self.root = root
         self.base_info_url = 'https://infoapi.webull.com/api'
         self.base_options_url = 'https://quoteapi.webullbroker.com/api'
         self.base_options_gw_url = 'https://quotes-gw.webullbroker.com/api'
@@ -9,6 +15,13 @@ class Urls():
         self.base_trade_url = 'https://tradeapi.webulltrade.com/api/trade'
         self.base_user_url = 'https://userapi.webull.com/api'
         self.base_userbroker_url = 'https://userapi.webullbroker.com/api'
+        if root is not None:
+            for name, url in self.bases().items():
+                host_path = url.split('://', 1)[1]
+                setattr(self, name, root.rstrip('/') + '/' + host_path)
+
+    def bases(self):
+        return {k: v for k, v in vars(self).items() if k.startswith('base_')}
 
     def account(self, account_id):
         return f'{self.base_trade_url}/v2/home/{account_id}'
@@ -73,8 +86,8 @@ class Urls():
     def options_exp_date(self, stock):
         return f'{self.base_options_url}/quote/option/{stock}/list'
 
-    def orders(self, account_id):
-        return f'{self.base_trade_url}/v2/option/list?secAccountId={account_id}&startTime=1970-0-1&dateType=ORDER&status='
+    def orders(self, account_id, start_time='1970-0-1'):
+        return f'{self.base_trade_url}/v2/option/list?secAccountId={account_id}&startTime={start_time}&dateType=ORDER&status='
 
     def paper_account(self, paper_account_id):
         return f'{self.base_paper_url}/paper/1/acc/{paper_account_id}'
@@ -112,6 +125,9 @@ class Urls():
     def replace_option_orders(self, account_id):
         return f'{self.base_trade_url}/v2/option/replaceOrder/{account_id}'
 
+    def stream(self):
+        return 'wss://wspush.webullbroker.com/mqtt'
+
     def stock_id(self, stock):
         return f'{self.base_info_url}/search/tickers5?keys={stock}&queryNumber=1'
 
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+ROLLING = {
+    'mean': np.mean,
+    'std': lambda w, axis: np.std(w, axis=axis, ddof=1),
+    'min': np.min,
+    'max': np.max,
+    'sum': np.sum,
+}
+
+
+class Feature():
+    '''
+    one derived column: compute(arrays, lo, hi) fills rows lo:hi and may
+    read back `lookback` rows before lo
+    '''
+
+    def __init__(self, name, compute, lookback=0):
+        self.name = name
+        self.compute = compute
+        self.lookback = lookback
+
+
+def _back(x, k, lo, hi):
+    '''
+    x[i - k] for i in lo:hi, NaN where i - k < 0
+    '''
+    out = np.full(hi - lo, np.nan)
+    first = max(lo, k)
+    if first < hi:
+        out[first - lo:] = x[first - k:hi - k]
+    return out
+
+
+class FeatureEngine():
+    '''
+    lags, diffs, ratios and rolling statistics computed straight from the
+    column arrays: no frame copies, shifts or merges. appending bars only
+    computes the new rows (plus the lookback they read)
+
+        engine = FeatureEngine(pv[['Open', 'High', 'Low', 'Close']])
+        engine.lag('Close', 1)                      # Close_d1
+        engine.spread('High', 'Open', 'Open', 'High/Open')
+        engine.rolling('Close', 20, 'std')          # Close_std20
+        engine.frame()
+        engine.append({'Open': 1.0, 'High': 1.1, 'Low': 0.9, 'Close': 1.0})
+    '''
+
+    def __init__(self, data=None, capacity=1024):
+        '''
+        data: DataFrame or {column: array} of raw inputs
+        '''
+        data = {} if data is None else {
+            c: np.asarray(data[c], dtype='float64') for c in data}
+        self.size = len(next(iter(data.values()))) if data else 0
+        self._capacity = max(capacity, self.size)
+        self._columns = {}
+        for name, values in data.items():
+            self._columns[name] = self._buffer()
+            self._columns[name][:self.size] = values
+        self.raw = list(data)
+        self.features = []
+
+    def _buffer(self):
+        return np.full(self._capacity, np.nan)
+
+    def _grow(self, size):
+        if size <= self._capacity:
+            return
+        while self._capacity < size:
+            self._capacity *= 2
+        for name, old in self._columns.items():
+            new = self._buffer()
+            new[:len(old)] = old
+            self._columns[name] = new
+
+    def __getitem__(self, name):
+        return self._columns[name][:self.size]
+
+    def add(self, feature):
+        self.features.append(feature)
+        self._columns[feature.name] = self._buffer()
+        self._columns[feature.name][:self.size] = feature.compute(
+            self._columns, 0, self.size)
+        return self
+
+    def lag(self, column, k=1, name=None):
+        return self.add(Feature(
+            name or f'{column}_d{k}',
+            lambda cols, lo, hi: _back(cols[column], k, lo, hi), k))
+
+    def diff(self, column, k=1, name=None):
+        return self.add(Feature(
+            name or f'{column}_diff{k}',
+            lambda cols, lo, hi: cols[column][lo:hi] - _back(
+                cols[column], k, lo, hi), k))
+
+    def ratio(self, numerator, denominator, name=None):
+        return self.add(Feature(
+            name or f'{numerator}/{denominator}',
+            lambda cols, lo, hi: cols[numerator][lo:hi] / cols[denominator][
+                lo:hi]))
+
+    def spread(self, a, b, base, name, absolute=False):
+        '''
+        (a - b) / base, e.g. spread('High', 'Open', 'Open', 'High/Open')
+        '''
+
+        def compute(cols, lo, hi):
+            delta = cols[a][lo:hi] - cols[b][lo:hi]
+            return (np.abs(delta) if absolute else delta) / cols[base][lo:hi]
+
+        return self.add(Feature(name, compute))
+
+    def rolling(self, column, window, stat='mean', name=None):
+        reduce = ROLLING[stat]
+
+        def compute(cols, lo, hi):
+            out = np.full(hi - lo, np.nan)
+            first = max(lo, window - 1)
+            if first < hi:
+                windows = sliding_window_view(
+                    cols[column][first - window + 1:hi], window)
+                out[first - lo:] = reduce(windows, axis=-1)
+            return out
+
+        return self.add(Feature(
+            name or f'{column}_{stat}{window}', compute, window - 1))
+
+    def expr(self, fn, name, lookback=0):
+        '''
+        elementwise fn({column: rows lo:hi}) -> array, e.g. a linear
+        combination of other features
+        '''
+
+        class _Rows():
+            def __init__(self, cols, lo, hi):
+                self.cols, self.lo, self.hi = cols, lo, hi
+
+            def __getitem__(self, column):
+                return self.cols[column][self.lo:self.hi]
+
+        return self.add(Feature(
+            name, lambda cols, lo, hi: fn(_Rows(cols, lo, hi)), lookback))
+
+    def extend(self, data):
+        '''
+        append rows of raw inputs ({column: array}) and compute only the
+        new feature rows
+        '''
+        n = len(np.atleast_1d(data[self.raw[0]]))
+        lo, hi = self.size, self.size + n
+        self._grow(hi)
+        for column in self.raw:
+            self._columns[column][lo:hi] = data[column]
+        for feature in self.features:
+            self._columns[feature.name][lo:hi] = feature.compute(
+                self._columns, lo, hi)
+        self.size = hi
+        return self
+
+    def append(self, row):
+        '''
+        append one bar given as {column: value}
+        '''
+        return self.extend({c: [row[c]] for c in self.raw})
+
+    def frame(self, columns=None, index=None):
+        '''
+        DataFrame view of the raw and derived columns
+        '''
+        columns = columns or self.raw + [f.name for f in self.features]
+        return pd.DataFrame({c: self[c] for c in columns}, index=index,
+                            copy=False)
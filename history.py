@@ -0,0 +1,145 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from bar_store import ColumnStore
+
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+# compared on the re-fetched overlap day to spot a re-adjusted history
+PRICES = ['Open', 'High', 'Low', 'Close']
+
+
+class YFinanceSource():
+    '''
+    daily history from yfinance, the default source of research.py
+    '''
+
+    def fetch(self, ticker, start=None):
+        '''
+        DataFrame with Date and FIELDS columns, from start (inclusive) on,
+        or the full history when start is None
+        '''
+        import yfinance
+
+        stock = yfinance.Ticker(ticker)
+        if start is None:
+            pv = stock.history(period='max', actions=False)
+        else:
+            pv = stock.history(start=pd.Timestamp(start).strftime('%Y-%m-%d'),
+                               actions=False)
+        pv.index.name = 'Date'
+        return pv.reset_index()[['Date'] + FIELDS]
+
+
+class BarStoreSource():
+    '''
+    daily history from a bar_store.BarStore, no network
+    tickers: {symbol: tickerId} for the symbols research asks for
+    '''
+
+    def __init__(self, store, tickers, interval='d1'):
+        self.store = store
+        self.tickers = tickers
+        self.interval = interval
+
+    def fetch(self, ticker, start=None):
+        df = self.store.read(self.tickers[ticker], self.interval, start=start)
+        df = df.rename(columns=str.capitalize)
+        df.index.name = 'Date'
+        return df.reset_index()[['Date'] + FIELDS]
+
+
+class CachedHistory():
+    '''
+    on-disk cache in front of a history source. every ticker is a
+    ColumnStore (one memory-mappable .npy per column) keyed by Date; a
+    refresh only asks the source for dates from the next to last stored
+    one on, and rebuilds the cache when the source re-adjusted its prices
+    '''
+
+    def __init__(self, source=None, root='history', max_age=6 * 3600,
+                 offline=False):
+        '''
+        params:
+            source: object with fetch(ticker, start=None), YFinanceSource
+                by default
+            max_age: seconds after a refresh before the source is asked
+                again
+            offline: never touch the source, serve saved files only
+        '''
+        self.source = source or YFinanceSource()
+        self.root = root
+        self.max_age = max_age
+        self.offline = offline
+
+    def store(self, ticker):
+        return ColumnStore(os.path.join(self.root, ticker), key='Date')
+
+    def _stamp(self, ticker):
+        return os.path.join(self.root, ticker, '.refreshed')
+
+    def is_fresh(self, ticker):
+        try:
+            return time.time() - os.path.getmtime(
+                self._stamp(ticker)) < self.max_age
+        except OSError:
+            return False
+
+    def _columns(self, pv):
+        dates = pd.DatetimeIndex(pv['Date'])
+        if dates.tz is not None:
+            dates = dates.tz_localize(None)
+        new = {'Date': dates.normalize().to_numpy('datetime64[ns]')}
+        for field in FIELDS:
+            new[field] = pv[field].to_numpy('float64')
+        return new
+
+    def refresh(self, ticker):
+        '''
+        append the dates missing from the cache, returns rows written.
+        the source is asked from the next to last stored date, so one
+        complete day is fetched again; when its prices moved (yfinance
+        re-adjusts the whole history after a split or dividend) the full
+        history is fetched again and replaces the cache
+        '''
+        store = self.store(ticker)
+        cols = store.read(mmap=True) if store.exists() else {}
+        if not cols or not len(cols['Date']):
+            written = store.merge(self._columns(self.source.fetch(ticker)))
+        else:
+            i = max(len(cols['Date']) - 2, 0)
+            day = cols['Date'][i]
+            stored = np.array([cols[f][i] for f in PRICES])
+            new = self._columns(self.source.fetch(
+                ticker, start=pd.Timestamp(day)))
+            row = np.searchsorted(new['Date'], day)
+            if (row < len(new['Date']) and new['Date'][row] == day
+                    and not np.allclose([new[f][row] for f in PRICES],
+                                        stored, rtol=1e-6, equal_nan=True)):
+                written = store.write(self._columns(self.source.fetch(ticker)))
+            else:
+                written = store.merge(new)
+        os.makedirs(os.path.dirname(self._stamp(ticker)), exist_ok=True)
+        with open(self._stamp(ticker), 'a'):
+            os.utime(self._stamp(ticker))
+        return written
+
+    def load(self, ticker, start=None, end=None):
+        '''
+        DataFrame with Date and FIELDS, refreshed first unless offline or
+        fresh; the columns are memory-mapped from the saved files
+        '''
+        store = self.store(ticker)
+        if not self.offline and not self.is_fresh(ticker):
+            self.refresh(ticker)
+        if not store.exists():
+            raise FileNotFoundError(f'no saved history for {ticker}')
+        cols = store.read(mmap=True)
+        dates = cols['Date']
+        lo = 0 if start is None else np.searchsorted(
+            dates, np.datetime64(pd.Timestamp(start)), side='left')
+        hi = len(dates) if end is None else np.searchsorted(
+            dates, np.datetime64(pd.Timestamp(end)), side='right')
+        return pd.DataFrame({c: cols[c][lo:hi] for c in ['Date'] + FIELDS})
@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# upper bounds in seconds, 100us .. 30s
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram():
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        '''
+        upper bound of the bucket holding the q-th observation
+        '''
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'), ), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'],
+                                self.counts)),
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+        }
+
+
+class Metrics():
+    '''
+    per endpoint call and byte counters, plus error counters and latency
+    histograms per phase: 'request' (network), 'decode' (json), 'frame'
+    (DataFrame construction) and 'throttle' (time spent waiting for the rate
+    limiter). hooks receive every observation, so users can attach
+    their own timers. cheap enough to leave on: one lock and a bisect per
+    observation
+    '''
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.calls = {}
+        self.errors = {}
+        self.bytes_in = {}
+        self.bytes_out = {}
+        self.latency = {}
+        self.hooks = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def add_hook(self, hook):
+        '''
+        hook(endpoint, phase, seconds, error) after every observation
+        '''
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def observe(self, endpoint, phase, seconds, error=False, bytes_in=0,
+                bytes_out=0):
+        if not self.enabled:
+            return
+        endpoint = endpoint or 'other'
+        with self._lock:
+            key = (endpoint, phase)
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram()
+            histogram.observe(seconds)
+            if phase == 'request':
+                self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+                self.bytes_in[endpoint] = self.bytes_in.get(endpoint,
+                                                            0) + bytes_in
+                self.bytes_out[endpoint] = self.bytes_out.get(endpoint,
+                                                              0) + bytes_out
+            if error:
+                self.errors[key] = self.errors.get(key, 0) + 1
+        for hook in self.hooks:
+            hook(endpoint, phase, seconds, error)
+
+    @contextmanager
+    def timer(self, endpoint, phase):
+        '''
+        with metrics.timer('bars', 'frame'): ...
+        '''
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.observe(endpoint, phase, time.perf_counter() - start, error)
+
+    def reset(self):
+        with self._lock:
+            for table in (self.calls, self.errors, self.bytes_in,
+                          self.bytes_out, self.latency):
+                table.clear()
+
+    def to_dict(self):
+        with self._lock:
+            endpoints = sorted({e for e, _ in self.latency} | set(self.calls))
+            return {
+                endpoint: {
+                    'calls': self.calls.get(endpoint, 0),
+                    'errors': {
+                        phase: n
+                        for (e, phase), n in sorted(self.errors.items())
+                        if e == endpoint
+                    },
+                    'bytes_in': self.bytes_in.get(endpoint, 0),
+                    'bytes_out': self.bytes_out.get(endpoint, 0),
+                    'latency': {
+                        phase: h.to_dict()
+                        for (e, phase), h in sorted(self.latency.items())
+                        if e == endpoint
+                    },
+                }
+                for endpoint in endpoints
+            }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self, prefix='webull'):
+        '''
+        Prometheus text exposition format
+        '''
+        lines = []
+        with self._lock:
+            for name, table in (('requests_total', self.calls),
+                                ('received_bytes_total', self.bytes_in),
+                                ('sent_bytes_total', self.bytes_out)):
+                lines.append(f'# TYPE {prefix}_{name} counter')
+                for endpoint, value in sorted(table.items()):
+                    lines.append(
+                        f'{prefix}_{name}{{endpoint="{endpoint}"}} {value}')
+            lines.append(f'# TYPE {prefix}_errors_total counter')
+            for (endpoint, phase), value in sorted(self.errors.items()):
+                lines.append(f'{prefix}_errors_total{{endpoint="{endpoint}",'
+                             f'phase="{phase}"}} {value}')
+            lines.append(f'# TYPE {prefix}_seconds histogram')
+            for (endpoint, phase), h in sorted(self.latency.items()):
+                labels = f'endpoint="{endpoint}",phase="{phase}"'
+                seen = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    seen += n
+                    lines.append(
+                        f'{prefix}_seconds_bucket{{{labels},le="{bound}"}} '
+                        f'{seen}')
+                lines.append(f'{prefix}_seconds_bucket{{{labels},le="+Inf"}} '
+                             f'{h.count}')
+                lines.append(f'{prefix}_seconds_sum{{{labels}}} {h.sum}')
+                lines.append(f'{prefix}_seconds_count{{{labels}}} {h.count}')
+        return '\n'.join(lines) + '\n'
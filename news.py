@@ -0,0 +1,240 @@
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+SCHEMA = '''
+create table if not exists articles (
+    id integer primary key,
+    time real,
+    title text,
+    source text,
+    url text,
+    summary text,
+    raw text
+);
+create index if not exists articles_time on articles (time);
+create table if not exists article_tickers (
+    tickerId integer,
+    article_id integer,
+    time real,
+    primary key (tickerId, article_id)
+) without rowid;
+create index if not exists article_tickers_time
+    on article_tickers (tickerId, time);
+create table if not exists cursors (
+    tickerId integer primary key,
+    last_id integer,
+    polled_at real
+);
+'''
+
+
+def _epoch(news_time):
+    '''
+    newsTime ('2021-01-14T21:31:13.000+0000') -> epoch seconds
+    '''
+    if isinstance(news_time, (int, float)):
+        return news_time / 1000.0 if news_time > 1e11 else float(news_time)
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z'):
+        try:
+            return datetime.strptime(news_time, fmt).timestamp()
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def _bound(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return pd.Timestamp(value).timestamp()
+
+
+class NewsStore():
+    '''
+    sqlite store of articles, each stored once however many tickers it
+    was seen under, with the per ticker cursor of the poller. indexed by
+    time and by (tickerId, time)
+
+        store.query(tIds=[913256135], start='2024-01-01')
+    '''
+
+    def __init__(self, path='news.db'):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('pragma journal_mode=wal')
+        self.db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def add(self, tId, articles, last_id=None):
+        '''
+        store articles seen under tId and move its cursor to last_id
+        (the highest article id by default), returns the articles that
+        were not stored yet under any ticker
+        '''
+        rows = [(int(a['id']), _epoch(a.get('newsTime')), a.get('title'),
+                 a.get('sourceName'), a.get('newsUrl'), a.get('summary'),
+                 json.dumps(a)) for a in articles]
+        if last_id is None:
+            last_id = max([r[0] for r in rows] + [self.cursor(tId)])
+        with self._lock, self.db:
+            before = self.db.total_changes
+            self.db.executemany(
+                'insert or ignore into articles values (?, ?, ?, ?, ?, ?, ?)',
+                rows)
+            added = self.db.total_changes - before
+            self.db.executemany(
+                'insert or ignore into article_tickers values (?, ?, ?)',
+                [(int(tId), r[0], r[1]) for r in rows])
+            self.db.execute(
+                'insert or replace into cursors values (?, ?, ?)',
+                (int(tId), last_id, time.time()))
+        return added
+
+    def cursor(self, tId):
+        '''
+        id of the newest article seen for tId, 0 if never polled
+        '''
+        with self._lock:
+            row = self.db.execute(
+                'select last_id from cursors where tickerId = ?',
+                (int(tId), )).fetchone()
+        return row[0] if row else 0
+
+    def query(self, tIds=None, start=None, end=None, limit=None,
+              as_frame=True):
+        '''
+        articles newest first, optionally of some tickers and between
+        start and end (epoch seconds or anything pd.Timestamp parses).
+        with tIds an article appears once per matching ticker
+        '''
+        start, end = _bound(start), _bound(end)
+        alias = 't' if tIds is not None else 'a'
+        where, args = [], []
+        if tIds is not None:
+            tIds = [int(t) for t in tIds]
+            where.append('t.tickerId in (%s)' % ','.join('?' * len(tIds)))
+            args += tIds
+        if start is not None:
+            where.append(f'{alias}.time >= ?')
+            args.append(start)
+        if end is not None:
+            where.append(f'{alias}.time < ?')
+            args.append(end)
+        if tIds is not None:
+            sql = ('select t.tickerId, a.id, a.time, a.title, a.source, '
+                   'a.url, a.summary from article_tickers t '
+                   'join articles a on a.id = t.article_id')
+            columns = ['tickerId']
+        else:
+            sql = ('select a.id, a.time, a.title, a.source, a.url, '
+                   'a.summary from articles a')
+            columns = []
+        columns += ['id', 'time', 'title', 'source', 'url', 'summary']
+        if where:
+            sql += ' where ' + ' and '.join(where)
+        sql += f' order by {alias}.time desc, a.id desc'
+        if limit is not None:
+            sql += ' limit %d' % int(limit)
+        with self._lock:
+            rows = self.db.execute(sql, args).fetchall()
+        if not as_frame:
+            return [dict(zip(columns, row)) for row in rows]
+        frame = pd.DataFrame(rows, columns=columns)
+        frame['time'] = pd.to_datetime(frame['time'], unit='s', utc=True)
+        return frame
+
+    def close(self):
+        self.db.close()
+
+
+class NewsFeed():
+    '''
+    polls the news of many tickers concurrently into a NewsStore.
+    currentNewsId pages backwards from the newest article, so each poll
+    reads a small first page and only pages further (doubling the page
+    size) while every article on the page is newer than the cursor: the
+    cost follows the number of new articles, not universe x page size
+
+        feed = NewsFeed(api)
+        feed.poll(['AAPL', 'MSFT'])        # {tickerId: new articles}
+        feed.store.query(start=time.time() - 3600)
+
+    article ids are assumed to grow with publication time
+    '''
+
+    def __init__(self,
+                 api,
+                 store=None,
+                 first_page=5,
+                 max_page=50,
+                 backfill=20,
+                 max_workers=16):
+        '''
+        params:
+            first_page: articles asked for on the first page of a poll
+            max_page: largest page size while catching up
+            backfill: articles kept from a ticker polled the first time
+        '''
+        self.api = api
+        self.store = store or NewsStore()
+        self.first_page = first_page
+        self.max_page = max_page
+        self.backfill = backfill
+        self.max_workers = max_workers
+
+    def fetch_new(self, tId, last_id=0):
+        '''
+        articles of tId newer than last_id, newest first
+        '''
+        new = []
+        current, size = 0, self.first_page if last_id else self.backfill
+        while True:
+            page = self.api.get_news(tId=tId, Id=current, items=size) or []
+            fresh = [a for a in page if int(a['id']) > last_id]
+            new += fresh
+            if (len(fresh) < len(page) or len(page) < size
+                    or not last_id and len(new) >= self.backfill):
+                return new
+            current = min(int(a['id']) for a in page)
+            size = min(size * 2, self.max_page)
+
+    def poll_one(self, tId):
+        last_id = self.store.cursor(tId)
+        new = self.fetch_new(tId, last_id)
+        if not new:
+            return 0
+        self.store.add(tId, new)
+        return len(new)
+
+    def poll(self, stocks=None, tIds=None):
+        '''
+        poll every ticker once, returns {tickerId: new articles}
+        (an article shared by tickers is stored once, counted per ticker)
+        '''
+        ids = list(tIds or [])
+        if stocks:
+            resolved = self.api.warm_tickers(stocks,
+                                             max_workers=self.max_workers)
+            ids += [resolved[s] for s in stocks if resolved[s]]
+        ids = list(dict.fromkeys(int(t) for t in ids))
+        if not ids:
+            return {}
+        with ThreadPoolExecutor(
+                max_workers=min(self.max_workers, len(ids))) as pool:
+            return dict(zip(ids, pool.map(self.poll_one, ids)))
+
+    def follow(self, stocks=None, tIds=None, interval=60.0, stop=None):
+        '''
+        poll every `interval` seconds until the threading.Event `stop`
+        is set, yields each poll result
+        '''
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            started = time.monotonic()
+            yield self.poll(stocks, tIds)
+            stop.wait(max(0.0, interval - (time.monotonic() - started)))
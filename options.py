@@ -0,0 +1,284 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from quotes import _number
+
+CALL = 0
+PUT = 1
+SIDES = {'call': CALL, 'c': CALL, CALL: CALL, 'put': PUT, 'p': PUT, PUT: PUT}
+
+# option quote fields kept as float columns
+OPTION_FIELDS = ('close', 'bid', 'bidSize', 'ask', 'askSize', 'volume',
+                 'openInterest', 'impVol', 'delta', 'gamma', 'theta', 'vega',
+                 'rho')
+BOOK_FIELDS = {
+    'bid': ('bidList', 'price'),
+    'bidSize': ('bidList', 'volume'),
+    'ask': ('askList', 'price'),
+    'askSize': ('askList', 'volume'),
+}
+
+
+def _side(cp):
+    return SIDES[cp.lower() if isinstance(cp, str) else cp]
+
+
+def option_columns(quotes, dtype='float64'):
+    '''
+    option quote json -> {field: array} for OPTION_FIELDS, one pass of
+    dict lookups per field and a vectorized string -> float conversion
+    '''
+    columns = {}
+    for field in OPTION_FIELDS:
+        if field in BOOK_FIELDS:
+            book, key = BOOK_FIELDS[field]
+            values = [(q.get(book) or [{}])[0].get(key) for q in quotes]
+        else:
+            values = [q.get(field) for q in quotes]
+        columns[field] = pd.to_numeric(
+            pd.Series(values, dtype=object),
+            errors='coerce').to_numpy(dtype=dtype, na_value=np.nan)
+    return columns
+
+
+def _contracts(expirations):
+    '''
+    (expiry, strike, side, derivative json) for every contract of an
+    expireDateList, whether strikes hold call/put pairs or one contract
+    with a direction
+    '''
+    for expiration in expirations:
+        date = (expiration.get('from') or {}).get('date') or expiration.get(
+            'date')
+        for row in expiration.get('data') or []:
+            pairs = [(s, row[s]) for s in ('call', 'put') if row.get(s)]
+            if not pairs and 'direction' in row:
+                pairs = [(row['direction'], row)]
+            for side, contract in pairs:
+                yield (contract.get('expireDate') or date,
+                       _number(contract.get('strikePrice',
+                                            row.get('strikePrice'))),
+                       _side(side), contract)
+
+
+class OptionChain():
+    '''
+    contracts of one underlying as parallel columns sorted by
+    (expiry, strike, call/put): expiry datetime64[D], strike, side
+    (CALL=0 / PUT=1), derivativeId and one float column per OPTION_FIELDS.
+    rows of one expiry are contiguous, so lookups are binary searches and
+    a quote refresh is a single vectorized scatter by derivativeId
+
+        chain.get('2024-06-21', 500, 'call', 'ask')
+        chain.for_expiry('2024-06-21').frame()
+    '''
+
+    def __init__(self, expiry, strike, side, derivativeId, columns):
+        order = np.lexsort((side, strike, expiry))
+        self.expiry = np.asarray(expiry, dtype='datetime64[D]')[order]
+        self.strike = np.asarray(strike, dtype='float64')[order]
+        self.side = np.asarray(side, dtype='int8')[order]
+        self.derivativeId = np.asarray(derivativeId, dtype='int64')[order]
+        self.columns = {f: np.asarray(c)[order] for f, c in columns.items()}
+        self._by_id = np.argsort(self.derivativeId, kind='stable')
+        self.updated = time.time()
+
+    @classmethod
+    def parse(cls, expirations, dtype='float64'):
+        '''
+        expireDateList json (get_options) -> OptionChain
+        '''
+        contracts = list(_contracts(expirations))
+        columns = option_columns([c for *_, c in contracts], dtype)
+        return cls([e for e, *_ in contracts],
+                   [s for _, s, *_ in contracts],
+                   [cp for _, _, cp, _ in contracts],
+                   [int(c.get('tickerId') or c.get('derivativeId') or 0)
+                    for *_, c in contracts],
+                   columns)
+
+    @classmethod
+    def concat(cls, chains):
+        chains = [c for c in chains if c is not None]
+        if not chains:
+            return cls.parse([])
+        return cls(
+            np.concatenate([c.expiry for c in chains]),
+            np.concatenate([c.strike for c in chains]),
+            np.concatenate([c.side for c in chains]),
+            np.concatenate([c.derivativeId for c in chains]),
+            {f: np.concatenate([c.columns[f] for c in chains])
+             for f in chains[0].columns})
+
+    def __len__(self):
+        return len(self.derivativeId)
+
+    def expirations(self):
+        return np.unique(self.expiry)
+
+    def _span(self, expiry):
+        day = np.datetime64(expiry, 'D')
+        return (np.searchsorted(self.expiry, day, 'left'),
+                np.searchsorted(self.expiry, day, 'right'))
+
+    def locate(self, expiry, strike, cp):
+        '''
+        row of one contract, KeyError if the chain does not list it
+        '''
+        lo, hi = self._span(expiry)
+        strikes = self.strike[lo:hi]
+        a = lo + np.searchsorted(strikes, strike, 'left')
+        b = lo + np.searchsorted(strikes, strike, 'right')
+        side = _side(cp)
+        for row in range(a, b):
+            if self.side[row] == side:
+                return row
+        raise KeyError((expiry, strike, cp))
+
+    def get(self, expiry, strike, cp, field='close'):
+        row = self.locate(expiry, strike, cp)
+        if field == 'derivativeId':
+            return int(self.derivativeId[row])
+        return self.columns[field][row]
+
+    def for_expiry(self, expiry):
+        '''
+        the contracts of one expiry, sharing memory with this chain
+        '''
+        lo, hi = self._span(expiry)
+        part = object.__new__(OptionChain)
+        part.expiry = self.expiry[lo:hi]
+        part.strike = self.strike[lo:hi]
+        part.side = self.side[lo:hi]
+        part.derivativeId = self.derivativeId[lo:hi]
+        part.columns = {f: c[lo:hi] for f, c in self.columns.items()}
+        part._by_id = np.argsort(part.derivativeId, kind='stable')
+        part.updated = self.updated
+        return part
+
+    def update(self, quotes):
+        '''
+        write option quote json (get_option_quotes) into the columns,
+        returns the number of contracts updated
+        '''
+        ids = np.array([int(q.get('tickerId') or q.get('derivativeId') or 0)
+                        for q in quotes], dtype='int64')
+        if not len(ids) or not len(self):
+            return 0
+        sorted_ids = self.derivativeId[self._by_id]
+        pos = np.minimum(np.searchsorted(sorted_ids, ids), len(self) - 1)
+        found = sorted_ids[pos] == ids
+        rows = self._by_id[pos[found]]
+        hits = [q for q, ok in zip(quotes, found) if ok]
+        for field, values in option_columns(hits).items():
+            self.columns[field][rows] = values
+        self.updated = time.time()
+        return len(rows)
+
+    def frame(self):
+        '''
+        DataFrame indexed by (expiry, strike, cp) with cp 'C' / 'P'
+        '''
+        index = pd.MultiIndex.from_arrays(
+            [self.expiry, self.strike, np.where(self.side == CALL, 'C', 'P')],
+            names=['expiry', 'strike', 'cp'])
+        data = {'derivativeId': self.derivativeId}
+        data.update(self.columns)
+        return pd.DataFrame(data, index=index, copy=False)
+
+
+class OptionChainCache():
+    '''
+    chains per underlying, kept as one piece per expiry so a refresh only
+    re-pulls the expiries older than max_age; the expiry list itself is
+    cached for dates_ttl seconds. listing the expiries returns every
+    contract as well, so a cold chain is one request, and so is a refresh
+    with more than one stale expiry
+    '''
+
+    def __init__(self, api, ttl=60.0, dates_ttl=3600.0, max_workers=8):
+        self.api = api
+        self.ttl = ttl
+        self.dates_ttl = dates_ttl
+        self.max_workers = max_workers
+        self._dates = {}  # tId -> (fetched_at, [date])
+        self._pieces = {}  # (tId, date) -> (fetched_at, OptionChain)
+        self._lock = threading.Lock()
+
+    def expirations(self, tId, max_age=None):
+        max_age = self.dates_ttl if max_age is None else max_age
+        with self._lock:
+            cached = self._dates.get(tId)
+        if cached is not None and time.monotonic() - cached[0] <= max_age:
+            return cached[1]
+        return self._list(tId)
+
+    def _list(self, tId):
+        '''
+        one listing request for the expiry dates; it returns the contracts
+        of every expiry too (count=-1), which become fresh pieces
+        '''
+        listing = self.api.get_options(tId=tId)
+        dates = [e['from']['date'] for e in listing]
+        full = {e['from']['date'] for e in listing if e.get('data')}
+        chain = OptionChain.parse([e for e in listing if e.get('data')])
+        now = time.monotonic()
+        with self._lock:
+            self._dates[tId] = (now, dates)
+            # expired contracts drop out with their date
+            for key in [k for k in self._pieces
+                        if k[0] == tId and k[1] not in dates]:
+                del self._pieces[key]
+            for date in full:
+                self._pieces[(tId, date)] = (now, chain.for_expiry(date))
+        return dates
+    def _fetch(self, tId, date):
+        piece = OptionChain.parse(
+            self.api.get_options(tId=tId, expireDate=date))
+        with self._lock:
+            self._pieces[(tId, date)] = (time.monotonic(), piece)
+        return piece
+
+    def chain(self, tId, expiries=None, max_age=None):
+        '''
+        OptionChain over `expiries` (all listed dates by default),
+        fetching only the pieces older than max_age
+        '''
+        max_age = self.ttl if max_age is None else max_age
+        dates = list(expiries or self.expirations(tId))
+        pieces = self._fresh(tId, dates, max_age)
+        if expiries is None and len(pieces) < len(dates) - 1:
+            # re-listing costs one request however many pieces are stale
+            dates = self._list(tId)
+            pieces = self._fresh(tId, dates, max_age)
+        stale = [d for d in dates if d not in pieces]
+        if stale:
+            with ThreadPoolExecutor(
+                    max_workers=min(self.max_workers, len(stale))) as pool:
+                pieces.update(zip(stale, pool.map(
+                    lambda d: self._fetch(tId, d), stale)))
+        return OptionChain.concat([pieces[d] for d in dates])
+
+    def _fresh(self, tId, dates, max_age):
+        now = time.monotonic()
+        pieces = {}
+        with self._lock:
+            for date in dates:
+                cached = self._pieces.get((tId, date))
+                if cached is not None and now - cached[0] <= max_age:
+                    pieces[date] = cached[1]
+        return pieces
+
+    def invalidate(self, tId=None):
+        with self._lock:
+            if tId is None:
+                self._dates.clear()
+                self._pieces.clear()
+            else:
+                self._dates.pop(tId, None)
+                for key in [k for k in self._pieces if k[0] == tId]:
+                    del self._pieces[key]
@@ -0,0 +1,358 @@
+import json
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from news import _bound, _epoch
+
+SCHEMA = '''
+create table if not exists orders (
+    orderId text primary key,
+    tickerId integer,
+    symbol text,
+    action text,
+    order_type text,
+    status text,
+    quantity real,
+    filled_quantity real,
+    limit_price real,
+    avg_price real,
+    created real,
+    updated real,
+    filled real,
+    raw text
+);
+create index if not exists orders_ticker on orders (tickerId, created);
+create index if not exists orders_status on orders (status, created);
+create index if not exists orders_created on orders (created);
+create index if not exists orders_filled
+    on orders (coalesce(filled, updated));
+create table if not exists dividends (
+    id text primary key,
+    tickerId integer,
+    symbol text,
+    amount real,
+    position real,
+    ex_date text,
+    pay_date text,
+    status text,
+    raw text
+);
+create index if not exists dividends_ticker on dividends (tickerId, pay_date);
+create index if not exists dividends_pay_date on dividends (pay_date);
+create table if not exists cursors (
+    name text primary key,
+    value real,
+    synced_at real
+);
+'''
+
+# statuses of orders that can still change; anything else (Filled,
+# Cancelled, Failed, Expired, Rejected...) is final
+OPEN = ('Working', 'Pending', 'Partially Filled', 'PartialFilled')
+
+ORDER_COLUMNS = ['orderId', 'tickerId', 'symbol', 'action', 'order_type',
+                 'status', 'quantity', 'filled_quantity', 'limit_price',
+                 'avg_price', 'created', 'updated', 'filled']
+DIVIDEND_COLUMNS = ['id', 'tickerId', 'symbol', 'amount', 'position',
+                    'ex_date', 'pay_date', 'status']
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _stamp(order, *fields):
+    for field in fields:
+        value = order.get(field)
+        if value not in (None, ''):
+            return _epoch(value)
+    return None
+
+
+def _updated(order):
+    return _stamp(order, 'updateTime0', 'updateTime', 'filledTime0',
+                  'filledTime', 'createTime0', 'createTime', 'placedTime')
+
+
+def flatten_orders(result):
+    '''
+    Urls.orders json (order groups with an 'orders' list, or plain
+    orders) -> order dicts
+    '''
+    if isinstance(result, dict):
+        result = result.get('data') or result.get('orders') or []
+    for item in result or []:
+        if isinstance(item.get('orders'), list):
+            yield from item['orders']
+        else:
+            yield item
+
+
+def order_row(order):
+    ticker = order.get('ticker') or {}
+    return (str(order['orderId']),
+            int(ticker.get('tickerId') or order.get('tickerId') or 0),
+            ticker.get('symbol') or order.get('symbol', ''),
+            order.get('action', ''),
+            order.get('orderType', ''),
+            order.get('statusStr') or order.get('status', ''),
+            _float(order.get('totalQuantity')),
+            _float(order.get('filledQuantity')),
+            _float(order.get('lmtPrice')),
+            _float(order.get('avgFilledPrice')),
+            _stamp(order, 'createTime0', 'createTime', 'placedTime'),
+            _updated(order),
+            _stamp(order, 'filledTime0', 'filledTime'),
+            json.dumps(order))
+
+
+def dividend_row(dividend):
+    ticker = dividend.get('ticker') or {}
+    tId = int(ticker.get('tickerId') or dividend.get('tickerId') or 0)
+    pay_date = dividend.get('payDate') or ''
+    # no id in the response: one dividend per ticker and pay date
+    key = dividend.get('id') or f'{tId}:{pay_date}'
+    return (str(key), tId,
+            ticker.get('symbol') or dividend.get('symbol', ''),
+            _float(dividend.get('dividendAmount') or dividend.get('amount')),
+            _float(dividend.get('position') or dividend.get('holding')),
+            dividend.get('exDate') or '', pay_date,
+            dividend.get('status', ''), json.dumps(dividend))
+
+
+class OrderStore():
+    '''
+    sqlite store of the order history and dividends of one account,
+    indexed by orderId, (tickerId, time), (status, time) and fill time so
+    reconciliation and fill reports are local queries
+
+        store.orders(status='Filled', start='2024-01-01')
+        store.fills(tIds=[913256135])
+    '''
+
+    def __init__(self, path='orders.db'):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('pragma journal_mode=wal')
+        self.db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def add_orders(self, orders):
+        '''
+        insert new orders and update the ones whose status, fill or update
+        time moved, returns the number of orders inserted or changed
+        '''
+        rows = [order_row(o) for o in orders]
+        with self._lock, self.db:
+            before = self.db.total_changes
+            self.db.executemany(
+                'insert into orders values '
+                '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'on conflict (orderId) do update set '
+                'status = excluded.status, '
+                'filled_quantity = excluded.filled_quantity, '
+                'avg_price = excluded.avg_price, '
+                'updated = excluded.updated, '
+                'filled = excluded.filled, '
+                'raw = excluded.raw '
+                'where excluded.status is not orders.status '
+                'or excluded.filled_quantity is not orders.filled_quantity '
+                'or excluded.updated > orders.updated', rows)
+            return self.db.total_changes - before
+
+    def add_dividends(self, dividends):
+        '''
+        insert or refresh dividends, returns the number inserted or changed
+        '''
+        rows = [dividend_row(d) for d in dividends]
+        with self._lock, self.db:
+            before = self.db.total_changes
+            self.db.executemany(
+                'insert into dividends values (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'on conflict (id) do update set '
+                'amount = excluded.amount, position = excluded.position, '
+                'status = excluded.status, raw = excluded.raw '
+                'where excluded.raw is not dividends.raw', rows)
+            return self.db.total_changes - before
+
+    def cursor(self, name):
+        with self._lock:
+            row = self.db.execute('select value from cursors where name = ?',
+                                  (name, )).fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, name, value):
+        with self._lock, self.db:
+            self.db.execute('insert or replace into cursors values (?, ?, ?)',
+                            (name, value, time.time()))
+
+    def oldest_open(self):
+        '''
+        creation time of the oldest order in an OPEN status, None when
+        every stored order is done
+        '''
+        with self._lock:
+            row = self.db.execute(
+                'select min(created) from orders where status in '
+                '(%s)' % ','.join('?' * len(OPEN)), OPEN).fetchone()
+        return row[0]
+
+    def _select(self, table, columns, where, args, order, limit, as_frame,
+                times=()):
+        sql = f'select {", ".join(columns)} from {table}'
+        if where:
+            sql += ' where ' + ' and '.join(where)
+        sql += f' order by {order}'
+        if limit is not None:
+            sql += ' limit %d' % int(limit)
+        with self._lock:
+            rows = self.db.execute(sql, args).fetchall()
+        if not as_frame:
+            return [dict(zip(columns, row)) for row in rows]
+        frame = pd.DataFrame(rows, columns=columns)
+        for column in times:
+            frame[column] = pd.to_datetime(frame[column], unit='s', utc=True)
+        return frame
+
+    def orders(self, status=None, tIds=None, start=None, end=None,
+               limit=None, as_frame=True):
+        '''
+        orders newest first, optionally of some statuses ('Filled' or a
+        list) and tickers, created between start and end (epoch seconds or
+        anything pd.Timestamp parses)
+        '''
+        where, args = [], []
+        if status is not None:
+            status = [status] if isinstance(status, str) else list(status)
+            where.append('status in (%s)' % ','.join('?' * len(status)))
+            args += status
+        if tIds is not None:
+            tIds = [int(t) for t in tIds]
+            where.append('tickerId in (%s)' % ','.join('?' * len(tIds)))
+            args += tIds
+        for op, bound in (('>=', _bound(start)), ('<', _bound(end))):
+            if bound is not None:
+                where.append(f'created {op} ?')
+                args.append(bound)
+        return self._select('orders', ORDER_COLUMNS, where, args,
+                            'created desc, orderId desc', limit, as_frame,
+                            ('created', 'updated', 'filled'))
+
+    def order(self, orderId):
+        '''
+        raw json of one stored order, None if unknown
+        '''
+        with self._lock:
+            row = self.db.execute('select raw from orders where orderId = ?',
+                                  (str(orderId), )).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def fills(self, tIds=None, start=None, end=None, as_frame=True):
+        '''
+        orders with a filled quantity, newest fill first, filled between
+        start and end
+        '''
+        where, args = ['filled_quantity > 0'], []
+        if tIds is not None:
+            tIds = [int(t) for t in tIds]
+            where.append('tickerId in (%s)' % ','.join('?' * len(tIds)))
+            args += tIds
+        for op, bound in (('>=', _bound(start)), ('<', _bound(end))):
+            if bound is not None:
+                where.append(f'coalesce(filled, updated) {op} ?')
+                args.append(bound)
+        return self._select('orders', ORDER_COLUMNS, where, args,
+                            'coalesce(filled, updated) desc', None, as_frame,
+                            ('created', 'updated', 'filled'))
+
+    def dividends(self, tIds=None, start=None, end=None, as_frame=True):
+        '''
+        dividends newest pay date first, pay dates as 'YYYY-MM-DD' bounds
+        '''
+        where, args = [], []
+        if tIds is not None:
+            tIds = [int(t) for t in tIds]
+            where.append('tickerId in (%s)' % ','.join('?' * len(tIds)))
+            args += tIds
+        for op, bound in (('>=', start), ('<', end)):
+            if bound is not None:
+                where.append(f'pay_date {op} ?')
+                args.append(str(bound))
+        return self._select('dividends', DIVIDEND_COLUMNS, where, args,
+                            'pay_date desc, id', None, as_frame)
+
+    def close(self):
+        self.db.close()
+
+
+class OrderSync():
+    '''
+    keeps an OrderStore in step with the account. the first sync pulls the
+    whole history; later ones ask Urls.orders only from the day before the
+    last update seen, or from the oldest order still working if that is
+    older, so fills and cancels of old working orders are not missed
+
+        sync = OrderSync(api)
+        sync.sync()                         # {'orders': n, 'dividends': n}
+        sync.store.fills(start=time.time() - 86400)
+    '''
+
+    def __init__(self, api, store=None, overlap=86400.0):
+        '''
+        params:
+            store: OrderStore, orders.db by default
+            overlap: seconds re-read before the cursor, startTime is a
+                date in the server's time zone
+        '''
+        self.api = api
+        self.store = store or OrderStore()
+        self.overlap = overlap
+
+    def start_time(self):
+        '''
+        startTime for the next request, None for the whole history
+        '''
+        cursor = self.store.cursor('orders')
+        if cursor is None:
+            return None
+        since = cursor - self.overlap
+        oldest = self.store.oldest_open()
+        if oldest is not None:
+            since = min(since, oldest - self.overlap)
+        return time.strftime('%Y-%m-%d', time.gmtime(max(since, 0)))
+
+    def sync_orders(self):
+        '''
+        fetch orders placed or changed since the cursor, returns how many
+        were new or changed
+        '''
+        orders = list(flatten_orders(self.api.get_history_orders(
+            status='All', start_time=self.start_time())))
+        changed = self.store.add_orders(orders)
+        stamps = [s for s in map(_updated, orders) if s is not None]
+        # an empty history still counts as synced
+        self.store.set_cursor(
+            'orders', max(stamps + [self.store.cursor('orders') or 0]))
+        return changed
+
+    def sync_dividends(self):
+        '''
+        Urls.dividends has no start filter: the list is re-read, only new
+        or changed dividends are written
+        '''
+        result = self.api.get_dividends() or {}
+        if isinstance(result, dict):
+            result = result.get('dividendList') or result.get('data') or []
+        changed = self.store.add_dividends(result)
+        self.store.set_cursor('dividends', time.time())
+        return changed
+
+    def sync(self):
+        return {'orders': self.sync_orders(),
+                'dividends': self.sync_dividends()}
@@ -0,0 +1,494 @@
+import heapq
+import itertools
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from account import AccountSnapshot
+
+WORKING = 'Working'
+FILLED = 'Filled'
+CANCELLED = 'Cancelled'
+
+# DAY orders expire with the exchange's trading date
+EXCHANGE_TZ = ZoneInfo('America/New_York')
+
+
+def _s(value):
+    # the paper center sends numbers as strings
+    return '%.4f' % value if isinstance(value, float) else str(value)
+
+
+class _Order():
+    __slots__ = ('orderId', 'serialId', 'tickerId', 'action', 'orderType',
+                 'enforce', 'price', 'quantity', 'filled', 'avg_price',
+                 'status', 'created', 'filled_at', 'version')
+
+    def __init__(self, orderId, serialId, tickerId, action, orderType,
+                 enforce, price, quantity, created):
+        self.orderId = orderId
+        self.serialId = serialId
+        self.tickerId = tickerId
+        self.action = action
+        self.orderType = orderType
+        self.enforce = enforce
+        self.price = price
+        self.quantity = quantity
+        self.filled = 0
+        self.avg_price = 0.0
+        self.status = WORKING
+        self.created = created
+        self.filled_at = None
+        self.version = 0
+
+
+class _Book():
+    '''
+    open orders of one ticker: limit buys in a max heap and limit sells in
+    a min heap by price then arrival, market orders waiting for a price.
+    cancels and modifies are lazy: a heap entry whose version no longer
+    matches its order is skipped when it reaches the top
+    '''
+    __slots__ = ('buys', 'sells', 'market', 'last', 'bid', 'ask')
+
+    def __init__(self):
+        self.buys = []
+        self.sells = []
+        self.market = []
+        self.last = None
+        self.bid = None
+        self.ask = None
+
+
+class _Position():
+    __slots__ = ('quantity', 'cost', 'realized', 'last')
+
+    def __init__(self):
+        self.quantity = 0
+        self.cost = 0.0
+        self.realized = 0.0
+        self.last = None
+
+
+class PaperEngine():
+    '''
+    in memory stand-in for webull_paper.PaperApi: same order, position
+    and account methods with the same json shapes, filled locally
+    against replayed bars or quotes instead of Webull's paper center
+
+        engine = PaperEngine(cash=100000)
+        engine.place_order(tId=1, price=99.5, quant=10)
+        engine.on_bar(1, open=100, high=101, low=99, close=100.5)
+        engine.get_positions()
+        engine.replay(tId=1, bars=df)     # get_bars frame, every row
+
+    fills: a buy limit fills when the price trades at or below it, at the
+    limit or at the open if the bar opened through it (sells mirrored);
+    against quotes at the ask / bid. MKT orders fill at the current
+    ask / bid / last price, or at the next open when nothing traded yet.
+    DAY orders are cancelled when the replay reaches a new day, IOC
+    orders when they cannot fill at once
+    '''
+
+    def __init__(self, cash=1000000.0, symbols=None, commission=0.0):
+        '''
+        params:
+            cash: starting buying power
+            symbols: {symbol: tickerId} for get_ticker; unknown symbols
+                get a stable id from their name
+            commission: per share, charged on every fill
+        '''
+        self.initial_cash = cash
+        self.cash = cash
+        self.commission = commission
+        self.symbols = dict(symbols or {})
+        self.names = {v: k for k, v in self.symbols.items()}
+        self.paper_account_id = 'local'
+        self.orders = {}
+        self.serials = {}
+        self.books = {}
+        self.positions = {}
+        self.fills = []
+        self.day = None
+        self.now = None
+        self._ids = itertools.count(1)
+        self._seq = itertools.count()
+        self._lock = threading.RLock()
+
+    # tickers
+
+    def get_ticker(self, stock=''):
+        tId = self.symbols.get(stock)
+        if tId is None:
+            tId = self.symbols[stock] = zlib.crc32(stock.encode()) | 1 << 32
+            self.names[tId] = stock
+        return tId
+
+    def warm_tickers(self, stocks, max_workers=None):
+        return {s: self.get_ticker(s) for s in stocks}
+
+    def _book(self, tId):
+        book = self.books.get(tId)
+        if book is None:
+            book = self.books[tId] = _Book()
+        return book
+
+    # orders
+
+    def place_order(self,
+                    stock=None,
+                    tId=None,
+                    price=0,
+                    action='BUY',
+                    orderType='LMT',
+                    enforce='GTC',
+                    quant=0,
+                    serialId=None):
+        '''
+        returns {'orderId': ...} like the paper center; resending a
+        serialId returns the order it already placed
+        '''
+        if int(quant) <= 0:
+            raise ValueError('quant must be a positive number of shares')
+        if tId is None:
+            if stock is None:
+                raise ValueError('Must provide a stock symbol or a stock id')
+            tId = self.get_ticker(stock)
+        with self._lock:
+            if serialId is not None and serialId in self.serials:
+                return {'orderId': self.serials[serialId]}
+            orderId = next(self._ids)
+            order = _Order(orderId, serialId or str(uuid.uuid4()), tId,
+                           action, orderType, enforce, float(price),
+                           int(quant), self.now or time.time())
+            self.orders[orderId] = order
+            self.serials[order.serialId] = orderId
+            self._rest(order)
+            return {'orderId': orderId}
+
+    def _rest(self, order):
+        book = self._book(order.tickerId)
+        if order.orderType == 'MKT':
+            price = self._market_price(book, order.action)
+            if price is not None:
+                self._fill(order, price)
+            elif order.enforce == 'IOC':
+                order.status = CANCELLED
+            else:
+                book.market.append((order.orderId, order.version))
+            return
+        # a limit order that crosses the current quote fills at once
+        if order.action == 'BUY':
+            cross = book.ask if book.ask is not None else book.last
+            if cross is not None and cross <= order.price:
+                return self._fill(order, cross)
+        else:
+            cross = book.bid if book.bid is not None else book.last
+            if cross is not None and cross >= order.price:
+                return self._fill(order, cross)
+        if order.enforce == 'IOC':
+            order.status = CANCELLED
+        elif order.action == 'BUY':
+            heapq.heappush(book.buys, (-order.price, next(self._seq),
+                                       order.orderId, order.version))
+        else:
+            heapq.heappush(book.sells, (order.price, next(self._seq),
+                                        order.orderId, order.version))
+
+    @staticmethod
+    def _market_price(book, action):
+        if action == 'BUY':
+            return book.ask if book.ask is not None else book.last
+        return book.bid if book.bid is not None else book.last
+
+    def modify_order(self,
+                     order,
+                     price=0,
+                     action='BUY',
+                     orderType='LMT',
+                     enforce='GTC',
+                     quant=0):
+        '''
+        order: an entry of get_current_orders(); keeps its orderId
+        quant: new quantity, 0 keeps the current one
+        '''
+        if int(quant) < 0:
+            raise ValueError('quant must be a positive number of shares')
+        with self._lock:
+            o = self.orders.get(int(order['orderId']))
+            if o is None or o.status != WORKING:
+                return False
+            o.version += 1
+            o.price = float(price)
+            o.action = action
+            o.orderType = orderType
+            o.enforce = enforce
+            if quant and int(quant) != o.quantity:
+                o.quantity = int(quant)
+            self._rest(o)
+            return True
+
+    def cancel_order(self, order_id):
+        with self._lock:
+            o = self.orders.get(int(order_id))
+            if o is None or o.status != WORKING:
+                return False
+            o.status = CANCELLED
+            o.version += 1
+            return True
+
+    def cancel_all(self):
+        with self._lock:
+            for o in self.orders.values():
+                if o.status == WORKING:
+                    o.status = CANCELLED
+                    o.version += 1
+
+    def _live(self, orderId, version):
+        o = self.orders[orderId]
+        return o if o.status == WORKING and o.version == version else None
+
+    def _fill(self, o, price):
+        quantity = o.quantity - o.filled
+        signed = quantity if o.action == 'BUY' else -quantity
+        position = self.positions.get(o.tickerId)
+        if position is None:
+            position = self.positions[o.tickerId] = _Position()
+        held = position.quantity
+        if held == 0 or (held > 0) == (signed > 0):
+            position.cost = (position.cost * abs(held) + price *
+                             quantity) / (abs(held) + quantity)
+        else:
+            closed = min(abs(held), quantity)
+            position.realized += closed * (price - position.cost) * (
+                1 if held > 0 else -1)
+            if abs(signed) > abs(held):
+                position.cost = price  # flipped through zero
+        position.quantity = held + signed
+        if position.quantity == 0:
+            position.cost = 0.0
+        position.last = price
+        fee = self.commission * quantity
+        self.cash -= signed * price + fee
+        position.realized -= fee
+        o.avg_price = price
+        o.filled = o.quantity
+        o.status = FILLED
+        o.filled_at = self.now or time.time()
+        self.fills.append({
+            'orderId': o.orderId,
+            'serialId': o.serialId,
+            'tickerId': o.tickerId,
+            'action': o.action,
+            'filledPrice': price,
+            'filledQuantity': quantity,
+            'filledTime0': int(o.filled_at * 1000),
+        })
+
+    # market data
+
+    def new_day(self, day=None):
+        '''
+        cancel every working DAY order, the replay calls this when the
+        bar timestamps reach a new date
+        '''
+        with self._lock:
+            for o in self.orders.values():
+                if o.status == WORKING and o.enforce == 'DAY':
+                    o.status = CANCELLED
+                    o.version += 1
+            self.day = day
+
+    def _clock(self, timestamp):
+        if timestamp is None:
+            return
+        self.now = float(timestamp)
+        day = datetime.fromtimestamp(self.now, EXCHANGE_TZ).toordinal()
+        if self.day is not None and day != self.day:
+            self.new_day(day)
+        else:
+            self.day = day
+
+    def on_bar(self, tId, open, high, low, close, timestamp=None):
+        '''
+        match the book of tId against one bar, returns the fills it made
+        '''
+        with self._lock:
+            self._clock(timestamp)
+            book = self._book(tId)
+            before = len(self.fills)
+            for orderId, version in book.market:
+                o = self._live(orderId, version)
+                if o is not None:
+                    self._fill(o, open)
+            book.market = []
+            buys, sells = book.buys, book.sells
+            while buys and -buys[0][0] >= low:
+                price, _, orderId, version = heapq.heappop(buys)
+                o = self._live(orderId, version)
+                if o is not None:
+                    self._fill(o, min(-price, open))
+            while sells and sells[0][0] <= high:
+                price, _, orderId, version = heapq.heappop(sells)
+                o = self._live(orderId, version)
+                if o is not None:
+                    self._fill(o, max(price, open))
+            book.last = close
+            book.bid = book.ask = None
+            position = self.positions.get(tId)
+            if position is not None:
+                position.last = close
+            return self.fills[before:]
+
+    def on_quote(self, tId, bid=None, ask=None, last=None, timestamp=None):
+        '''
+        match the book of tId against a quote, returns the fills it made
+        '''
+        with self._lock:
+            self._clock(timestamp)
+            book = self._book(tId)
+            book.bid, book.ask = bid, ask
+            if last is not None:
+                book.last = last
+            before = len(self.fills)
+            for orderId, version in book.market:
+                o = self._live(orderId, version)
+                if o is not None:
+                    price = self._market_price(book, o.action)
+                    if price is not None:
+                        self._fill(o, price)
+            book.market = [(i, v) for i, v in book.market
+                           if self._live(i, v) is not None]
+            buys, sells = book.buys, book.sells
+            if ask is not None:
+                while buys and -buys[0][0] >= ask:
+                    _, _, orderId, version = heapq.heappop(buys)
+                    o = self._live(orderId, version)
+                    if o is not None:
+                        self._fill(o, ask)
+            if bid is not None:
+                while sells and sells[0][0] <= bid:
+                    _, _, orderId, version = heapq.heappop(sells)
+                    o = self._live(orderId, version)
+                    if o is not None:
+                        self._fill(o, bid)
+            mark = last if last is not None else (
+                (bid + ask) / 2 if bid is not None and ask is not None
+                else None)
+            position = self.positions.get(tId)
+            if position is not None and mark is not None:
+                position.last = mark
+            return self.fills[before:]
+
+    def replay(self, tId, bars, on_bar=None):
+        '''
+        feed every row of a get_bars frame (or {column: array} with a
+        'timestamp' in epoch seconds) through on_bar; on_bar(engine, i)
+        runs after each bar so a strategy can place its next orders
+        '''
+        if hasattr(bars, 'index') and 'timestamp' not in bars:
+            stamps = bars.index.values.astype('datetime64[s]').astype('int64')
+        else:
+            stamps = np.asarray(bars['timestamp'])
+        opens, highs = np.asarray(bars['open']), np.asarray(bars['high'])
+        lows, closes = np.asarray(bars['low']), np.asarray(bars['close'])
+        fills = 0
+        for i in range(len(opens)):
+            fills += len(self.on_bar(tId, opens[i], highs[i], lows[i],
+                                     closes[i], stamps[i]))
+            if on_bar is not None:
+                on_bar(self, i)
+        return fills
+
+    # paper center json
+
+    def _ticker(self, tId):
+        return {'tickerId': tId, 'symbol': self.names.get(tId, str(tId))}
+
+    def _order_json(self, o):
+        return {
+            'orderId': o.orderId,
+            'serialId': o.serialId,
+            'ticker': self._ticker(o.tickerId),
+            'action': o.action,
+            'orderType': o.orderType,
+            'timeInForce': o.enforce,
+            'lmtPrice': _s(o.price),
+            'totalQuantity': _s(o.quantity),
+            'filledQuantity': _s(o.filled),
+            'avgFilledPrice': _s(o.avg_price),
+            'status': o.status,
+            'statusStr': o.status,
+            'createTime0': int(o.created * 1000),
+        }
+
+    def get_current_orders(self):
+        with self._lock:
+            return [self._order_json(o) for o in self.orders.values()
+                    if o.status == WORKING]
+
+    def get_history_orders(self, status='Cancelled'):
+        '''
+        status = Cancelled / Filled / Working / All
+        '''
+        with self._lock:
+            return [self._order_json(o) for o in self.orders.values()
+                    if status == 'All' or o.status == status]
+
+    def get_positions(self):
+        with self._lock:
+            rows = []
+            for tId, p in self.positions.items():
+                if not p.quantity:
+                    continue
+                last = p.last if p.last is not None else p.cost
+                value = p.quantity * last
+                pnl = p.quantity * (last - p.cost)
+                rows.append({
+                    'ticker': self._ticker(tId),
+                    'position': _s(p.quantity),
+                    'costPrice': _s(p.cost),
+                    'lastPrice': _s(last),
+                    'marketValue': _s(value),
+                    'unrealizedProfitLoss': _s(pnl),
+                    'unrealizedProfitLossRate': _s(
+                        pnl / abs(p.quantity * p.cost) if p.cost else 0.0),
+                })
+            return rows
+
+    def get_account(self):
+        with self._lock:
+            positions = self.get_positions()
+            value = sum(float(p['marketValue']) for p in positions)
+            unrealized = sum(float(p['unrealizedProfitLoss'])
+                             for p in positions)
+            realized = sum(p.realized for p in self.positions.values())
+            net = self.cash + value
+            return {
+                'id': self.paper_account_id,
+                'currency': 'USD',
+                'netLiquidation': _s(net),
+                'totalMarketValue': _s(value),
+                'usableCash': _s(self.cash),
+                'unrealizedProfitLoss': _s(unrealized),
+                'realizedProfitLoss': _s(realized),
+                'totalProfitLoss': _s(net - self.initial_cash),
+                'totalProfitLossRate': _s(
+                    (net - self.initial_cash) / self.initial_cash),
+                'positions': positions,
+                'openOrders': self.get_current_orders(),
+            }
+
+    def get_account_id(self):
+        return True
+
+    def get_account_snapshot(self, max_age=None):
+        return AccountSnapshot.parse(self.get_account())
+
+    def get_portfolio(self):
+        return self.get_account_snapshot().portfolio
@@ -0,0 +1,173 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# tickerRealTimes field -> column dtype of the snapshot frame
+QUOTE_FIELDS = {
+    'symbol': object,
+    'open': 'float64',
+    'high': 'float64',
+    'low': 'float64',
+    'close': 'float64',
+    'preClose': 'float64',
+    'change': 'float64',
+    'changeRatio': 'float64',
+    'volume': 'float64',
+    'bid': 'float64',
+    'bidSize': 'float64',
+    'ask': 'float64',
+    'askSize': 'float64',
+    'tradeTime': object,
+}
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _best(book, field):
+    return _number(book[0].get(field)) if book else np.nan
+
+
+def _trade_times(values):
+    '''
+    tradeTime strings -> naive UTC datetime64[ms], NaT for bad values
+    '''
+    stamps = pd.to_datetime(pd.Series(values, dtype=object), utc=True,
+                            errors='coerce')
+    return stamps.dt.tz_localize(None).values.astype('datetime64[ms]')
+
+
+def quote_row(quote):
+    '''
+    flatten one tickerRealTimes json into QUOTE_FIELDS order
+    '''
+    bids = quote.get('bidList') or []
+    asks = quote.get('askList') or []
+    row = []
+    for field, dtype in QUOTE_FIELDS.items():
+        if field == 'bid':
+            row.append(_best(bids, 'price'))
+        elif field == 'bidSize':
+            row.append(_best(bids, 'volume'))
+        elif field == 'ask':
+            row.append(_best(asks, 'price'))
+        elif field == 'askSize':
+            row.append(_best(asks, 'volume'))
+        elif dtype is object:
+            row.append(quote.get(field))
+        else:
+            row.append(_number(quote.get(field)))
+    return row
+
+
+def quotes_frame(quotes, as_numpy=False):
+    '''
+    {tickerId: tickerRealTimes json} -> DataFrame indexed by tickerId,
+    or a numpy structured array with a tickerId field when as_numpy
+    (tradeTime as UTC datetime64[ms], strings as wide as the longest one)
+    '''
+    ids = list(quotes)
+    rows = [quote_row(quotes[tId]) for tId in ids]
+    if as_numpy:
+        columns = list(zip(*rows)) or [()] * len(QUOTE_FIELDS)
+        dtype = [('tickerId', 'int64')]
+        values = [ids]
+        for (field, kind), column in zip(QUOTE_FIELDS.items(), columns):
+            if field == 'tradeTime':
+                # UTC instants, NaT when missing or unparseable
+                kind = 'datetime64[ms]'
+                column = _trade_times(column)
+            elif kind is object:
+                column = ['' if v is None else str(v) for v in column]
+                kind = 'U%d' % max([1] + [len(v) for v in column])
+            dtype.append((field, kind))
+            values.append(column)
+        array = np.empty(len(ids), dtype=dtype)
+        for (field, _), column in zip(dtype, values):
+            array[field] = column
+        return array
+    df = pd.DataFrame(rows, columns=list(QUOTE_FIELDS),
+                      index=pd.Index(ids, name='tickerId', dtype='int64'))
+    df = df.astype(QUOTE_FIELDS)
+    df['tradeTime'] = pd.to_datetime(df['tradeTime'], utc=True,
+                                     errors='coerce')
+    return df
+
+
+class QuoteSnapshotCache():
+    '''
+    short lived quote snapshots shared by every caller in the process
+    that talks to the same hosts. a quote younger than max_age is served
+    from memory and concurrent requests for the same tickerId share one
+    in-flight fetch
+    '''
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        self._quotes = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, root=None):
+        '''
+        process wide instance used by WeBullApi, one per Urls root
+        '''
+        with cls._shared_lock:
+            if root not in cls._shared:
+                cls._shared[root] = cls()
+            return cls._shared[root]
+
+    def get_many(self, tIds, fetch, max_age=0.3, max_workers=16):
+        '''
+        {tickerId: quote json}; fetch(tickerId) is called on a thread pool
+        for ids that are neither fresh nor already being fetched
+        '''
+        now = time.monotonic()
+        result = {}
+        waiting = {}
+        todo = []
+        with self._lock:
+            for tId in tIds:
+                cached = self._quotes.get(tId)
+                if cached is not None and now - cached[0] <= max_age:
+                    result[tId] = cached[1]
+                elif tId in self._inflight:
+                    waiting[tId] = self._inflight[tId]
+                else:
+                    future = Future()
+                    self._inflight[tId] = future
+                    waiting[tId] = future
+                    todo.append(tId)
+        if todo:
+            with ThreadPoolExecutor(
+                    max_workers=min(max_workers, len(todo))) as pool:
+                for tId, future in zip(todo, [pool.submit(fetch, t)
+                                              for t in todo]):
+                    self._settle(tId, future)
+        for tId, future in waiting.items():
+            result[tId] = future.result()
+        return {tId: result[tId] for tId in tIds}
+
+    def _settle(self, tId, done):
+        error = done.exception()
+        with self._lock:
+            flight = self._inflight.pop(tId)
+            if error is None:
+                self._quotes[tId] = (time.monotonic(), done.result())
+        if error is None:
+            flight.set_result(done.result())
+        else:
+            flight.set_exception(error)
+
+    def clear(self):
+        with self._lock:
+            self._quotes.clear()
@@ -0,0 +1,225 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from endpoints import Urls
+
+# priorities: orders are never queued behind other calls to their host
+TRADE = 0
+DATA = 1
+
+# endpoints (Urls method names) that place, change or cancel orders
+TRADE_ENDPOINTS = ('place_orders', 'cancel_order', 'place_option_orders',
+                   'replace_option_orders', 'place_otoco_orders',
+                   'cancel_otoco_orders', 'paper_place_order',
+                   'paper_modify_order', 'paper_cancel_order')
+
+
+def retry_after(value):
+    '''
+    seconds from a Retry-After header (delta seconds or http date), or None
+    '''
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt, base=0.2, cap=10.0):
+    '''
+    full jitter: uniform in [0, min(cap, base * 2**attempt)]
+    '''
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class HostLimiter():
+    '''
+    token bucket for one Webull base url with an AIMD rate: every
+    successful call adds `increase / rate` requests per second, a throttled
+    call multiplies the rate by `decrease` (at most once per `cooldown`)
+    and honours Retry-After by pausing the whole bucket
+
+    scheduling is by reservation (GCRA), so callers sleep outside the lock
+    and the same bucket serves threads and asyncio tasks. trade calls keep
+    their own queue position and only wait for other trade calls
+    '''
+
+    def __init__(self,
+                 rate=1000.0,
+                 burst=50,
+                 min_rate=1.0,
+                 max_rate=1000.0,
+                 increase=1.0,
+                 decrease=0.5,
+                 cooldown=1.0):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.throttled_count = 0
+        self._tat = 0.0  # theoretical arrival time of the next call
+        self._tat_trade = 0.0  # same, counting trade calls only
+        self._paused = 0.0
+        self._next_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, priority=DATA):
+        '''
+        claim the next slot, returns the seconds to wait before sending
+        '''
+        with self._lock:
+            now = time.monotonic()
+            interval = 1.0 / self.rate
+            tat = self._tat_trade if priority == TRADE else self._tat
+            start = max(now, self._paused, tat - self.burst * interval)
+            self._tat = max(self._tat, start) + interval
+            if priority == TRADE:
+                self._tat_trade = max(self._tat_trade, start) + interval
+            return start - now
+
+    def success(self):
+        with self._lock:
+            self.rate = min(self.max_rate,
+                            self.rate + self.increase / self.rate)
+
+    def throttled(self, pause=None):
+        with self._lock:
+            now = time.monotonic()
+            self.throttled_count += 1
+            if pause:
+                self._paused = max(self._paused, now + pause)
+            if now >= self._next_decrease:
+                # many calls in flight come back throttled together,
+                # count them as one signal
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self._next_decrease = now + self.cooldown
+
+
+class RateLimiter():
+    '''
+    one HostLimiter per base url of endpoints.Urls (quote, trade,
+    securities, paper, user...). urls are matched on host and path, so
+    rerouted stand-in urls (Urls(root=...)) land in the same buckets;
+    anything else is keyed by its host
+
+        limiter = RateLimiter(rates={'base_quote_url': 50})
+        waited = limiter.acquire(url, endpoint='quotes')
+        limiter.feedback(url, response.status_code,
+                         response.headers.get('Retry-After'))
+
+    buckets start at the max rate, so pacing only bites once a host
+    answered 429 / 503: then the rate halves and grows back. learned
+    rates can be saved with rates() and passed back in
+    '''
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self,
+                 urls=None,
+                 rate=1000.0,
+                 rates=None,
+                 trade_endpoints=TRADE_ENDPOINTS,
+                 throttle_on=(429, 503),
+                 **limiter_kwargs):
+        '''
+        params:
+            rate: starting requests per second for every base
+            rates: {base name: starting rate} overrides
+            trade_endpoints: endpoints whose calls take priority over
+                the other calls to the same base
+            throttle_on: status codes that lower the learned rate
+            limiter_kwargs: burst, min_rate, max_rate, increase, decrease,
+                cooldown for every HostLimiter
+        '''
+        # longest first, so quoteapi.webullbroker.com/api does not swallow
+        # a longer base under the same host
+        self.bases = sorted(
+            ((url.split('://', 1)[1].rstrip('/'), name)
+             for name, url in (urls or Urls()).bases().items()),
+            key=lambda item: -len(item[0]))
+        self.rate = rate
+        self.initial = dict(rates or {})
+        self.trade_endpoints = set(trade_endpoints)
+        self.throttle_on = set(throttle_on)
+        self.limiter_kwargs = limiter_kwargs
+        self.limiters = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def key(self, url):
+        for host_path, name in self.bases:
+            if host_path in url:
+                return name
+        return urlsplit(url).netloc
+
+    def priority(self, endpoint):
+        return TRADE if endpoint in self.trade_endpoints else DATA
+
+    def limiter(self, url):
+        key = self.key(url)
+        limiter = self.limiters.get(key)
+        if limiter is None:
+            with self._lock:
+                limiter = self.limiters.get(key)
+                if limiter is None:
+                    limiter = self.limiters[key] = HostLimiter(
+                        self.initial.get(key, self.rate),
+                        **self.limiter_kwargs)
+        return limiter
+
+    def acquire(self, url, endpoint=None, priority=None):
+        '''
+        block until url may be sent, returns the seconds waited
+        endpoint: Urls method name, orders (TRADE_ENDPOINTS) jump the queue
+        '''
+        if priority is None:
+            priority = self.priority(endpoint)
+        delay = self.limiter(url).reserve(priority)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self, url, endpoint=None, priority=None):
+        if priority is None:
+            priority = self.priority(endpoint)
+        delay = self.limiter(url).reserve(priority)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def feedback(self, url, status, retry_after_header=None):
+        '''
+        report a response: throttling statuses lower the rate, anything
+        below 500 raises it. returns the Retry-After pause, if any
+        '''
+        limiter = self.limiter(url)
+        pause = retry_after(retry_after_header)
+        if status in self.throttle_on:
+            limiter.throttled(pause)
+        elif status < 500:
+            limiter.success()
+        return pause
+
+    def rates(self):
+        '''
+        {base name: learned requests per second}
+        '''
+        return {k: l.rate for k, l in self.limiters.items()}
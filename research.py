@@ -1,100 +1,271 @@
-import pdb
-
-import random
-
+import numpy as np
 import pandas as pd
-from sklearn.linear_model import LinearRegression
-import yfinance
+
+from features import FeatureEngine
+from history import CachedHistory
 
 TICKER = 'TQQQ'
 STRATEGY = 'random'
+HISTORY = CachedHistory()  # yfinance behind an on-disk cache in ./history
+
+
+TAKE_PROFIT = 0.02
+STOP_LOSS = 0.05
+THRESHOLD = 0.003
+DESCRIBE = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+
+
+def pnl_grid(open_, high, low, close, direction, take_profits, stop_losses):
+    """
+    vectorized TP/SL kernel on daily bars, returns pnl of shape
+    (len(take_profits), len(stop_losses), len(open_)).
+    like the row version, the stop loss is assumed to be hit first when
+    both barriers lie inside the day's range
+    """
+    open_, high, low, close = (np.asarray(a, dtype='float64')
+                               for a in (open_, high, low, close))
+    long = np.asarray(direction) == 1
+    up = (high - open_) / open_  # High/Open
+    down = (open_ - low) / open_  # Open/Low
+    favorable = np.where(long, up, down)
+    adverse = np.where(long, down, up)
+    ret = np.where(long, close - open_, open_ - close) / open_  # 收盘平仓
+    tp = np.asarray(take_profits, dtype='float64')[:, None, None]
+    sl = np.asarray(stop_losses, dtype='float64')[None, :, None]
+    return np.where(adverse >= sl, -sl,  # 止损
+                    np.where(favorable >= tp, tp, ret))  # 止盈
+
+
+def _day_numbers(stamps, tz):
+    """
+    calendar day (days since epoch) of each timestamp in the exchange tz
+    """
+    stamps = pd.DatetimeIndex(stamps)
+    if stamps.tz is not None:
+        stamps = stamps.tz_convert(tz).tz_localize(None)
+    return stamps.values.astype('datetime64[D]').astype('int64')
+
+
+def minute_days(dates, minutes, tz='America/New_York'):
+    """
+    row of `dates` (the daily bars) each minute bar belongs to, -1 for
+    minutes on days without a daily bar. minutes: get_bars(interval='m1')
+    / BarStore.read(tId, 'm1') frame with a DatetimeIndex
+    """
+    days = pd.Index(_day_numbers(dates, tz))
+    return days.get_indexer(_day_numbers(minutes.index, tz))
+
+
+def first_hits(excursion, day, levels, n_days):
+    """
+    first row of each day at which excursion reaches each level, shape
+    (len(levels), n_days); len(excursion) where the day never gets there.
+    day must be non-decreasing: the running max restarts every day by
+    stacking days `span` apart, so one np.maximum.accumulate and one
+    searchsorted answer every (level, day) pair without a python loop
+    """
+    n = len(excursion)
+    levels = np.asarray(levels, dtype='float64')
+    if not n:
+        return np.zeros((len(levels), n_days), dtype='int64')
+    # a NaN bar (a 'null' high / low) must never reach a level, and must
+    # not spread through the running max
+    excursion = np.where(np.isnan(excursion), -np.inf, excursion)
+    finite = excursion[np.isfinite(excursion)]
+    lo = min(finite.min(initial=np.inf), levels.min())
+    span = max(finite.max(initial=-np.inf), levels.max()) - lo + 1.0
+    running = np.maximum.accumulate(excursion - lo + day * span)
+    days = np.arange(n_days)
+    starts = np.searchsorted(day, days, 'left')
+    ends = np.searchsorted(day, days, 'right')
+    first = np.searchsorted(running, (levels[:, None] - lo) + days * span)
+    first = np.maximum(first, starts)
+    return np.where(first < ends, first, n)
 
 
-def calculate_pnl(row):
-    TAKE_PROFIT = 0.02
-    STOP_LOSS = 0.05
-    # STOP_LOSS = 0.1
-    if row['Direction'] == 1:  # long
-        if row['Open/Low'] >= STOP_LOSS:  # 止损
-            return -STOP_LOSS
-        elif row['High/Open'] >= TAKE_PROFIT:  # 止盈
-            return TAKE_PROFIT
-        else:
-            return (row['Close'] - row['Open']) / row['Open']  # 收盘平仓
-    else:  # short
-        if row['High/Open'] >= STOP_LOSS:
-            return -STOP_LOSS
-        elif row['Open/Low'] >= TAKE_PROFIT:
-            return TAKE_PROFIT
-        else:
-            return (row['Open'] - row['Close']) / row['Open']  # 收盘平仓
-
-
-def estimate_dev(row):
+def pnl_grid_intraday(open_, high, low, close, direction, minutes, day,
+                      take_profits, stop_losses):
+    """
+    pnl_grid resolved on minute bars: for each trade the barrier crossed
+    first decides the outcome; only when both are crossed inside the same
+    minute is the stop assumed first. days without minute bars keep the
+    daily rule. same (len(take_profits), len(stop_losses), len(open_))
+    shape as pnl_grid
+    params:
+        minutes: frame with high/low columns, sorted by time
+        day: minute_days(pv['Date'], minutes)
+    """
+    open_, close = (np.asarray(a, dtype='float64') for a in (open_, close))
+    long = np.asarray(direction) == 1
+    daily = pnl_grid(open_, high, low, close, direction, take_profits,
+                     stop_losses)
+    keep = day >= 0
+    day = day[keep]
+    high_m = np.asarray(minutes['high'], dtype='float64')[keep]
+    low_m = np.asarray(minutes['low'], dtype='float64')[keep]
+    n, m = len(open_), len(day)
+    o = open_[day]
+    up = (high_m - o) / o
+    down = (o - low_m) / o
+    favorable = np.where(long[day], up, down)
+    adverse = np.where(long[day], down, up)
+    tp_first = first_hits(favorable, day, take_profits, n)[:, None, :]
+    sl_first = first_hits(adverse, day, stop_losses, n)[None, :, :]
+    tp = np.asarray(take_profits, dtype='float64')[:, None, None]
+    sl = np.asarray(stop_losses, dtype='float64')[None, :, None]
+    ret = np.where(long, close - open_, open_ - close) / open_
+    pnl = np.where((sl_first < m) & (sl_first <= tp_first), -sl,
+                   np.where(tp_first < m, tp, ret))
+    covered = np.bincount(day, minlength=n) > 0
+    return np.where(covered, pnl, daily)
+
+
+def calculate_pnl(pv, take_profit=TAKE_PROFIT, stop_loss=STOP_LOSS,
+                  minutes=None):
+    """
+    PnL column for one (take_profit, stop_loss) pair
+    minutes: minute bars of the same ticker to resolve which barrier was
+        hit first (see pnl_grid_intraday) instead of assuming the stop
+    """
+    if minutes is None:
+        pnl = pnl_grid(pv['Open'], pv['High'], pv['Low'], pv['Close'],
+                       pv['Direction'], [take_profit], [stop_loss])
+    else:
+        pnl = pnl_grid_intraday(
+            pv['Open'], pv['High'], pv['Low'], pv['Close'], pv['Direction'],
+            minutes, minute_days(pv['Date'], minutes), [take_profit],
+            [stop_loss])
+    return pd.Series(pnl[0, 0], index=pv.index, name='PnL')
+
+
+def describe_rows(values):
+    """
+    pandas describe() of every row of a 2d array in one pass
+    """
+    quartiles = np.nanpercentile(values, [0, 25, 50, 75, 100], axis=-1)
+    return np.column_stack([
+        np.sum(~np.isnan(values), axis=-1),
+        np.nanmean(values, axis=-1),
+        np.nanstd(values, axis=-1, ddof=1),
+        quartiles[0], quartiles[1], quartiles[2], quartiles[3],
+        quartiles[4]
+    ])
+
+
+def backtest_grid(pv,
+                  take_profits=(TAKE_PROFIT, ),
+                  stop_losses=(STOP_LOSS, ),
+                  thresholds=(THRESHOLD, ),
+                  minutes=None):
+    """
+    evaluate every (take_profit, stop_loss, threshold) combination at once.
+    pv needs Open/High/Low/Close/Direction/Year. threshold drives the Yes
+    flag (both sides of the open moved at least threshold), as in __main__
+    returns (summary, yearly):
+        summary: PnL describe() plus yes count per grid point
+        yearly: trades, wins, stops, targets and yes counts per grid point
+            and year
+    minutes: minute bars to resolve the barrier order intraday, see
+        pnl_grid_intraday
+    """
+    open_, high, low = (pv[c].to_numpy('float64')
+                        for c in ('Open', 'High', 'Low'))
+    if minutes is None:
+        pnl = pnl_grid(open_, high, low, pv['Close'], pv['Direction'],
+                       take_profits, stop_losses)
+    else:
+        pnl = pnl_grid_intraday(open_, high, low, pv['Close'],
+                                pv['Direction'], minutes,
+                                minute_days(pv['Date'], minutes),
+                                take_profits, stop_losses)
+    n_tp, n_sl, n = pnl.shape
+    n_th = len(thresholds)
+    th = np.asarray(thresholds, dtype='float64')[:, None]
+    yes = (((open_ - low) / open_ >= th) &
+           ((high - open_) / open_ >= th))  # (n_th, n)
+
+    index = pd.MultiIndex.from_product(
+        [take_profits, stop_losses, thresholds],
+        names=['take_profit', 'stop_loss', 'threshold'])
+    stats = describe_rows(pnl.reshape(n_tp * n_sl, n))
+    summary = pd.DataFrame(
+        np.repeat(stats, n_th, axis=0), index=index, columns=DESCRIBE)
+    summary['yes'] = np.tile(yes.sum(axis=1), n_tp * n_sl)
+
+    codes, years = pd.factorize(pv['Year'], sort=True)
+    onehot = np.zeros((n, len(years)))
+    onehot[np.arange(n), codes] = 1.0
+    sl = np.asarray(stop_losses, dtype='float64')[None, :, None]
+    tp = np.asarray(take_profits, dtype='float64')[:, None, None]
+    per_year = {
+        'trades': np.broadcast_to(np.ones(n), pnl.shape),
+        'wins': pnl > 0,
+        'stops': pnl == -sl,
+        'targets': pnl == tp,
+    }
+    yearly = {
+        name: np.repeat(
+            (flags.reshape(n_tp * n_sl, n) @ onehot), n_th, axis=0)
+        for name, flags in per_year.items()
+    }
+    yearly['yes'] = np.tile(yes @ onehot, (n_tp * n_sl, 1))
+    yearly = pd.concat(
+        {name: pd.DataFrame(counts, index=index, columns=years).stack()
+         for name, counts in yearly.items()}, axis=1).astype('int64')
+    yearly.index.names = index.names + ['Year']
+    return summary, yearly
+
+
+def estimate_dev(pv):
     x, y, z = 0.41, 0.48, 0.29
-    return x * row['Open_jump'] + y * row['Deviation_d1'] + z * row['Deviation_d2']
+    return x * pv['Open_jump'] + y * pv['Deviation_d1'] + z * pv['Deviation_d2']
 
 
-def get_hist_and_preprocess():
-    stock = yfinance.Ticker(TICKER)
-    pv = stock.history(period='max', actions=False)
-    pv.reset_index(level=0, inplace=True)
-    pv['Year'] = pv.apply(lambda row: row['Date'].year, axis=1)
+def get_hist_and_preprocess(ticker=TICKER, history=None):
+    """
+    daily Date/Open/High/Low/Close/Volume/Year of ticker
+    history: CachedHistory to read from, HISTORY by default; use
+        CachedHistory(offline=True) to run from saved files only
+    """
+    pv = (history or HISTORY).load(ticker)
+    pv['Year'] = pv['Date'].dt.year
     return pv
-    pv_d1 = pv.copy()  # delay 1 pv
-    pv_d1['Date'] = pv_d1['Date'].shift(-1)
-    pv_d1.columns = [
-        'Date', 'Open_d1', 'High_d1', 'Low_d1', 'Close_d1', 'Volume_d1'
-    ]
-    pv_d2 = pv.copy()  # delay 2 pv
-    pv_d2['Date'] = pv_d2['Date'].shift(-2)
-    pv_d2.columns = [
-        'Date', 'Open_d2', 'High_d2', 'Low_d2', 'Close_d2', 'Volume_d2'
-    ]
-    pv = pd.merge(pv, pv_d1, how='inner', on='Date')
-    pv = pd.merge(pv, pv_d2, how='inner', on='Date')
-
-    pv['High/Open'] = pv.apply(
-        lambda row: (row['High'] - row['Open']) / row['Open'], axis=1)
-    pv['Open/Low'] = pv.apply(
-        lambda row: (row['Open'] - row['Low']) / row['Open'], axis=1)
-
-    pv['Deviation'] = pv.apply(
-        lambda row: (row['High'] - row['Low']) / row['Open'], axis=1)
-    pv['Deviation_d1'] = pv.apply(
-        lambda row: (row['High_d1'] - row['Low_d1']) / row['Open_d1'], axis=1)
-    pv['Deviation_d2'] = pv.apply(
-        lambda row: (row['High_d2'] - row['Low_d2']) / row['Open_d2'], axis=1)
-    pv['Open_jump'] = pv.apply(
-        lambda row: abs(row['Open'] - row['Close_d1']) / row['Close_d1'],
-        axis=1)
-    pv['estimated_dev'] = pv.apply(estimate_dev, axis=1)
-    pv['ret_d1'] = pv.apply(
-        lambda row: (row['Close_d1'] - row['Open_d1']) / row['Open_d1'],
-        axis=1)
-    pv = pv[[
-        'Date', 'Open', 'High', 'Low', 'Close', 'estimated_dev', 'ret_d1',
+
+
+def add_features(pv):
+    engine = FeatureEngine(pv[['Open', 'High', 'Low', 'Close']])
+    engine.lag('Open', 1).lag('Close', 1)  # Open_d1, Close_d1
+    engine.spread('High', 'Open', 'Open', 'High/Open')
+    engine.spread('Open', 'Low', 'Open', 'Open/Low')
+    engine.spread('High', 'Low', 'Open', 'Deviation')
+    engine.lag('Deviation', 1).lag('Deviation', 2)  # Deviation_d1/_d2
+    engine.spread('Open', 'Close_d1', 'Close_d1', 'Open_jump', absolute=True)
+    engine.expr(estimate_dev, 'estimated_dev')
+    engine.spread('Close_d1', 'Open_d1', 'Open_d1', 'ret_d1')
+    out = engine.frame([
+        'Open', 'High', 'Low', 'Close', 'estimated_dev', 'ret_d1',
         'Deviation', 'Open/Low', 'High/Open', 'Close_d1'
-    ]]
+    ])
+    out.insert(0, 'Date', pv['Date'].to_numpy())
+    out.insert(1, 'Year', pv['Year'].to_numpy())
+    # the first two rows have no t-1 / t-2 data
+    pv = out.iloc[2:].reset_index(drop=True)
     # X = pv[['Open_jump', 'Deviation_d1', 'Deviation_d2']]
     # y = pv['Deviation']
     # reg = LinearRegression(fit_intercept=False).fit(X, y)
     # print(TICKER, reg.score(X, y))
-    # pdb.set_trace()
     # apply strategy, o for short, 1 for long
-    pv['Direction'] = pv.apply(
-        lambda row: 1 if row['Open'] >= row['Close_d1'] else 0, axis=1)
-    pv['PnL'] = pv.apply(calculate_pnl, axis=1)
-    print(pv['PnL'].describe())
-    # pdb.set_trace()
+    pv['Direction'] = (pv['Open'] >= pv['Close_d1']).astype('int64')
+    pv['PnL'] = calculate_pnl(pv)
+    return pv
 
 
 if __name__ == "__main__":
-    pv = get_hist_and_preprocess()
-    threshold = 0.003
-    pv['Yes'] = pv.apply(
-        lambda row: ((row['Open'] - row['Low']) / row['Open'] >= threshold) & ((row['High'] - row['Open']) / row['Open'] >= threshold),
-        axis=1)
-    # pdb.set_trace()
-    for year, group in pv.groupby(['Year']):
-        print(year, group['Yes'].value_counts())
\ No newline at end of file
+    pv = add_features(get_hist_and_preprocess())
+    summary, yearly = backtest_grid(
+        pv,
+        take_profits=[0.01, 0.02, 0.03, 0.05],
+        stop_losses=[0.02, 0.05, 0.1],
+        thresholds=[0.003, 0.005, 0.01])
+    print(summary.sort_values('mean', ascending=False))
+    print(yearly.xs((TAKE_PROFIT, STOP_LOSS, THRESHOLD)))
@@ -0,0 +1,194 @@
+import itertools
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from research import (STOP_LOSS, TAKE_PROFIT, THRESHOLD,
+                      get_hist_and_preprocess, pnl_grid)
+
+FIELDS = ('Open', 'High', 'Low', 'Close')
+
+# worker side views of the shared price arrays, set by _attach
+_shared = {}
+
+
+class SharedPrices():
+    '''
+    OHLC of a whole universe packed into one shared memory block per
+    column; ticker i owns rows offsets[i]:offsets[i + 1]. workers attach by
+    name, so no DataFrame is ever pickled to them
+    '''
+
+    def __init__(self, frames, dtype='float64'):
+        self.tickers = list(frames)
+        lengths = [len(frames[t]) for t in self.tickers]
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(int)
+        self.dtype = np.dtype(dtype)
+        total = int(self.offsets[-1])
+        self.blocks = {}
+        for field in FIELDS:
+            shm = shared_memory.SharedMemory(
+                create=True, size=max(1, total * self.dtype.itemsize))
+            view = np.ndarray(total, dtype=self.dtype, buffer=shm.buf)
+            for i, ticker in enumerate(self.tickers):
+                view[self.offsets[i]:self.offsets[i + 1]] = frames[ticker][
+                    field].to_numpy(self.dtype)
+            self.blocks[field] = shm
+
+    def spec(self):
+        '''
+        picklable description the workers attach with
+        '''
+        return {
+            'names': {f: shm.name for f, shm in self.blocks.items()},
+            'total': int(self.offsets[-1]),
+            'dtype': self.dtype.str,
+        }
+
+    def close(self):
+        for shm in self.blocks.values():
+            shm.close()
+            shm.unlink()
+
+
+def _attach(spec):
+    for field, name in spec['names'].items():
+        shm = shared_memory.SharedMemory(name=name)
+        _shared[field] = (shm, np.ndarray(
+            spec['total'], dtype=spec['dtype'], buffer=shm.buf))
+
+
+def _scan_one(task):
+    '''
+    one ticker x one slice of the parameter grid, runs in a worker
+    '''
+    ticker, start, stop, take_profits, stop_losses, thresholds = task
+    o, h, l, c = (_shared[f][1][start:stop] for f in FIELDS)
+    # trade day t against the close of t-1, as in research.add_features
+    prev_close = c[:-1]
+    o, h, l, c = o[1:], h[1:], l[1:], c[1:]
+    rows = []
+    if len(o) == 0:
+        return ticker, rows
+    direction = (o >= prev_close).astype('int64')
+    pnl = pnl_grid(o, h, l, c, direction, take_profits, stop_losses)
+    th = np.asarray(thresholds, dtype='float64')[:, None]
+    yes = (((o - l) / o >= th) & ((h - o) / o >= th)).mean(axis=1)
+    mean = pnl.mean(axis=-1)
+    std = pnl.std(axis=-1, ddof=1) if len(o) > 1 else np.zeros_like(mean)
+    wins = (pnl > 0).mean(axis=-1)
+    total = pnl.sum(axis=-1)
+    for (i, tp), (j, sl), (k, threshold) in itertools.product(
+            enumerate(take_profits), enumerate(stop_losses),
+            enumerate(thresholds)):
+        rows.append((ticker, tp, sl, threshold, len(o), mean[i, j],
+                     std[i, j], wins[i, j], total[i, j], yes[k]))
+    return ticker, rows
+
+
+RESULT_COLUMNS = [
+    'ticker', 'take_profit', 'stop_loss', 'threshold', 'days', 'mean',
+    'std', 'win_rate', 'total', 'yes_rate'
+]
+
+
+def load_universe(tickers, load=None, max_workers=16, errors=None):
+    '''
+    {ticker: OHLC DataFrame}, loaded concurrently; tickers that fail or
+    come back empty are left out and recorded in `errors` ({ticker:
+    exception}) when a dict is given
+    '''
+    load = load or get_hist_and_preprocess
+
+    def fetch(ticker):
+        try:
+            df = load(ticker)
+        except Exception as exc:
+            return ticker, None, exc
+        if df is None or not len(df):
+            return ticker, None, ValueError(f'no data for {ticker}')
+        return ticker, df, None
+
+    frames = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for ticker, df, error in pool.map(fetch, tickers):
+            if error is None:
+                frames[ticker] = df
+            elif errors is not None:
+                errors[ticker] = error
+    return frames
+
+
+def scan(tickers,
+         take_profits=(TAKE_PROFIT, ),
+         stop_losses=(STOP_LOSS, ),
+         thresholds=(THRESHOLD, ),
+         load=None,
+         processes=None,
+         param_chunks=1,
+         progress=True,
+         rank_by='mean'):
+    '''
+    run the open range / TP-SL study over a whole universe on a process pool
+    params:
+        load: ticker -> DataFrame with Open/High/Low/Close, defaults to
+            research.get_hist_and_preprocess
+        param_chunks: split the take_profit axis into this many tasks per
+            ticker, to spread a big grid over more workers
+        progress: print tickers done and tickers/sec to stderr
+    returns one result table ranked by `rank_by`, best first; tickers that
+    could not be loaded are listed on stderr and kept in
+    result.attrs['errors'] ({ticker: exception})
+    '''
+    errors = {}
+    frames = load_universe(tickers, load, errors=errors)
+    for ticker, error in errors.items():
+        sys.stderr.write(f'skipped {ticker}: {error!r}\n')
+    prices = SharedPrices(frames)
+    tp_chunks = [list(c) for c in np.array_split(
+        np.asarray(take_profits, dtype='float64'), param_chunks) if len(c)]
+    tasks = [(t, int(prices.offsets[i]), int(prices.offsets[i + 1]), tps,
+              list(stop_losses), list(thresholds))
+             for i, t in enumerate(prices.tickers) for tps in tp_chunks]
+    rows = []
+    done = {}
+    finished = 0
+    start = last = time.perf_counter()
+    try:
+        with Pool(processes, initializer=_attach,
+                  initargs=(prices.spec(), )) as pool:
+            for ticker, result in pool.imap_unordered(
+                    _scan_one, tasks, chunksize=max(1, len(tasks) // 256)):
+                rows.extend(result)
+                done[ticker] = done.get(ticker, 0) + 1
+                if done[ticker] < len(tp_chunks):
+                    continue
+                finished += 1
+                now = time.perf_counter()
+                if progress and now - last >= 0.5:
+                    last = now
+                    sys.stderr.write(
+                        f'\r{finished}/{len(prices.tickers)} tickers '
+                        f'{finished / (now - start):.1f} tickers/sec')
+    finally:
+        prices.close()
+    if progress:
+        elapsed = time.perf_counter() - start
+        sys.stderr.write(f'\n{len(prices.tickers)} tickers in {elapsed:.2f}s '
+                         f'({len(prices.tickers) / elapsed:.1f} tickers/sec)\n')
+    result = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    result = result.sort_values(rank_by, ascending=False, ignore_index=True)
+    result.attrs['errors'] = errors
+    return result
+
+
+if __name__ == "__main__":
+    table = scan(sys.argv[1:] or ['TQQQ', 'SQQQ', 'QQQ', 'SPY'],
+                 take_profits=[0.01, 0.02, 0.03, 0.05],
+                 stop_losses=[0.02, 0.05, 0.1],
+                 thresholds=[0.003, 0.005, 0.01])
+    print(table.head(20))
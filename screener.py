@@ -0,0 +1,179 @@
+import json
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# ticker fields of a screener item -> column dtype of a batch
+SCREENER_FIELDS = {
+    'symbol': object,
+    'name': object,
+    'close': 'float64',
+    'change': 'float64',
+    'changeRatio': 'float64',
+    'volume': 'float64',
+    'marketValue': 'float64',
+    'turnoverRate': 'float64',
+    'peTtm': 'float64',
+}
+
+RULE = 'wlas.screener.rule.'
+
+
+class ScreenerQuery():
+    '''
+    filter query for Urls.screener, built by chaining rules
+
+        query = (ScreenerQuery().price(gte=5).volume(gte=1e6)
+                 .change_ratio(gte=0.05).sort('changeRatio'))
+
+    bounds are inclusive; ratios are fractions (0.05 = 5%)
+    '''
+
+    def __init__(self, region=6):
+        self.rules = {RULE + 'region': f'securities.region.name.{region}'}
+        self.order = None
+
+    def rule(self, name, gte=None, lte=None):
+        bounds = [f'{op}={value:g}' for op, value in (('gte', gte),
+                                                       ('lte', lte))
+                  if value is not None]
+        self.rules[RULE + name] = '&'.join(bounds)
+        return self
+
+    def price(self, gte=None, lte=None):
+        return self.rule('price', gte, lte)
+
+    def volume(self, gte=None, lte=None):
+        return self.rule('volume', gte, lte)
+
+    def change_ratio(self, gte=None, lte=None):
+        return self.rule('changeRatio', gte, lte)
+
+    def market_cap(self, gte=None, lte=None):
+        return self.rule('marketValue', gte, lte)
+
+    def turnover(self, gte=None, lte=None):
+        return self.rule('turnoverRate', gte, lte)
+
+    def pe(self, gte=None, lte=None):
+        return self.rule('peTtm', gte, lte)
+
+    def sort(self, rule, desc=True):
+        self.order = {'rule': RULE + rule, 'desc': desc}
+        return self
+
+    def body(self, page=0, size=200):
+        body = {'fetch': size, 'pageIndex': page, 'rules': dict(self.rules),
+                'attach': {'hkexPrivilege': False}}
+        if self.order is not None:
+            body['sort'] = dict(self.order)
+        return body
+
+    def key(self):
+        '''
+        stable cache key: same rules and sort give the same key
+        '''
+        return json.dumps([self.rules, self.order], sort_keys=True)
+
+
+def screener_batch(items, as_numpy=False):
+    '''
+    one page of screener items -> DataFrame indexed by tickerId, or
+    {field: array} with a tickerId array when as_numpy (strings sized to
+    the longest value of the page)
+    '''
+    tickers = [item.get('ticker') or item for item in items]
+    columns = {'tickerId': np.array(
+        [int(t.get('tickerId') or 0) for t in tickers], dtype='int64')}
+    for field, dtype in SCREENER_FIELDS.items():
+        values = [t.get(field) for t in tickers]
+        if dtype == 'float64':
+            columns[field] = pd.to_numeric(
+                pd.Series(values, dtype=object),
+                errors='coerce').to_numpy(dtype=dtype, na_value=np.nan)
+        else:
+            strings = ['' if v is None else str(v) for v in values]
+            # as wide as the longest value of the page, nothing is cut
+            columns[field] = np.array(
+                strings, dtype='U%d' % max([1] + [len(v) for v in strings]))
+    if as_numpy:
+        return columns
+    ids = columns.pop('tickerId')
+    return pd.DataFrame(columns, index=pd.Index(ids, name='tickerId'),
+                        copy=False)
+
+
+class Screener():
+    '''
+    pages through Urls.screener with a generator, so a scan holds one
+    page at a time. pages of a query run inside the last `ttl` seconds
+    are replayed from memory instead of scanning again (only scans of at
+    most `max_cached_rows` rows are kept)
+
+        for batch in api.screener.scan(query):
+            ...
+    '''
+
+    def __init__(self, api, page_size=200, ttl=30.0, max_cached_rows=5000):
+        self.api = api
+        self.page_size = page_size
+        self.ttl = ttl
+        self.max_cached_rows = max_cached_rows
+        self._cache = {}  # query key -> (fetched_at, [items])
+        self._lock = threading.Lock()
+
+    def pages(self, query, max_rows=None):
+        '''
+        raw item lists, one per page
+        '''
+        key = query.key()
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] <= self.ttl:
+            rows = 0
+            for items in cached[1]:
+                if max_rows is not None and rows >= max_rows:
+                    return
+                yield items[:None if max_rows is None else max_rows - rows]
+                rows += len(items)
+            return
+        kept, rows, page = [], 0, 0
+        started = time.monotonic()
+        complete = True
+        while max_rows is None or rows < max_rows:
+            result = self.api.screen_page(query.body(page, self.page_size))
+            items = result.get('items') or []
+            if not items:
+                break
+            if max_rows is not None and rows + len(items) > max_rows:
+                items = items[:max_rows - rows]
+                complete = False
+            rows += len(items)
+            if kept is not None:
+                kept.append(items)
+                if rows > self.max_cached_rows:
+                    kept = None
+            yield items
+            total = result.get('total')
+            if len(items) < self.page_size or (total is not None
+                                               and rows >= total):
+                break
+            page += 1
+        else:
+            complete = False
+        if kept is not None and complete:
+            with self._lock:
+                self._cache[key] = (started, kept)
+
+    def scan(self, query, max_rows=None, as_numpy=False):
+        '''
+        typed batches, see screener_batch
+        '''
+        for items in self.pages(query, max_rows):
+            yield screener_batch(items, as_numpy=as_numpy)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,235 @@
+import asyncio
+import inspect
+import json
+import os
+import stat
+import threading
+import time
+from datetime import datetime
+
+from ratelimit import backoff
+
+# what a restored client needs to skip login + get_trade_token
+FIELDS = ('did', 'uuid', 'account_id', 'paper_account_id', 'access_token',
+          'refresh_token', 'token_expire', 'trade_token')
+
+
+def expires_at(token_expire):
+    '''
+    epoch seconds of a tokenExpireTime ('2020-05-21T14:47:35.372+0000',
+    iso or epoch ms), None when unknown
+    '''
+    if not token_expire:
+        return None
+    if isinstance(token_expire, (int, float)):
+        return token_expire / 1000.0 if token_expire > 1e11 else token_expire
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z'):
+        try:
+            return datetime.strptime(token_expire, fmt).timestamp()
+        except ValueError:
+            pass
+    try:
+        return datetime.fromisoformat(token_expire).timestamp()
+    except ValueError:
+        return None
+
+
+class SessionManager():
+    '''
+    keeps the tokens of one api object alive across refreshes and restarts
+
+        api = WeBullApi(session_path='session.json')   # restores if saved
+        if not api.access_token:
+            api.login(username, password)               # saved on success
+
+    tokens live in a 0600 json file written atomically. a daemon thread
+    refreshes them `margin` seconds before token_expire, and ensure_fresh()
+    (called before trade requests) refreshes inline only if the thread
+    fell behind. concurrent callers share one refresh
+    '''
+
+    def __init__(self, api, path='session.json', margin=300.0):
+        '''
+        params:
+            api: WeBullApi / PaperApi / AsyncWeBullApi
+            path: session file, created with owner only permissions
+            margin: seconds before expiry the tokens are refreshed
+        '''
+        self.api = api
+        self.path = path
+        self.margin = margin
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._refreshing = False
+        self._result = None
+        self._cond = threading.Condition(self._lock)
+        self._tasks = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._background = None
+
+    def expires_in(self):
+        '''
+        seconds until the access token expires, inf when unknown
+        '''
+        at = expires_at(self.api.token_expire)
+        return float('inf') if at is None else at - time.time()
+
+    def save(self):
+        state = {k: getattr(self.api, k, '') for k in FIELDS}
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def restore(self):
+        '''
+        load saved tokens into the api, False if there are none or the
+        access token already expired
+        '''
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if os.name == 'posix' and st.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+            raise PermissionError(
+                f'{self.path} is accessible by other users, chmod 600 it')
+        with open(self.path) as f:
+            state = json.load(f)
+        at = expires_at(state.get('token_expire'))
+        if not state.get('access_token') or (at is not None
+                                             and at <= time.time()):
+            return False
+        for k in FIELDS:
+            if state.get(k):
+                setattr(self.api, k, state[k])
+        return True
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _refreshed(self, ok):
+        # the api saves through its own hook after a successful refresh
+        self.refreshes += ok
+        return ok
+
+    def refresh(self):
+        '''
+        refresh_login once for every thread arriving while it runs; a
+        thread arriving just after it finished sees the new expiry and
+        does not refresh again
+        '''
+        with self._cond:
+            if self._refreshing:
+                generation = self._generation
+                while self._generation == generation:
+                    self._cond.wait()
+                return self._result
+            if self.expires_in() > self.margin:
+                # another thread refreshed between our check and the lock
+                return True
+            self._refreshing = True
+        ok = False
+        try:
+            ok = self._refreshed(bool(self.api.refresh_login()))
+        finally:
+            with self._cond:
+                self._result = ok
+                self._refreshing = False
+                self._generation += 1
+                self._cond.notify_all()
+        return ok
+
+    def ensure_fresh(self):
+        '''
+        cheap check on the hot path, refreshes only inside the margin
+        '''
+        if self.expires_in() > self.margin:
+            return True
+        return self.refresh()
+
+    async def refresh_async(self):
+        '''
+        refresh_login of an async api, one task per event loop does it
+        and the other tasks await that task
+        '''
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(loop)
+        if task is None or task.done():
+            if self.expires_in() > self.margin:
+                return True
+
+            async def run():
+                try:
+                    ok = await self.api.refresh_login()
+                    return self._refreshed(bool(ok))
+                finally:
+                    self._tasks.pop(loop, None)
+
+            task = self._tasks[loop] = loop.create_task(run())
+        return await asyncio.shield(task)
+
+    async def ensure_fresh_async(self):
+        if self.expires_in() > self.margin:
+            return True
+        return await self.refresh_async()
+
+    def start(self):
+        '''
+        refresh in a daemon thread ahead of expiry; async apis use
+        start_async from inside their event loop instead
+        '''
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='webull-session', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._background is not None:
+            self._background.cancel()
+            self._background = None
+
+    def _delay(self, failures):
+        if failures:
+            return min(self.margin / 2, 1 + backoff(failures, 1.0, 60.0))
+        # at least a second, in case a refresh did not move the expiry
+        return max(1.0, self.expires_in() - self.margin)
+
+    def _run(self):
+        failures = 0
+        while not self._stop.wait(min(self._delay(failures), 3600.0)):
+            if self.expires_in() > self.margin:
+                continue
+            try:
+                failures = 0 if self.refresh() else failures + 1
+            except Exception:
+                failures += 1
+
+    def start_async(self):
+        if not inspect.iscoroutinefunction(self.api.refresh_login):
+            return self.start()
+        if self._background is not None and not self._background.done():
+            return self
+        self._stop.clear()
+        self._background = asyncio.get_running_loop().create_task(
+            self._run_async())
+        return self
+
+    async def _run_async(self):
+        failures = 0
+        while not self._stop.is_set():
+            await asyncio.sleep(min(self._delay(failures), 3600.0))
+            if self._stop.is_set() or self.expires_in() > self.margin:
+                continue
+            try:
+                failures = 0 if await self.refresh_async() else failures + 1
+            except Exception:
+                failures += 1
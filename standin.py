@@ -0,0 +1,649 @@
+import json
+import socket
+import socketserver
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import date, timedelta
+from urllib.parse import parse_qs, urlsplit
+
+
+def _quote(ticker_id):
+    return {
+        'tickerId': int(ticker_id),
+        'symbol': 'T%s' % ticker_id,
+        'close': '100.00',
+        'open': '99.50',
+        'high': '101.00',
+        'low': '99.00',
+        'volume': '123456',
+    }
+
+
+def _tokens(lifetime=86400):
+    expire = time.strftime('%Y-%m-%dT%H:%M:%S.000+0000',
+                           time.gmtime(time.time() + lifetime))
+    token = '%x' % time.monotonic_ns()
+    return {
+        'accessToken': 'a' + token,
+        'refreshToken': 'r' + token,
+        'tokenExpireTime': expire,
+        'uuid': 'standin',
+    }
+
+
+# synthetic chain about the size of SPY: expiries x strikes x call/put
+OPTION_EXPIRIES = 24
+OPTION_STRIKES = 200
+
+
+def _expiries():
+    first = date(2030, 1, 4)
+    return [(first + timedelta(weeks=i)).isoformat()
+            for i in range(OPTION_EXPIRIES)]
+
+
+EXPIRIES = _expiries()
+
+
+def _contract(i, j, side):
+    derivative_id = 1000000000 + i * 10000 + j * 2 + (side == 'put')
+    bid = 0.05 + abs(j - OPTION_STRIKES // 2) * 0.1
+    return {
+        'tickerId': derivative_id,
+        'strikePrice': str(400 + j),
+        'direction': side,
+        'expireDate': EXPIRIES[i],
+        'close': '%.2f' % (bid + 0.05),
+        'bidList': [{'price': '%.2f' % bid, 'volume': '10'}],
+        'askList': [{'price': '%.2f' % (bid + 0.1), 'volume': '12'}],
+        'volume': '100',
+        'openInterest': '1000',
+        'impVol': '0.2',
+        'delta': '0.5' if side == 'call' else '-0.5',
+    }
+
+
+def _options(query):
+    wanted = parse_qs(query).get('expireDate')
+    expirations = []
+    for i, day in enumerate(EXPIRIES):
+        entry = {'from': {'date': day, 'days': 7 * i + 1, 'weekly': 1}}
+        if wanted is None or day in wanted:
+            entry['data'] = [{
+                'strikePrice': str(400 + j),
+                'call': _contract(i, j, 'call'),
+                'put': _contract(i, j, 'put'),
+            } for j in range(OPTION_STRIKES)]
+        expirations.append(entry)
+    return {'expireDateList': expirations}
+
+
+def _option_quotes(query):
+    quotes = []
+    for derivative_id in parse_qs(query)['derivativeIds'][0].split(','):
+        n = int(derivative_id) - 1000000000
+        quotes.append(_contract(n // 10000, n % 10000 // 2,
+                                'put' if n % 2 else 'call'))
+    return {'data': quotes}
+
+
+SCREENER_UNIVERSE = 1000
+
+
+def _screener(body):
+    '''
+    the universe is tickerIds 1..SCREENER_UNIVERSE with close = tickerId
+    and volume = 1000 * tickerId; price and volume rules filter it
+    '''
+    query = json.loads(body or b'{}')
+    rules = query.get('rules') or {}
+    ids = range(1, SCREENER_UNIVERSE + 1)
+    for name, field in (('price', 1), ('volume', 1000)):
+        for bound in filter(None, rules.get(
+                'wlas.screener.rule.' + name, '').split('&')):
+            op, value = bound.split('=')
+            value = float(value)
+            ids = [t for t in ids
+                   if (t * field >= value if op == 'gte' else
+                       t * field <= value)]
+    ids = list(ids)
+    size = int(query.get('fetch', 200))
+    start = int(query.get('pageIndex', 0)) * size
+    return {
+        'total': len(ids),
+        'items': [{'ticker': {
+            'tickerId': t,
+            'symbol': 'T%d' % t,
+            'name': 'Stand-in %d' % t,
+            'close': '%.2f' % t,
+            'changeRatio': '0.01',
+            'volume': str(t * 1000),
+        }} for t in ids[start:start + size]],
+    }
+
+
+# news: article k is about tickers k % 10 + 1 and 3k % 10 + 1, raise
+# NEWS['latest'] to publish more
+NEWS = {'latest': 500}
+
+
+def _news(path, query):
+    tId = int(path.rsplit('/', 1)[-1])
+    params = parse_qs(query)
+    current = int(params.get('currentNewsId', ['0'])[0])
+    size = int(params.get('pageSize', ['20'])[0])
+    page = []
+    k = current - 1 if current else NEWS['latest']
+    while k > 0 and len(page) < size:
+        if tId in (k % 10 + 1, 3 * k % 10 + 1):
+            page.append({
+                'id': k,
+                'title': 'Article %d' % k,
+                'sourceName': 'stand-in',
+                'newsUrl': 'http://standin/news/%d' % k,
+                'newsTime': time.strftime(
+                    '%Y-%m-%dT%H:%M:%S.000+0000',
+                    time.gmtime(1700000000 + 60 * k)),
+                'summary': '',
+            })
+        k -= 1
+    return page
+
+
+# bars: minute bars ending at BARS['end'] (or the request timestamp),
+# as many as the request counts but none before BARS['start'], so a
+# backfill paging backwards gets a short page and stops
+BARS = {'end': 1700000000, 'step': 60, 'start': 1700000000 - 60 * 50000}
+
+
+def bar_rows(count, end=None):
+    '''
+    `count` tickerChartDatas rows, newest first, the last one at or
+    before `end` on the minute grid; fewer when the history starts first
+    '''
+    end = BARS['end'] if end is None else min(end, BARS['end'])
+    steps = (end - BARS['start']) // BARS['step']
+    end = BARS['start'] + steps * BARS['step']
+    count = max(0, min(count, steps + 1))
+    rows = []
+    for k in range(count):
+        price = 100.0 + (k * 7919 % 1000) / 100.0
+        rows.append('%d,%.2f,%.2f,%.2f,%.2f,%.2f,%d,%.3f' % (
+            end - k * BARS['step'], price, price + 0.05, price + 0.25,
+            price - 0.25, price - 0.1, 1000 + k % 500, price + 0.01))
+    return rows
+
+
+def _bars(path, query):
+    params = parse_qs(query)
+    end = params.get('timestamp')
+    rows = bar_rows(int(params.get('count', ['1'])[0]),
+                    int(end[0]) if end else None)
+    return [{'tickerId': int(path.rsplit('/', 1)[-1]),
+             'timeZone': 'America/New_York', 'data': rows}]
+
+
+# account payload size, raise to benchmark bigger accounts
+ACCOUNT = {'positions': 20, 'orders': 20}
+
+
+def _positions():
+    return [{
+        'ticker': {'tickerId': t, 'symbol': 'T%d' % t},
+        'position': str(10 * t),
+        'costPrice': '100.00',
+        'lastPrice': '%.2f' % (100 + t % 7),
+        'marketValue': '%.2f' % (10 * t * (100 + t % 7)),
+        'unrealizedProfitLoss': '%.2f' % (10 * t * (t % 7)),
+    } for t in range(1, ACCOUNT['positions'] + 1)]
+
+
+def _open_orders():
+    return [{
+        'orderId': 'O%d' % k,
+        'ticker': {'tickerId': k, 'symbol': 'T%d' % k},
+        'action': 'BUY' if k % 2 else 'SELL',
+        'orderType': 'LMT',
+        'timeInForce': 'GTC',
+        'lmtPrice': '%.2f' % (90 + k % 20),
+        'totalQuantity': '10',
+        'filledQuantity': '0',
+        'statusStr': 'Working',
+    } for k in range(1, ACCOUNT['orders'] + 1)]
+
+
+def _account():
+    return {
+        'accountMembers': [
+            {'key': 'totalMarketValue', 'value': '100000.00'},
+            {'key': 'cashBalance', 'value': '50000.00'},
+            {'key': 'dayBuyingPower', 'value': '200000.00'},
+        ],
+        'positions': _positions(),
+        'openOrders': _open_orders(),
+    }
+
+
+def _paper_account():
+    return {
+        'id': 1,
+        'netLiquidation': '150000.00',
+        'totalMarketValue': '100000.00',
+        'usableCash': '50000.00',
+        'positions': _positions(),
+        'openOrders': _open_orders(),
+    }
+
+
+# order history: order k is placed at 1700000000 + 3600 k, the last
+# ORDERS['working'] are still working; raise ORDERS['count'] to place more
+ORDERS = {'count': 200, 'working': 5}
+
+
+def _history_order(k):
+    working = k > ORDERS['count'] - ORDERS['working']
+    status = 'Working' if working else ('Filled' if k % 2 else 'Cancelled')
+    created = (1700000000 + 3600 * k) * 1000
+    order = {
+        'orderId': 'H%d' % k,
+        'ticker': {'tickerId': k % 10 + 1, 'symbol': 'T%d' % (k % 10 + 1)},
+        'action': 'BUY' if k % 3 else 'SELL',
+        'orderType': 'LMT',
+        'statusStr': status,
+        'totalQuantity': '10',
+        'filledQuantity': '10' if status == 'Filled' else '0',
+        'lmtPrice': '%.2f' % (90 + k % 20),
+        'createTime0': created,
+        'updateTime0': created + 60000,
+    }
+    if status == 'Filled':
+        order['avgFilledPrice'] = order['lmtPrice']
+        order['filledTime0'] = created + 60000
+    return order
+
+
+def _history(query):
+    start = parse_qs(query).get('startTime', ['1970-0-1'])[0]
+    try:
+        since = time.mktime(time.strptime(start, '%Y-%m-%d')) - time.timezone
+    except ValueError:
+        since = 0
+    return [{'orders': [_history_order(k)]}
+            for k in range(ORDERS['count'], 0, -1)
+            if 1700000000 + 3600 * k >= since]
+
+
+def _dividends():
+    return {'dividendList': [{
+        'ticker': {'tickerId': t, 'symbol': 'T%d' % t},
+        'dividendAmount': '%.2f' % (0.1 * t),
+        'position': '10',
+        'exDate': '2024-0%d-01' % t,
+        'payDate': '2024-0%d-15' % t,
+        'status': 'Paid',
+    } for t in range(1, 4)]}
+
+
+def _order(body):
+    order = json.loads(body or b'{}')
+    return {'orderId': 'O' + str(order.get('serialId', ''))[:8]}
+
+
+ROUTES = [
+    # (method, path fragment, handler(path, query, body) -> json object)
+    ('POST', '/trade/login',
+     lambda path, query, body: {'success': True,
+                                'data': {'tradeToken': 'standin'}}),
+    ('POST', '/passport/login/account',
+     lambda path, query, body: {'data': _tokens()}),
+    ('POST', '/passport/refreshToken',
+     lambda path, query, body: _tokens()),
+    ('GET', '/account/getSecAccountList/',
+     lambda path, query, body: {'success': True,
+                                'data': [{'secAccountId': 1}]}),
+    ('GET', '/v2/home/', lambda path, query, body: _account()),
+    ('GET', '/v2/option/list', lambda path, query, body: _history(query)),
+    ('POST', '/dividends', lambda path, query, body: _dividends()),
+    ('GET', '/myaccounts/true', lambda path, query, body: [{'id': 1}]),
+    ('GET', '/paper/1/acc/', lambda path, query, body: _paper_account()),
+    ('GET', '/search/tickers5',
+     lambda path, query, body: {'list': [{'tickerId': 913256135}]}),
+    ('GET', '/quote/option/query/list',
+     lambda path, query, body: _option_quotes(query)),
+    ('GET', '/quote/option/', lambda path, query, body: _options(query)),
+    ('GET', '/quote/tickerChartDatas/v5/',
+     lambda path, query, body: _bars(path, query)),
+    ('GET', '/quote/tickerRealTimes/v5/',
+     lambda path, query, body: _quote(path.rsplit('/', 1)[-1])),
+    ('GET', '/information/news/v5/tickerNews/',
+     lambda path, query, body: _news(path, query)),
+    ('POST', '/wlas/screener/ng/query',
+     lambda path, query, body: _screener(body)),
+    ('POST', '/placeStockOrder', lambda path, query, body: _order(body)),
+    ('POST', '/orderop/place/', lambda path, query, body: _order(body)),
+    ('POST', '/cancelStockOrder/',
+     lambda path, query, body: {'success': True}),
+    ('POST', '/orderop/modify/', lambda path, query, body: {}),
+    ('POST', '/orderop/cancel/', lambda path, query, body: {}),
+]
+
+
+class _Throttle():
+    '''
+    server side token bucket: over `rate` requests per second the stand-in
+    answers 429, like the real hosts under load
+    '''
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            self.rejected += 1
+            return False
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    '''
+    Answers the Webull routes in ROUTES with canned json. Urls(root=...) puts
+    the real host name in front of the path, so only the suffix is matched.
+    '''
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real hosts
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, method):
+        parts = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        throttle = self.server.throttle
+        if throttle is not None and not throttle.allow():
+            payload = b'{"success": false, "code": "too many requests"}'
+            self.send_response(429)
+            self.send_header('Retry-After', '1')
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        for route_method, fragment, handler in self.server.routes:
+            if route_method == method and fragment in parts.path:
+                payload = json.dumps(
+                    handler(parts.path, parts.query, body)).encode('utf-8')
+                self.send_response(200)
+                break
+        else:
+            payload = b'{"success": false}'
+            self.send_response(404)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._reply('GET')
+
+    def do_POST(self):
+        self._reply('POST')
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # concurrent clients open many connections
+
+
+class StandInServer():
+    '''
+    Local stand-in for the Webull hosts, runs in a background thread.
+        with StandInServer(latency=0.001) as server:
+            api = WeBullApi(urls=Urls(root=server.root))
+    '''
+
+    def __init__(self,
+                 host='127.0.0.1',
+                 port=0,
+                 latency=0.0,
+                 routes=None,
+                 rate_limit=None):
+        '''
+        rate_limit: requests per second before the server answers 429
+        '''
+        self.httpd = _Server((host, port), StandInHandler)
+        self.httpd.latency = latency
+        self.httpd.routes = list(routes or ROUTES)
+        self.httpd.throttle = _Throttle(rate_limit) if rate_limit else None
+        self.thread = None
+
+    @property
+    def root(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def webull_topic_match(topic_filter, topic):
+    '''
+    Webull subscribes with a json filter listing tickerIds and types and
+    publishes on a json topic naming one tickerId and type
+    '''
+    try:
+        wanted, got = json.loads(topic_filter), json.loads(topic)
+    except ValueError:
+        return topic_filter == topic
+    types = str(wanted.get('type', '')).split(',')
+    return (int(got.get('tickerId', 0)) in wanted.get('tickerIds', [])
+            and str(got.get('type')) in types)
+
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        byte, n = n % 128, n // 128
+        out.append(byte | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+def _string(data):
+    return struct.pack('!H', len(data)) + data
+
+
+class _MqttSession(socketserver.BaseRequestHandler):
+    '''
+    just enough MQTT 3.1.1 for the streaming client: CONNECT, SUBSCRIBE,
+    UNSUBSCRIBE, PINGREQ, DISCONNECT, and QoS 0 PUBLISH towards the client
+    '''
+
+    def setup(self):
+        self.filters = set()
+        self.send_lock = threading.Lock()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _read(self, n):
+        data = b''
+        while len(data) < n:
+            chunk = self.request.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def send(self, packet_type, body):
+        with self.send_lock:
+            self.request.sendall(bytes([packet_type]) + _varint(len(body)) +
+                                 body)
+
+    def handle(self):
+        broker = self.server.broker
+        try:
+            while True:
+                header = self._read(1)[0]
+                length, shift = 0, 0
+                while True:
+                    byte = self._read(1)[0]
+                    length += (byte & 0x7f) << shift
+                    shift += 7
+                    if not byte & 0x80:
+                        break
+                body = self._read(length)
+                kind = header >> 4
+                if kind == 1:  # CONNECT
+                    broker._add(self)
+                    self.send(0x20, b'\x00\x00')
+                elif kind == 8:  # SUBSCRIBE
+                    pid, pos, granted = body[:2], 2, b''
+                    while pos < len(body):
+                        size = struct.unpack('!H', body[pos:pos + 2])[0]
+                        self.filters.add(body[pos + 2:pos + 2 + size].decode())
+                        pos += size + 3
+                        granted += b'\x00'
+                    self.send(0x90, pid + granted)
+                elif kind == 10:  # UNSUBSCRIBE
+                    pid, pos = body[:2], 2
+                    while pos < len(body):
+                        size = struct.unpack('!H', body[pos:pos + 2])[0]
+                        self.filters.discard(
+                            body[pos + 2:pos + 2 + size].decode())
+                        pos += size + 2
+                    self.send(0xb0, pid)
+                elif kind == 12:  # PINGREQ
+                    self.send(0xd0, b'')
+                elif kind == 14:  # DISCONNECT
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            broker._remove(self)
+
+    def publish(self, topic, payload):
+        if any(self.server.broker.match(f, topic) for f in self.filters):
+            self.send(0x30, _string(topic.encode()) + payload)
+
+
+class _MqttServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class StandInBroker():
+    '''
+    local MQTT broker stand-in for streaming.QuoteStream
+
+        with StandInBroker() as broker:
+            stream = QuoteStream(did, host=broker.host, port=broker.port,
+                                 transport='tcp', tls=False)
+            broker.publish({'tickerId': 1, 'type': '105'}, {'close': '1'})
+    '''
+
+    def __init__(self, host='127.0.0.1', port=0, match=webull_topic_match):
+        self.server = _MqttServer((host, port), _MqttSession)
+        self.server.broker = self
+        self.match = match
+        self.sessions = set()
+        self._lock = threading.Lock()
+
+    @property
+    def host(self):
+        return self.server.server_address[0]
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def _add(self, session):
+        with self._lock:
+            self.sessions.add(session)
+
+    def _remove(self, session):
+        with self._lock:
+            self.sessions.discard(session)
+
+    def subscriptions(self):
+        with self._lock:
+            return [f for s in self.sessions for f in s.filters]
+
+    def publish(self, topic, payload):
+        '''
+        topic / payload may be dicts, they are sent as json
+        '''
+        if not isinstance(topic, str):
+            topic = json.dumps(topic)
+        if not isinstance(payload, bytes):
+            payload = json.dumps(payload).encode('utf-8')
+        with self._lock:
+            sessions = list(self.sessions)
+        for session in sessions:
+            try:
+                session.publish(topic, payload)
+            except OSError:
+                pass
+
+    def drop_clients(self):
+        '''
+        cut every connection, to exercise reconnects
+        '''
+        with self._lock:
+            sessions = list(self.sessions)
+        for session in sessions:
+            try:
+                session.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    server = StandInServer(port=8765)
+    print('serving on', server.root)
+    server.httpd.serve_forever()
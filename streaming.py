@@ -0,0 +1,233 @@
+import asyncio
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+import paho.mqtt.client as mqtt
+
+from endpoints import Urls
+from quotes import quotes_frame
+
+# push message types of the Webull MQTT feed
+QUOTE = '105'
+TRADE = '102'
+
+
+def topic_for(tIds, types, did, access_token):
+    '''
+    Webull subscribes by publishing a json document as the topic filter
+    '''
+    return json.dumps({
+        'tickerIds': [int(t) for t in tIds],
+        'type': ','.join(types),
+        'header': {
+            'app': 'stocks',
+            'did': did,
+            'access_token': access_token
+        }
+    }, separators=(',', ':'))
+
+
+def _offer(queue, update):
+    '''
+    put on a bounded asyncio queue, dropping the oldest item when full
+    '''
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(update)
+
+
+class QuoteStream():
+    '''
+    push quotes over the Webull MQTT web socket instead of polling get_quote
+
+        stream = QuoteStream.from_api(api)
+        stream.add_listener(lambda tId, kind, data: print(tId, data))
+        stream.start()
+        stream.subscribe([913256135])
+        stream.latest[913256135]      # last merged quote, no network
+
+    the connection is re-established by paho after a drop and every
+    subscription is sent again on connect
+    '''
+
+    def __init__(self,
+                 did,
+                 access_token='',
+                 url=None,
+                 types=(QUOTE, TRADE),
+                 keepalive=30,
+                 host=None,
+                 port=None,
+                 transport=None,
+                 tls=None):
+        '''
+        params:
+            access_token: the token, or a callable returning the current
+                one, read again every time topics are (re)subscribed
+            url: ws(s):// or tcp:// url of the broker, Urls().stream() default
+            host/port/transport/tls: override what the url implies, e.g.
+                host='127.0.0.1', port=1883, transport='tcp' for a local
+                stand-in broker
+            types: push message types to subscribe for every ticker
+        '''
+        parts = urlsplit(url or Urls().stream())
+        secure = parts.scheme in ('wss', 'ssl', 'mqtts')
+        self.host = host or parts.hostname
+        self.port = port or parts.port or (443 if secure else 1883)
+        self.transport = transport or (
+            'websockets' if parts.scheme in ('ws', 'wss') else 'tcp')
+        self.did = did
+        self.access_token = access_token
+        self._subscribed = {}  # tickerId -> topic sent to the broker
+        self.types = tuple(types)
+        self.keepalive = keepalive
+        self.tickers = set()
+        self.latest = {}
+        self.updated = {}
+        self.listeners = []
+        self._queues = []
+        self._lock = threading.Lock()
+        self.connected = threading.Event()
+
+        if hasattr(mqtt, 'CallbackAPIVersion'):
+            self.client = mqtt.Client(
+                mqtt.CallbackAPIVersion.VERSION2,
+                client_id=did,
+                transport=self.transport)
+        else:
+            self.client = mqtt.Client(client_id=did, transport=self.transport)
+        if self.transport == 'websockets':
+            self.client.ws_set_options(path=parts.path or '/mqtt')
+        if tls if tls is not None else secure:
+            self.client.tls_set()
+        self.client.username_pw_set('test', password='test')
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+
+    @classmethod
+    def from_api(cls, api, **kwargs):
+        '''
+        stream with the api's tokens; reconnects pick up the token a
+        SessionManager refreshed in the meantime
+        '''
+        return cls(api.did, lambda: api.access_token, url=api.urls.stream(),
+                   **kwargs)
+
+    def start(self, timeout=None):
+        '''
+        connect in the background; with a timeout, wait for the connection
+        '''
+        self.client.connect_async(self.host, self.port, self.keepalive)
+        self.client.loop_start()
+        if timeout is not None:
+            return self.connected.wait(timeout)
+        return True
+
+    def stop(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def _token(self):
+        token = self.access_token
+        return token() if callable(token) else token
+
+    def _topics(self, tIds):
+        '''
+        one topic per ticker, so each can be unsubscribed on its own, built
+        with the current access token and remembered for unsubscribe
+        '''
+        token = self._token()
+        topics = []
+        with self._lock:
+            for t in tIds:
+                topic = topic_for([t], self.types, self.did, token)
+                self._subscribed[t] = topic
+                topics.append((topic, 0))
+        return topics
+
+    def subscribe(self, tIds):
+        tIds = [int(t) for t in tIds]
+        with self._lock:
+            self.tickers.update(tIds)
+        if self.connected.is_set() and tIds:
+            self.client.subscribe(self._topics(tIds))
+
+    def unsubscribe(self, tIds):
+        tIds = [int(t) for t in tIds]
+        with self._lock:
+            self.tickers.difference_update(tIds)
+            topics = [self._subscribed.pop(t) for t in tIds
+                      if t in self._subscribed]
+            for tId in tIds:
+                self.latest.pop(tId, None)
+                self.updated.pop(tId, None)
+        if self.connected.is_set() and topics:
+            self.client.unsubscribe(topics)
+
+    def add_listener(self, callback):
+        '''
+        callback(tickerId, type, data) on the network thread for every push
+        '''
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
+    async def updates(self, maxsize=0):
+        '''
+        async iterator of (tickerId, type, data) pushes; with a maxsize a
+        consumer that falls behind loses the oldest pushes, never the
+        network thread
+        '''
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize)
+        entry = (loop, queue)
+        self._queues.append(entry)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._queues.remove(entry)
+
+    def snapshot(self):
+        '''
+        DataFrame of the latest pushed quotes, same columns as get_quotes
+        '''
+        with self._lock:
+            return quotes_frame(dict(self.latest))
+
+    def _on_connect(self, client, userdata, flags, reason_code, *args):
+        if getattr(reason_code, 'is_failure', reason_code != 0):
+            return
+        self.connected.set()
+        with self._lock:
+            tIds = sorted(self.tickers)
+        if tIds:
+            client.subscribe(self._topics(tIds))
+
+    def _on_disconnect(self, client, userdata, *args):
+        self.connected.clear()
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            topic = json.loads(msg.topic)
+            data = json.loads(msg.payload)
+        except ValueError:
+            return
+        tId = int(topic.get('tickerId') or data.get('tickerId') or 0)
+        kind = str(topic.get('type', ''))
+        with self._lock:
+            if tId not in self.tickers:
+                return
+            quote = self.latest.setdefault(tId, {'tickerId': tId})
+            quote.update(data)
+            self.updated[tId] = time.time()
+        update = (tId, kind, data)
+        for callback in list(self.listeners):
+            callback(*update)
+        for loop, queue in list(self._queues):
+            loop.call_soon_threadsafe(_offer, queue, update)
@@ -0,0 +1,28 @@
+import threading
+
+from account import AccountCache
+
+
+def test_invalidate_during_a_refresh_forces_the_next_fetch():
+    calls = []
+    entered = threading.Event()
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        if len(calls) == 1:
+            entered.set()
+            release.wait(5)
+        return {'positions': [], 'openOrders': [], 'accountMembers': []}
+
+    cache = AccountCache(fetch, ttl=60)
+    thread = threading.Thread(target=cache.get)
+    thread.start()
+    entered.wait(5)
+    cache.invalidate()
+    release.set()
+    thread.join()
+    cache.get()
+    assert len(calls) == 2
+    cache.get()
+    assert len(calls) == 2
@@ -0,0 +1,55 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from bar_store import COLUMNS, BarStore, ColumnStore
+
+
+def session_minutes(start, end):
+    '''
+    epoch seconds of every 09:30-15:59 New York minute between two dates
+    '''
+    index = pd.date_range(start, end + ' 23:59', freq='min',
+                          tz='America/New_York')
+    minutes = index.hour * 60 + index.minute
+    index = index[(minutes >= 9 * 60 + 30) & (minutes < 16 * 60)]
+    return index.tz_convert('UTC').tz_localize(None).values.astype(
+        'datetime64[s]').astype('int64')
+
+
+def columns(ts):
+    return {c: ts if c == 'timestamp' else np.arange(len(ts), dtype='float64')
+            for c in COLUMNS}
+
+
+def test_read_date_only_bounds_cover_the_new_york_day(tmp_path):
+    store = BarStore(str(tmp_path))
+    store.store(1, 'm1').merge(columns(session_minutes('2023-11-13',
+                                                       '2023-11-15')))
+    df = store.read(1, start='2023-11-14', end='2023-11-14')
+    assert len(df) == 390
+    assert str(df.index[0]) == '2023-11-14 09:30:00-05:00'
+    assert str(df.index[-1]) == '2023-11-14 15:59:00-05:00'
+    day = datetime.date(2023, 11, 14)
+    assert len(store.read(1, start=day, end=day)) == 390
+
+
+def test_read_naive_times_are_exchange_wall_time(tmp_path):
+    store = BarStore(str(tmp_path))
+    store.store(1, 'm1').merge(columns(session_minutes('2023-11-14',
+                                                       '2023-11-14')))
+    df = store.read(1, start='2023-11-14 10:00', end='2023-11-14 10:09')
+    assert len(df) == 10
+    assert str(df.index[0]) == '2023-11-14 10:00:00-05:00'
+
+
+def test_merge_replaces_rows_from_the_first_new_key(tmp_path):
+    store = ColumnStore(str(tmp_path))
+    store.merge({'timestamp': np.array([1, 2, 3]),
+                 'close': np.array([1.0, 2.0, 3.0])})
+    store.merge({'timestamp': np.array([3, 4]),
+                 'close': np.array([30.0, 40.0])})
+    cols = store.read(mmap=False)
+    assert cols['timestamp'].tolist() == [1, 2, 3, 4]
+    assert cols['close'].tolist() == [1.0, 2.0, 30.0, 40.0]
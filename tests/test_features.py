@@ -0,0 +1,23 @@
+import numpy as np
+
+from features import FeatureEngine
+
+
+def build(data):
+    engine = FeatureEngine(data, capacity=4)
+    engine.lag('Close', 1)
+    engine.diff('Close', 2)
+    engine.rolling('Close', 5, 'std')
+    return engine
+
+
+def test_extend_matches_a_full_recompute():
+    rng = np.random.default_rng(0)
+    close = 100 + rng.standard_normal(50).cumsum()
+    incremental = build({'Close': close[:20]})
+    incremental.extend({'Close': close[20:45]})
+    for value in close[45:]:
+        incremental.append({'Close': value})
+    full = build({'Close': close})
+    np.testing.assert_allclose(incremental.frame().to_numpy(),
+                               full.frame().to_numpy(), equal_nan=True)
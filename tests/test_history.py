@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from history import CachedHistory
+
+
+class AdjustingSource():
+    '''
+    yfinance-like source: prices of the whole history are divided by the
+    split ratio once a split happened
+    '''
+
+    def __init__(self, days):
+        self.days = days
+        self.ratio = 1.0
+        self.calls = []
+
+    def fetch(self, ticker, start=None):
+        self.calls.append(start)
+        prices = (100.0 + np.arange(len(self.days))) / self.ratio
+        frame = pd.DataFrame({'Date': self.days, 'Open': prices,
+                              'High': prices, 'Low': prices,
+                              'Close': prices, 'Volume': 1000.0})
+        if start is not None:
+            frame = frame[frame['Date'] >= pd.Timestamp(start)]
+        return frame.reset_index(drop=True)
+
+
+def test_incremental_refresh_appends_new_days(tmp_path):
+    source = AdjustingSource(pd.bdate_range('2024-01-01', periods=10))
+    history = CachedHistory(source, root=str(tmp_path))
+    assert history.refresh('X') == 10
+    source.days = pd.bdate_range('2024-01-01', periods=12)
+    history.refresh('X')
+    assert source.calls[-1] is not None
+    df = history.load('X')
+    assert len(df) == 12
+    assert df['Close'].tolist() == (100.0 + np.arange(12)).tolist()
+
+
+def test_refresh_across_a_split_rebuilds_the_cache(tmp_path):
+    source = AdjustingSource(pd.bdate_range('2024-01-01', periods=10))
+    history = CachedHistory(source, root=str(tmp_path))
+    history.refresh('X')
+    source.days = pd.bdate_range('2024-01-01', periods=12)
+    source.ratio = 2.0
+    history.refresh('X')
+    assert source.calls[-1] is None
+    df = history.load('X')
+    assert len(df) == 12
+    # every row on the post-split basis, no jump at the old last day
+    assert df['Close'].tolist() == ((100.0 + np.arange(12)) / 2).tolist()
@@ -0,0 +1,60 @@
+import time
+
+from order_store import OrderStore, OrderSync
+
+DAY = 86400.0
+
+
+def order(orderId, status, created):
+    return {'orderId': orderId, 'statusStr': status, 'action': 'BUY',
+            'orderType': 'LMT', 'totalQuantity': '1', 'filledQuantity':
+            '1' if status == 'Filled' else '0',
+            'ticker': {'tickerId': 913256135, 'symbol': 'AAPL'},
+            'createTime0': int(created * 1000),
+            'updateTime0': int(created * 1000)}
+
+
+class History():
+    def __init__(self, orders):
+        self.orders = orders
+        self.start_times = []
+
+    def get_history_orders(self, status='All', start_time=None):
+        self.start_times.append(start_time)
+        return self.orders
+
+    def get_dividends(self):
+        return {'dividendList': []}
+
+
+def test_expired_order_does_not_pin_the_sync_cursor(tmp_path):
+    now = time.time()
+    api = History([order('1', 'Expired', now - 100 * DAY),
+                   order('2', 'Rejected', now - 90 * DAY),
+                   order('3', 'Filled', now - DAY)])
+    sync = OrderSync(api, OrderStore(str(tmp_path / 'orders.db')))
+    assert sync.sync_orders() == 3
+    assert sync.store.oldest_open() is None
+    # from the day before the newest update, not from the expired order
+    expected = time.strftime('%Y-%m-%d', time.gmtime(now - 2 * DAY))
+    assert sync.start_time() == expected
+
+
+def test_working_order_keeps_the_cursor_back(tmp_path):
+    now = time.time()
+    api = History([order('1', 'Working', now - 10 * DAY),
+                   order('2', 'Filled', now - DAY)])
+    sync = OrderSync(api, OrderStore(str(tmp_path / 'orders.db')))
+    sync.sync_orders()
+    expected = time.strftime('%Y-%m-%d', time.gmtime(now - 11 * DAY))
+    assert sync.start_time() == expected
+
+
+def test_status_changes_are_upserted(tmp_path):
+    store = OrderStore(str(tmp_path / 'orders.db'))
+    now = time.time()
+    assert store.add_orders([order('1', 'Working', now)]) == 1
+    assert store.add_orders([order('1', 'Working', now)]) == 0
+    assert store.add_orders([order('1', 'Filled', now)]) == 1
+    assert store.orders(as_frame=False)[0]['status'] == 'Filled'
+    assert len(store.fills(as_frame=False)) == 1
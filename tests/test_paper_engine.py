@@ -0,0 +1,28 @@
+import pytest
+
+from paper_engine import PaperEngine
+
+
+def test_limit_orders_fill_when_a_bar_crosses():
+    engine = PaperEngine(cash=10000.0)
+    buy = engine.place_order(tId=1, price=99.0, action='BUY', quant=10)
+    engine.place_order(tId=1, price=120.0, action='SELL', quant=5)
+    assert len(engine.on_bar(1, 100.0, 101.0, 98.0, 100.5)) == 1
+    filled = engine.get_history_orders('Filled')
+    assert [o['orderId'] for o in filled] == [buy['orderId']]
+    assert float(filled[0]['avgFilledPrice']) == 99.0
+    assert len(engine.get_current_orders()) == 1
+
+
+def test_serial_id_is_idempotent():
+    engine = PaperEngine()
+    first = engine.place_order(tId=1, price=1.0, quant=1, serialId='s1')
+    again = engine.place_order(tId=1, price=1.0, quant=1, serialId='s1')
+    assert first == again
+    assert len(engine.get_current_orders()) == 1
+
+
+def test_empty_orders_are_rejected():
+    engine = PaperEngine()
+    with pytest.raises(ValueError):
+        engine.place_order(tId=1, price=1.0, quant=0)
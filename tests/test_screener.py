@@ -0,0 +1,18 @@
+from screener import screener_batch
+
+
+def test_numpy_strings_are_not_truncated():
+    name = 'A Very Long Company Name Holdings Incorporated Class A ' * 2
+    items = [{'ticker': {'tickerId': 1, 'symbol': 'LONGSYMBOL.WARRANTS',
+                         'name': name, 'close': '1.5'}},
+             {'ticker': {'tickerId': 2, 'symbol': 'A', 'name': None}}]
+    batch = screener_batch(items, as_numpy=True)
+    assert batch['symbol'].tolist() == ['LONGSYMBOL.WARRANTS', 'A']
+    assert batch['name'].tolist() == [name, '']
+    assert batch['close'][0] == 1.5
+
+
+def test_empty_page():
+    batch = screener_batch([], as_numpy=True)
+    assert len(batch['tickerId']) == 0
+    assert len(batch['symbol']) == 0
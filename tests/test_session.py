@@ -0,0 +1,51 @@
+import threading
+import time
+
+from session import SessionManager
+
+
+def expire_in(seconds):
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000+0000',
+                         time.gmtime(time.time() + seconds))
+
+
+class Api():
+    def __init__(self):
+        self.token_expire = expire_in(10)
+        self.refreshes = 0
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def refresh_login(self):
+        self.refreshes += 1
+        self.entered.set()
+        self.release.wait(5)
+        self.token_expire = expire_in(3600)
+        return True
+
+
+def test_concurrent_refreshes_share_one_refresh_login(tmp_path):
+    api = Api()
+    manager = SessionManager(api, str(tmp_path / 'session.json'), margin=60)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        manager.ensure_fresh())) for _ in range(8)]
+    threads[0].start()
+    api.entered.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    api.release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [True] * 8
+    assert api.refreshes == 1
+
+
+def test_refresh_after_another_thread_refreshed_returns_early(tmp_path):
+    api = Api()
+    api.release.set()
+    manager = SessionManager(api, str(tmp_path / 'session.json'), margin=60)
+    assert manager.refresh()
+    # a caller that saw the old expiry before the first refresh finished
+    assert manager.refresh()
+    assert api.refreshes == 1
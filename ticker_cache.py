@@ -0,0 +1,196 @@
+import dbm
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def cache_dir():
+    '''
+    per user cache directory ($XDG_CACHE_HOME/webull, ~/.cache/webull or
+    %LOCALAPPDATA%\\webull)
+    '''
+    base = (os.environ.get('XDG_CACHE_HOME') or os.environ.get('LOCALAPPDATA')
+            or os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'webull')
+
+
+def default_path(root=None):
+    '''
+    dbm file of the ids resolved against the real hosts; ids resolved
+    against a Urls root (a stand-in server) go to a file of their own
+    '''
+    name = 'tickers.db' if root is None else 'tickers-rerouted.db'
+    return os.path.join(cache_dir(), name)
+
+
+class TickerCache():
+    '''
+    symbol -> tickerId resolution cache
+    an in-memory LRU sits in front of an on-disk dbm file, so ids survive
+    restarts and are shared by every api object in the process that talks
+    to the same hosts
+    '''
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path='', ttl=7 * 24 * 3600, maxsize=4096, root=None):
+        '''
+        params:
+            path: dbm file for the persistent layer, default_path(root)
+                when empty, None for memory only
+            root: Urls root the ids are resolved against, part of every
+                key so one file never answers for another host
+            ttl: seconds an id is trusted before it is looked up again
+            maxsize: entries kept in the in-memory LRU
+        '''
+        self.path = default_path(root) if path == '' else path
+        self.root = root
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._lock = threading.RLock()
+        self._db = None
+
+    @classmethod
+    def shared(cls, root=None):
+        '''
+        process wide default instance used by WeBullApi / PaperApi, one
+        per Urls root
+        '''
+        with cls._shared_lock:
+            if root not in cls._shared:
+                cls._shared[root] = cls(root=root)
+            return cls._shared[root]
+
+    def _key(self, symbol):
+        key = str(symbol).strip().upper()
+        return key if self.root is None else f'{self.root.rstrip("/")} {key}'
+
+    def _disk(self):
+        if self._db is None and self.path is not None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._db = dbm.open(self.path, 'c')
+        return self._db
+
+    def _remember(self, key, entry):
+        self._lru[key] = entry
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+
+    def get(self, symbol):
+        '''
+        cached tickerId or None when unknown / expired
+        '''
+        key = self._key(symbol)
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None:
+                db = self._disk()
+                raw = db.get(key) if db is not None else None
+                if raw is not None:
+                    entry = tuple(json.loads(raw))
+                    self._remember(key, entry)
+            else:
+                self._lru.move_to_end(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def cached(self, symbol):
+        '''
+        tickerId from the in-memory LRU only, None on a miss there; never
+        touches the dbm file, so it is safe on an event loop
+        '''
+        key = self._key(symbol)
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None or time.time() - entry[1] >= self.ttl:
+                return None
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, symbol, ticker_id):
+        key = self._key(symbol)
+        entry = (ticker_id, time.time())
+        with self._lock:
+            self._remember(key, entry)
+            db = self._disk()
+            if db is not None:
+                db[key] = json.dumps(entry)
+
+    def invalidate(self, symbol=None):
+        '''
+        drop one symbol, or everything when symbol is None
+        '''
+        with self._lock:
+            db = self._disk()
+            if symbol is None:
+                self._lru.clear()
+                if db is not None:
+                    prefix = self._key('').encode('utf-8')
+                    for key in list(db.keys()):
+                        if key.startswith(prefix):
+                            del db[key]
+                return
+            key = self._key(symbol)
+            self._lru.pop(key, None)
+            if db is not None and key in db:
+                del db[key]
+
+    def resolve(self, symbol, lookup):
+        '''
+        cached id, else lookup(symbol) and remember a non-zero result
+        '''
+        ticker_id = self.get(symbol)
+        if ticker_id is None:
+            ticker_id = lookup(symbol)
+            if ticker_id:
+                self.put(symbol, ticker_id)
+        return ticker_id
+
+    def warm(self, symbols, lookup, max_workers=16):
+        '''
+        resolve a whole universe at startup, misses are looked up concurrently
+        returns {symbol: tickerId}
+        '''
+        symbols = list(dict.fromkeys(symbols))
+        result = {}
+        missing = []
+        for symbol in symbols:
+            ticker_id = self.get(symbol)
+            if ticker_id is None:
+                missing.append(symbol)
+            else:
+                result[symbol] = ticker_id
+        if missing:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                for symbol, ticker_id in zip(missing,
+                                             pool.map(lookup, missing)):
+                    if ticker_id:
+                        self.put(symbol, ticker_id)
+                    result[symbol] = ticker_id
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._lru),
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,147 @@
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import Metrics
+from ratelimit import RateLimiter, backoff
+
+
+class Transport():
+    '''
+    Shared HTTP transport for all Webull hosts.
+    One requests session with a keep-alive connection pool per host, a default
+    timeout on every call and retries on connection errors / throttling.
+    Calls are paced per base url by a RateLimiter that learns how fast each
+    host may be called; orders never queue behind other calls to a host.
+    '''
+
+    def __init__(self,
+                 pool_connections=16,
+                 pool_maxsize=32,
+                 timeout=(3.05, 10),
+                 retries=2,
+                 backoff_factor=0.2,
+                 retry_on=(429, 502, 503, 504),
+                 metrics=None,
+                 limiter=None):
+        '''
+        params:
+            pool_connections: number of hosts to keep pools for
+            pool_maxsize: max idle keep-alive connections per host
+            timeout: (connect, read) seconds used when a call gives none
+            retries: retries on connect errors and retry_on status codes
+            backoff_factor: base of the jittered exponential backoff
+            metrics: Metrics to record into, the shared one by default
+            limiter: RateLimiter, the shared one by default; False disables
+        '''
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.retry_on = frozenset(retry_on)
+        self.metrics = metrics or Metrics.shared()
+        self.limiter = (RateLimiter.shared() if limiter is None else
+                        limiter or None)
+        self.session = requests.session()
+        # requests sends its own User-Agent/Accept; the api sets the rest
+        self.session.headers['Connection'] = 'keep-alive'
+        # urllib3 only replays failed connects, where nothing was sent;
+        # status retries are paced by request() through the limiter
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=0,
+            backoff_factor=backoff_factor,
+            raise_on_status=False)
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry,
+            pool_block=False)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+    def request(self, method, url, endpoint=None, **kwargs):
+        '''
+        endpoint: Urls method name the call is recorded under in metrics
+
+        GET/HEAD answered with a retry_on status are sent again after
+        Retry-After or a jittered backoff. orders are not idempotent, so
+        other methods get the throttled response back
+        '''
+        kwargs.setdefault('timeout', self.timeout)
+        limiter = self.limiter
+        retry = method.upper() in ('GET', 'HEAD')
+        attempt = 0
+        while True:
+            if limiter is not None:
+                waited = limiter.acquire(url, endpoint)
+                if waited > 0:
+                    self.metrics.observe(endpoint, 'throttle', waited)
+            response = self._send(method, url, endpoint, **kwargs)
+            pause = None
+            if limiter is not None:
+                pause = limiter.feedback(url, response.status_code,
+                                         response.headers.get('Retry-After'))
+            if not (retry and response.status_code in self.retry_on
+                    and attempt < self.retries):
+                return response
+            response.close()
+            time.sleep(pause if pause is not None else backoff(
+                attempt, self.backoff_factor))
+            attempt += 1
+
+    def _send(self, method, url, endpoint, **kwargs):
+        metrics = self.metrics
+        if not metrics.enabled:
+            return self.session.request(method, url, **kwargs)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            metrics.observe(endpoint, 'request', time.perf_counter() - start,
+                            error=True)
+            raise
+        body = response.request.body
+        metrics.observe(
+            endpoint,
+            'request',
+            time.perf_counter() - start,
+            error=response.status_code >= 400,
+            bytes_in=len(response.content),
+            bytes_out=len(body) if body else 0)
+        decode = response.json
+
+        def timed_json(**kw):
+            with metrics.timer(endpoint, 'decode'):
+                return decode(**kw)
+
+        response.json = timed_json
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def warm_up(self, urls):
+        '''
+        open one keep-alive connection to each distinct host ahead of the
+        first real call, so it does not pay for the TCP+TLS handshake
+        '''
+        hosts = {}
+        for url in urls:
+            parts = urlsplit(url)
+            hosts[parts.netloc] = f'{parts.scheme}://{parts.netloc}/'
+        for url in hosts.values():
+            try:
+                self.session.head(url, timeout=self.timeout)
+            except requests.RequestException:
+                pass
+
+    def close(self):
+        self.session.close()
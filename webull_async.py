@@ -0,0 +1,718 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+
+import aiohttp
+
+from endpoints import Urls
+from metrics import Metrics
+from ratelimit import RateLimiter, backoff
+from session import SessionManager
+from ticker_cache import TickerCache
+from webull_open import load_did
+
+
+class AsyncWeBullApi():
+    '''
+    asyncio mirror of WeBullApi, same method names and return values.
+    all calls share one aiohttp connection pool and at most `concurrency`
+    requests are in flight, so gathering N quotes costs about one round trip
+
+        async with AsyncWeBullApi() as api:
+            quotes = await asyncio.gather(*[api.get_quote(s) for s in names])
+    '''
+
+    def __init__(self,
+                 urls=None,
+                 ticker_cache=None,
+                 concurrency=64,
+                 limit_per_host=32,
+                 timeout=10,
+                 metrics=None,
+                 limiter=None,
+                 retries=2,
+                 retry_on=(429, 502, 503, 504),
+                 session_path=None,
+                 refresh_margin=300.0):
+        '''
+        urls: Urls instance, e.g. Urls(root=...) for a local stand-in server
+        concurrency: max requests in flight over the whole client
+        limit_per_host: max open connections per Webull host
+        timeout: total seconds per request
+        metrics: Metrics to record into, the shared one by default
+        limiter: RateLimiter pacing each base url, the shared one by
+            default (also used by the sync Transport); False disables
+        retries: GET retries on retry_on status codes, after Retry-After
+            or a jittered backoff
+        session_path: file to persist tokens in, restored here and kept
+            fresh by a background task once the client is opened
+        refresh_margin: seconds before token_expire the tokens are refreshed
+        '''
+        self.urls = urls or Urls()
+        self.ticker_cache = ticker_cache or TickerCache.shared(
+            self.urls.root)
+        self.concurrency = concurrency
+        self.metrics = metrics or Metrics.shared()
+        self.limiter = (RateLimiter.shared() if limiter is None else
+                        limiter or None)
+        self.retries = retries
+        self.retry_on = frozenset(retry_on)
+        self.limit_per_host = limit_per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+        self._semaphore = None
+        self._lookups = {}
+        self._trade_token_task = None
+        self.headers = {
+            "Accept": "*/*",
+            "Accept-Encoding": "gzip, deflate",
+            "Content-Type": "application/json",
+        }
+        self._did = None
+        self.access_token = ''
+        self.account_id = ''
+        self.refresh_token = ''
+        self.token_expire = ''
+        self.trade_token = ''
+        self.uuid = ''
+        self.trade_pin = ''
+        self.session_manager = None
+        self._restored = False
+        if session_path is not None:
+            self.session_manager = SessionManager(self, session_path,
+                                                  refresh_margin)
+            self._restored = self.session_manager.restore()
+
+    @property
+    def did(self):
+        if self._did is None:
+            self._did = load_did()
+        return self._did
+
+    @did.setter
+    def did(self, value):
+        self._did = value
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def open(self):
+        '''
+        create the shared connection pool, must run inside the event loop
+        '''
+        if self.session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=30)
+            self.session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            if self._restored:
+                self.session_manager.start_async()
+
+    def _session_changed(self):
+        if self.session_manager is not None:
+            self.session_manager.save()
+            self.session_manager.start_async()
+
+    async def _ensure_session(self):
+        if self.session_manager is not None:
+            await self.session_manager.ensure_fresh_async()
+
+    async def close(self):
+        if self.session_manager is not None:
+            self.session_manager.stop()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _send(self, method, url, endpoint, **kwargs):
+        '''
+        one request paced by the limiter, returns (status, body)
+        '''
+        limiter = self.limiter
+        retry = method == 'GET'
+        attempt = 0
+        while True:
+            if limiter is not None:
+                # wait for a slot before taking a concurrency slot
+                waited = await limiter.acquire_async(url, endpoint)
+                if waited > 0:
+                    self.metrics.observe(endpoint, 'throttle', waited)
+            status, headers, body = await self._send_once(
+                method, url, endpoint, **kwargs)
+            pause = None
+            if limiter is not None:
+                pause = limiter.feedback(url, status,
+                                         headers.get('Retry-After'))
+            if not (retry and status in self.retry_on
+                    and attempt < self.retries):
+                return status, body
+            await asyncio.sleep(pause if pause is not None else backoff(
+                attempt))
+            attempt += 1
+
+    async def _send_once(self, method, url, endpoint, **kwargs):
+        '''
+        one request under the concurrency limit
+        '''
+        await self.open()
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                async with self.session.request(method, url,
+                                                **kwargs) as resp:
+                    body = await resp.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self.metrics.observe(endpoint, 'request',
+                                     time.perf_counter() - start, error=True)
+                raise
+        self.metrics.observe(
+            endpoint,
+            'request',
+            time.perf_counter() - start,
+            error=resp.status >= 400,
+            bytes_in=len(body))
+        return resp.status, resp.headers, body
+
+    async def _request(self, method, url, endpoint=None, **kwargs):
+        '''
+        send one request, returns decoded json
+        '''
+        status, body = await self._send(method, url, endpoint, **kwargs)
+        with self.metrics.timer(endpoint, 'decode'):
+            return json.loads(body)
+
+    async def _get(self, url, **kwargs):
+        return await self._request('GET', url, **kwargs)
+
+    async def _post(self, url, **kwargs):
+        return await self._request('POST', url, **kwargs)
+
+    async def _ok(self, method, url, endpoint=None, **kwargs):
+        '''
+        like _request but only report whether the status was 2xx
+        '''
+        status, body = await self._send(method, url, endpoint, **kwargs)
+        return status < 400
+
+    def build_req_headers(self, include_trade_token=False, include_time=False):
+        '''
+        Build default set of header params
+        '''
+        headers = dict(self.headers)
+        headers['did'] = self.did
+        headers['access_token'] = self.access_token
+        if include_trade_token:
+            headers['t_token'] = self.trade_token
+        if include_time:
+            headers['t_time'] = str(round(time.time() * 1000))
+        return headers
+
+    async def _ensure_trade_token(self):
+        '''
+        the trade token, fetched once by the first trade call; trade calls
+        arriving meanwhile await the same request
+        '''
+        if not self.trade_token:
+            task = self._trade_token_task
+            if task is None or task.done():
+                task = self._trade_token_task = asyncio.ensure_future(
+                    self.get_trade_token(self.trade_pin))
+            await task
+        return self.trade_token
+
+    async def _trade_headers(self):
+        '''
+        build_req_headers with t_token and t_time, fetching the trade
+        token first if needed (build_req_headers itself cannot await)
+        '''
+        await self._ensure_trade_token()
+        return self.build_req_headers(include_trade_token=True,
+                                      include_time=True)
+
+    async def login(self, username='', password=''):
+        password = ('wl_app-a&b@!423^' + password).encode('utf-8')
+        md5_hash = hashlib.md5(password)
+        data = {
+            'account': username,
+            'accountType': 2,
+            'deviceId': self.did,
+            'pwd': md5_hash.hexdigest(),
+            'regionId': 13
+        }
+        result = await self._post(
+            self.urls.login(), json=data, headers=self.headers,
+            endpoint='login')
+        if 'data' in result and 'accessToken' in result['data']:
+            self.access_token = result['data']['accessToken']
+            self.refresh_token = result['data']['refreshToken']
+            self.token_expire = result['data']['tokenExpireTime']
+            self.uuid = result['data']['uuid']
+            await self.get_account_id()
+            self._session_changed()
+            return True
+        else:
+            return False
+
+    async def logout(self):
+        return await self._ok(
+            'GET', self.urls.logout(), headers=self.build_req_headers(),
+            endpoint='logout')
+
+    async def refresh_login(self):
+        data = {'refreshToken': self.refresh_token}
+        result = await self._post(
+            self.urls.refresh_login() + self.refresh_token,
+            json=data,
+            headers=self.build_req_headers(),
+            endpoint='refresh_login')
+        if 'accessToken' in result and result['accessToken'] != '' and result['refreshToken'] != '' and result['tokenExpireTime'] != '':
+            self.access_token = result['accessToken']
+            self.refresh_token = result['refreshToken']
+            self.token_expire = result['tokenExpireTime']
+            self._session_changed()
+            return True
+        else:
+            return False
+
+    async def get_detail(self):
+        return await self._get(
+            self.urls.user(), headers=self.build_req_headers(),
+            endpoint='user')
+
+    async def get_account_id(self):
+        result = await self._get(
+            self.urls.account_id(), headers=self.build_req_headers(),
+            endpoint='account_id')
+        if result['success']:
+            self.account_id = str(result['data'][0]['secAccountId'])
+            return True
+        else:
+            return False
+
+    async def get_account(self):
+        return await self._get(
+            self.urls.account(self.account_id),
+            headers=self.build_req_headers(),
+            endpoint='account')
+
+    async def get_positions(self):
+        return (await self.get_account())['positions']
+
+    async def get_portfolio(self):
+        data = await self.get_account()
+        return {item['key']: item['value'] for item in data['accountMembers']}
+
+    async def get_current_orders(self):
+        return (await self.get_account())['openOrders']
+
+    async def get_history_orders(self, status='Cancelled', start_time=None):
+        headers = await self._trade_headers()
+        url = (self.urls.orders(self.account_id) if start_time is None else
+               self.urls.orders(self.account_id, start_time))
+        return await self._get(
+            url + str(status), headers=headers, endpoint='orders')
+
+    async def get_trade_token(self, password=''):
+        password = ('wl_app-a&b@!423^' + password).encode('utf-8')
+        data = {'pwd': hashlib.md5(password).hexdigest()}
+        result = await self._post(
+            self.urls.trade_token(),
+            json=data,
+            headers=self.build_req_headers(),
+            endpoint='trade_token')
+        if result['success']:
+            self.trade_token = result['data']['tradeToken']
+            self._session_changed()
+            return True
+        else:
+            return False
+
+    async def get_ticker(self, stock=''):
+        '''
+        lookup ticker_id through the shared ticker cache, concurrent
+        lookups of the same symbol share one request. only the in-memory
+        LRU is read on the event loop, the dbm file is read and written on
+        the default executor
+        '''
+        ticker_id = self.ticker_cache.cached(stock)
+        if ticker_id is not None:
+            return ticker_id
+        key = str(stock).upper()
+        task = self._lookups.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._lookup_ticker(stock))
+            self._lookups[key] = task
+            task.add_done_callback(lambda _: self._lookups.pop(key, None))
+        return await task
+
+    async def _lookup_ticker(self, stock):
+        loop = asyncio.get_running_loop()
+        ticker_id = await loop.run_in_executor(None, self.ticker_cache.get,
+                                               stock)
+        if ticker_id is not None:
+            return ticker_id
+        result = await self._get(
+            self.urls.stock_id(stock), endpoint='stock_id')
+        ticker_id = 0
+        if len(result['list']) == 1:
+            for item in result['list']:
+                ticker_id = item['tickerId']
+        if ticker_id:
+            await loop.run_in_executor(None, self.ticker_cache.put, stock,
+                                       ticker_id)
+        return ticker_id
+
+    async def warm_tickers(self, stocks):
+        '''
+        resolve a universe of symbols concurrently, returns {symbol: id}
+        '''
+        stocks = list(dict.fromkeys(stocks))
+        ids = await asyncio.gather(*[self.get_ticker(s) for s in stocks])
+        return dict(zip(stocks, ids))
+
+    async def _resolve(self, stock, tId):
+        if tId is not None:
+            return tId
+        elif stock is not None:
+            return await self.get_ticker(stock)
+        raise ValueError('Must provide a stock symbol or a stock id')
+
+    async def place_order(self,
+                          stock='',
+                          price=0,
+                          action='BUY',
+                          orderType='LMT',
+                          enforce='GTC',
+                          quant=0,
+                          tId=None,
+                          serialId=None):
+        '''
+        see WeBullApi.place_order
+        tId: ticker id, skips the symbol lookup
+        serialId: client order id, resending the same one is idempotent
+        '''
+        await self._ensure_session()
+        headers = await self._trade_headers()
+        data = {
+            'action': action,
+            'lmtPrice': float(price),
+            'orderType': orderType,
+            'outsideRegularTradingHour': True,
+            'quantity': int(quant),
+            'serialId': serialId or str(uuid.uuid4()),
+            'tickerId': tId if tId is not None else await self.get_ticker(
+                stock),
+            'timeInForce': enforce
+        }
+        result = await self._post(
+            self.urls.place_orders(self.account_id),
+            json=data,
+            headers=headers,
+            endpoint='place_orders')
+        return result['orderId']
+
+    async def cancel_order(self, order_id=''):
+        await self._ensure_session()
+        headers = await self._trade_headers()
+        result = await self._post(
+            self.urls.cancel_order(self.account_id) + str(order_id) + '/' +
+            str(uuid.uuid4()),
+            json={},
+            headers=headers,
+            endpoint='cancel_order')
+        return result['success']
+
+    async def get_quote(self, stock=None, tId=None):
+        tId = await self._resolve(stock, tId)
+        return await self._get(self.urls.quotes(tId), endpoint='quotes')
+
+    async def get_quotes(self, stocks=None, tIds=None, as_numpy=False):
+        '''
+        many quotes gathered concurrently, see WeBullApi.get_quotes
+        '''
+        ids = list(tIds or [])
+        if stocks:
+            ids += [t for t in await asyncio.gather(
+                *[self.get_ticker(s) for s in stocks]) if t]
+        if not ids and not stocks:
+            raise ValueError('Must provide stock symbols or stock ids')
+        ids = list(dict.fromkeys(int(tId) for tId in ids))
+        quotes = await asyncio.gather(
+            *[self._get(self.urls.quotes(tId), endpoint='quotes')
+              for tId in ids])
+        from quotes import quotes_frame
+        with self.metrics.timer('quotes', 'frame'):
+            return quotes_frame(dict(zip(ids, quotes)), as_numpy=as_numpy)
+
+    async def get_options_expiration_dates(self, stock=None, tId=None):
+        result = await self._get(
+            self.urls.options_exp_date(await self._resolve(stock, tId)),
+            params={'count': -1, 'includeWeekly': 1},
+            headers=self.build_req_headers(),
+            endpoint='options_exp_date')
+        return [e['from'] for e in result['expireDateList']]
+
+    async def get_options(self,
+                          stock=None,
+                          tId=None,
+                          expireDate=None,
+                          direction='all',
+                          count=-1,
+                          includeWeekly=1,
+                          as_chain=False):
+        params = {'count': count, 'includeWeekly': includeWeekly,
+                  'direction': direction, 'queryAll': 0}
+        if expireDate is not None:
+            params['expireDate'] = expireDate
+        result = await self._get(
+            self.urls.options(await self._resolve(stock, tId)),
+            params=params,
+            headers=self.build_req_headers(),
+            endpoint='options')
+        expirations = result['expireDateList']
+        if expireDate is not None:
+            expirations = [e for e in expirations
+                           if e['from']['date'] == expireDate]
+        if as_chain:
+            from options import OptionChain
+            with self.metrics.timer('options', 'frame'):
+                return OptionChain.parse(expirations)
+        return expirations
+
+    async def get_option_quotes(self, derivativeIds, stock=None, tId=None,
+                                chunk=200):
+        '''
+        option quotes, `chunk` derivativeIds per request, chunks gathered
+        '''
+        ids = [str(int(d)) for d in derivativeIds]
+        if stock is not None or tId is not None:
+            tId = await self._resolve(stock, tId)
+        headers = self.build_req_headers()
+
+        async def fetch(part):
+            params = {'derivativeIds': ','.join(part)}
+            if tId is not None:
+                params['tickerId'] = tId
+            result = await self._get(
+                self.urls.option_quotes(), params=params, headers=headers,
+                endpoint='option_quotes')
+            return result.get('data', []) if isinstance(result,
+                                                        dict) else result
+
+        parts = await asyncio.gather(
+            *[fetch(ids[i:i + chunk]) for i in range(0, len(ids), chunk)])
+        return [q for quotes in parts for q in quotes]
+
+    async def get_option_chain(self, stock=None, tId=None, expiries=None,
+                               quotes=True, chunk=200):
+        '''
+        options.OptionChain from one expiry listing (or `expiries` fetched
+        concurrently), see WeBullApi.get_option_chain (which also caches per expiry)
+        '''
+        tId = await self._resolve(stock, tId)
+        from options import OptionChain
+        pieces = []
+        dates = expiries
+        if not dates:
+            # the expiry listing holds every contract, only expiries it
+            # left empty are asked for one by one
+            listing = await self.get_options(tId=tId)
+            pieces.append(OptionChain.parse(
+                [e for e in listing if e.get('data')]))
+            dates = [e['from']['date'] for e in listing if not e.get('data')]
+        pieces += await asyncio.gather(
+            *[self.get_options(tId=tId, expireDate=d, as_chain=True)
+              for d in dates])
+        chain = OptionChain.concat(pieces)
+        if quotes and len(chain):
+            fresh = await self.get_option_quotes(chain.derivativeId, tId=tId,
+                                                 chunk=chunk)
+            with self.metrics.timer('option_quotes', 'frame'):
+                chain.update(fresh)
+        return chain
+
+    async def get_tradable(self, stock=''):
+        return await self._get(
+            self.urls.is_tradable(await self.get_ticker(stock)),
+            endpoint='is_tradable')
+
+    async def get_active_gainer_loser(self, direction='gainer'):
+        params = {'regionId': 6, 'userRegionId': 6}
+        result = await self._get(
+            self.urls.active_gainers_losers(direction),
+            params=params,
+            headers=self.build_req_headers(),
+            endpoint='active_gainers_losers')
+        return sorted(result, key=lambda k: k['change'], reverse=True)
+
+    async def screen_page(self, body):
+        return await self._post(
+            self.urls.screener(),
+            json=body,
+            headers=self.build_req_headers(),
+            endpoint='screener')
+
+    async def run_screener(self, query, max_rows=None, as_numpy=False,
+                           page_size=200):
+        '''
+        async generator of typed batches, see WeBullApi.run_screener
+        (without the result cache)
+        '''
+        from screener import screener_batch
+        rows, page = 0, 0
+        while max_rows is None or rows < max_rows:
+            result = await self.screen_page(query.body(page, page_size))
+            items = (result.get('items') or [])[:None if max_rows is None
+                                                else max_rows - rows]
+            if not items:
+                return
+            rows += len(items)
+            yield screener_batch(items, as_numpy=as_numpy)
+            total = result.get('total')
+            if len(items) < page_size or (total is not None
+                                          and rows >= total):
+                return
+            page += 1
+
+    async def get_analysis(self, stock=None):
+        return await self._get(
+            self.urls.analysis(await self.get_ticker(stock)),
+            endpoint='analysis')
+
+    async def get_financials(self, stock=None):
+        return await self._get(
+            self.urls.fundamentals(await self.get_ticker(stock)),
+            endpoint='fundamentals')
+
+    async def get_news(self, stock=None, Id=0, items=20, tId=None):
+        params = {'currentNewsId': Id, 'pageSize': items}
+        return await self._get(
+            self.urls.news(await self._resolve(stock, tId)), params=params,
+            endpoint='news')
+
+    async def get_bars(self,
+                       stock=None,
+                       tId=None,
+                       interval='m1',
+                       count=1,
+                       extendTrading=0,
+                       timestamp=None,
+                       as_numpy=False,
+                       dtype='float64'):
+        tId = await self._resolve(stock, tId)
+        params = {
+            'type': interval,
+            'count': count,
+            'extendTrading': extendTrading
+        }
+        if timestamp is not None:
+            params['timestamp'] = int(timestamp)
+        result = await self._get(
+            self.urls.bars(tId), params=params, endpoint='bars')
+        from bars import parse_bars
+        with self.metrics.timer('bars', 'frame'):
+            return parse_bars(result, as_numpy=as_numpy, dtype=dtype)
+
+    async def get_dividends(self):
+        return await self._post(
+            self.urls.dividends(self.account_id),
+            json={},
+            headers=self.build_req_headers(),
+            endpoint='dividends')
+
+
+class AsyncPaperApi(AsyncWeBullApi):
+    '''
+    asyncio mirror of PaperApi
+    '''
+
+    def __init__(self, **kwargs):
+        self.paper_account_id = ''
+        super().__init__(**kwargs)
+
+    async def get_account(self):
+        return await self._get(
+            self.urls.paper_account(self.paper_account_id),
+            headers=self.build_req_headers(),
+            endpoint='paper_account')
+
+    async def get_account_id(self):
+        result = await self._get(
+            self.urls.paper_account_id(), headers=self.build_req_headers(),
+            endpoint='paper_account_id')
+        self.paper_account_id = result[0]['id']
+        return True
+
+    async def place_order(self,
+                          stock=None,
+                          tId=None,
+                          price=0,
+                          action='BUY',
+                          orderType='LMT',
+                          enforce='GTC',
+                          quant=0):
+        tId = await self._resolve(stock, tId)
+        await self._ensure_session()
+        headers = await self._trade_headers()
+        data = {
+            'action': action,
+            'lmtPrice': float(price),
+            'orderType': orderType,
+            'outsideRegularTradingHour': True,
+            'quantity': int(quant),
+            'serialId': str(uuid.uuid4()),
+            'tickerId': tId,
+            'timeInForce': enforce
+        }
+        return await self._post(
+            self.urls.paper_place_order(self.paper_account_id, tId),
+            json=data,
+            headers=headers,
+            endpoint='paper_place_order')
+
+    async def modify_order(self,
+                           order,
+                           price=0,
+                           action='BUY',
+                           orderType='LMT',
+                           enforce='GTC',
+                           quant=0):
+        data = {
+            'action': action,
+            'lmtPrice': float(price),
+            'orderType': orderType,
+            'comboType': "NORMAL",
+            'outsideRegularTradingHour': True,
+            'serialId': str(uuid.uuid4()),
+            'tickerId': order['ticker']['tickerId'],
+            'timeInForce': enforce
+        }
+        if quant == 0 or quant == order['totalQuantity']:
+            data['quantity'] = order['totalQuantity']
+        else:
+            data['quantity'] = int(quant)
+        await self._ensure_session()
+        return await self._ok(
+            'POST',
+            self.urls.paper_modify_order(self.paper_account_id,
+                                         order['orderId']),
+            json=data,
+            headers=self.build_req_headers(),
+            endpoint='paper_modify_order')
+
+    async def cancel_order(self, order_id):
+        await self._ensure_session()
+        return await self._ok(
+            'POST',
+            self.urls.paper_cancel_order(self.paper_account_id, order_id),
+            headers=self.build_req_headers(),
+            endpoint='paper_cancel_order')
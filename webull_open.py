@@ -1,31 +1,73 @@
-import pdb
-
 import hashlib
+import threading
 import time
-from datetime import datetime
 import pickle
 import os
 
 import uuid
 import getpass
-import requests
-from pandas import DataFrame
-from pytz import timezone
+from concurrent.futures import ThreadPoolExecutor
 
+from account import AccountCache
 from endpoints import Urls
+from session import SessionManager
+from ticker_cache import TickerCache
+from transport import Transport
+
+
+def load_did(path='did.bin'):
+    '''
+    device id shared by the sync and async clients, see WeBullApi._get_did
+    '''
+    if os.path.exists(path):
+        did = pickle.load(open(path, 'rb'))
+    else:
+        did = uuid.uuid4().hex
+        pickle.dump(did, open(path, 'wb'))
+    return did
 
 
 class WeBullApi():
-    def __init__(self):
-        self.urls = Urls()
-        self.session = requests.session()
+    def __init__(self,
+                 urls=None,
+                 transport=None,
+                 ticker_cache=None,
+                 account_ttl=1.0,
+                 session_path=None,
+                 refresh_margin=300.0):
+        '''
+        urls: Urls instance, e.g. Urls(root=...) for a local stand-in server
+        transport: Transport to share keep-alive pools between api objects
+        ticker_cache: TickerCache, defaults to the process wide shared one
+            of urls.root (ids never cross from a stand-in to the real hosts)
+        account_ttl: seconds positions / orders / portfolio reuse one
+            account request
+        session_path: file to persist tokens in; a saved, unexpired session
+            is restored and then kept fresh in the background (see
+            session.SessionManager)
+        refresh_margin: seconds before token_expire the tokens are refreshed
+
+        construction sends no request: the trade token is fetched by the
+        first call that needs it, the device id is read on first use and
+        numpy / pandas are imported by the methods returning frames
+        '''
+        self.urls = urls or Urls()
+        self.transport = transport or Transport()
+        self.ticker_cache = ticker_cache or TickerCache.shared(
+            self.urls.root)
+        self.metrics = self.transport.metrics
+        self._option_cache = None
+        self._screener = None
+        self.account_cache = AccountCache(
+            lambda: self.get_account(), ttl=account_ttl)
+        self.session = self.transport.session
         self.headers = {
             "Accept": "*/*",
             "Accept-Encoding": "gzip, deflate",
             "Content-Type": "application/json",
         }
         # self.auth_method = self.login_prompt
-        self.did = self._get_did()
+        self._did = None
         self.access_token = ''
         self.account_id = ''
         self.refresh_token = ''
@@ -33,7 +75,57 @@ class WeBullApi():
         self.trade_token = ''
         self.uuid = ''
         self.trade_pin = ''
-        self.get_trade_token()
+        self._trade_token_lock = threading.Lock()
+        self.session_manager = None
+        if session_path is not None:
+            self.session_manager = SessionManager(self, session_path,
+                                                  refresh_margin)
+            if self.session_manager.restore():
+                self.session_manager.start()
+
+    @property
+    def did(self):
+        if self._did is None:
+            self._did = self._get_did()
+        return self._did
+
+    @did.setter
+    def did(self, value):
+        self._did = value
+
+    @property
+    def quote_cache(self):
+        from quotes import QuoteSnapshotCache
+        return QuoteSnapshotCache.shared(self.urls.root)
+
+    @property
+    def option_cache(self):
+        if self._option_cache is None:
+            from options import OptionChainCache
+            self._option_cache = OptionChainCache(self)
+        return self._option_cache
+
+    @property
+    def screener(self):
+        if self._screener is None:
+            from screener import Screener
+            self._screener = Screener(self)
+        return self._screener
+
+    def _session_changed(self):
+        '''
+        persist new tokens and keep them fresh from now on
+        '''
+        if self.session_manager is not None:
+            self.session_manager.save()
+            self.session_manager.start()
+
+    def _ensure_session(self):
+        '''
+        trade calls never go out with an expired access token
+        '''
+        if self.session_manager is not None:
+            self.session_manager.ensure_fresh()
 
     def _get_did(self):
         """
@@ -44,22 +136,18 @@ class WeBullApi():
         for the MQTT web socket protocol
         :return: hex string of a 32 digit uuid
         """
-        if os.path.exists('did.bin'):
-            did = pickle.load(open('did.bin', 'rb'))
-        else:
-            did = uuid.uuid4().hex
-            pickle.dump(did, open('did.bin', 'wb'))
-        return did
+        return load_did()
 
     def build_req_headers(self, include_trade_token=False, include_time=False):
         '''
-        Build default set of header params
+        Build default set of header params, a new dict per call so
+        concurrent requests never share one
         '''
-        headers = self.headers
+        headers = dict(self.headers)
         headers['did'] = self.did
         headers['access_token'] = self.access_token
         if include_trade_token:
-            headers['t_token'] = self.trade_token
+            headers['t_token'] = self._ensure_trade_token()
         if include_time:
             headers['t_time'] = str(round(time.time() * 1000))
         return headers
@@ -74,8 +162,9 @@ class WeBullApi():
             'pwd': md5_hash.hexdigest(),
             'regionId': 13
         }
-        response = requests.post(
-            self.urls.login(), json=data, headers=self.headers)
+        response = self.transport.post(
+            self.urls.login(), json=data, headers=self.headers,
+            endpoint='login')
 
         result = response.json()
         if 'data' in result and 'accessToken' in result['data']:
@@ -84,6 +173,7 @@ class WeBullApi():
             self.token_expire = result['data']['tokenExpireTime']
             self.uuid = result['data']['uuid']
             self.get_account_id()
+            self._session_changed()
             return True
         else:
             return False
@@ -103,7 +193,8 @@ class WeBullApi():
         End login session
         """
         headers = self.build_req_headers()
-        response = requests.get(self.urls.logout(), headers=headers)
+        response = self.transport.get(
+            self.urls.logout(), headers=headers, endpoint='logout')
         if response.status_code != 200:
             return False
         else:
@@ -112,16 +203,18 @@ class WeBullApi():
     def refresh_login(self):
         headers = self.build_req_headers()
         data = {'refreshToken': self.refresh_token}
-        response = requests.post(
+        response = self.transport.post(
             self.urls.refresh_login() + self.refresh_token,
             json=data,
-            headers=headers)
+            headers=headers,
+            endpoint='refresh_login')
 
         result = response.json()
         if 'accessToken' in result and result['accessToken'] != '' and result['refreshToken'] != '' and result['tokenExpireTime'] != '':
             self.access_token = result['accessToken']
             self.refresh_token = result['refreshToken']
             self.token_expire = result['tokenExpireTime']
+            self._session_changed()
             return True
         else:
             return False
@@ -132,7 +225,8 @@ class WeBullApi():
         '''
         headers = self.build_req_headers()
 
-        response = requests.get(self.urls.user(), headers=headers)
+        response = self.transport.get(
+            self.urls.user(), headers=headers, endpoint='user')
         result = response.json()
 
         return result
@@ -144,7 +238,9 @@ class WeBullApi():
         '''
         headers = self.build_req_headers()
 
-        response = requests.get(self.urls.account_id(), headers=headers)
+        response = self.transport.get(
+            self.urls.account_id(), headers=headers,
+            endpoint='account_id')
         result = response.json()
 
         if result['success']:
@@ -159,17 +255,32 @@ class WeBullApi():
         '''
         headers = self.build_req_headers()
 
-        response = requests.get(
-            self.urls.account(self.account_id), headers=headers)
+        response = self.transport.get(
+            self.urls.account(self.account_id), headers=headers,
+            endpoint='account')
         result = response.json()
 
         return result
 
+    def get_account_snapshot(self, max_age=None):
+        '''
+        parsed account (typed positions, orders, portfolio) shared by all
+        callers for account_ttl seconds, see account.AccountCache
+        '''
+        return self.account_cache.get(max_age)
+
+    def get_account_changes(self, since=None):
+        '''
+        positions and orders added / removed / changed since the previous
+        snapshot (or `since`)
+        '''
+        return self.account_cache.diff(since)
+
     def get_positions(self):
         '''
         output standing positions of stocks
         '''
-        data = self.get_account()
+        data = self.get_account_snapshot().raw
 
         return data['positions']
 
@@ -177,31 +288,29 @@ class WeBullApi():
         '''
         output numbers of portfolio
         '''
-        data = self.get_account()
-
-        output = {}
-        for item in data['accountMembers']:
-            output[item['key']] = item['value']
-
-        return output
+        return dict(self.get_account_snapshot().portfolio)
 
     def get_current_orders(self):
         '''
         Get open/standing orders
         '''
-        data = self.get_account()
+        data = self.get_account_snapshot().raw
 
         return data['openOrders']
 
-    def get_history_orders(self, status='Cancelled'):
+    def get_history_orders(self, status='Cancelled', start_time=None):
         '''
         Historical orders, can be cancelled or filled
         status = Cancelled / Filled / Working / Partially Filled / Pending / Failed / All
+        start_time: 'YYYY-MM-DD', only orders placed from that day on
+            (the whole history by default, see order_store.OrderSync)
         '''
         headers = self.build_req_headers(
             include_trade_token=True, include_time=True)
-        response = requests.get(
-            self.urls.orders(self.account_id) + str(status), headers=headers)
+        url = (self.urls.orders(self.account_id) if start_time is None else
+               self.urls.orders(self.account_id, start_time))
+        response = self.transport.get(
+            url + str(status), headers=headers, endpoint='orders')
 
         return response.json()
 
@@ -218,21 +327,44 @@ class WeBullApi():
         # password = md5_hash.hexdigest()
         data = {'pwd': md5_hash.hexdigest()}
 
-        response = requests.post(
-            self.urls.trade_token(), json=data, headers=headers)
+        response = self.transport.post(
+            self.urls.trade_token(), json=data, headers=headers,
+            endpoint='trade_token')
         result = response.json()
 
         if result['success']:
             self.trade_token = result['data']['tradeToken']
+            self._session_changed()
             return True
         else:
             return False
 
+    def _ensure_trade_token(self):
+        '''
+        the trade token, fetched once by the first trade call
+        '''
+        if not self.trade_token:
+            with self._trade_token_lock:
+                if not self.trade_token:
+                    self.get_trade_token(self.trade_pin)
+        return self.trade_token
+
     def get_ticker(self, stock=''):
         '''
-        lookup ticker_id
+        lookup ticker_id, served from the ticker cache when possible
+        '''
+        return self.ticker_cache.resolve(stock, self._lookup_ticker)
+
+    def warm_tickers(self, stocks, max_workers=16):
         '''
-        response = requests.get(self.urls.stock_id(stock))
+        resolve a universe of symbols up front, returns {symbol: ticker_id}
+        '''
+        return self.ticker_cache.warm(
+            stocks, self._lookup_ticker, max_workers=max_workers)
+
+    def _lookup_ticker(self, stock):
+        response = self.transport.get(
+            self.urls.stock_id(stock), endpoint='stock_id')
         result = response.json()
 
         ticker_id = 0
@@ -247,13 +379,18 @@ class WeBullApi():
                     action='BUY',
                     orderType='LMT',
                     enforce='GTC',
-                    quant=0):
+                    quant=0,
+                    tId=None,
+                    serialId=None):
         '''
         ordering
         action: BUY / SELL
         ordertype : LMT / MKT / STP / STP LMT
         timeinforce:  GTC / DAY / IOC
+        tId: ticker id, skips the symbol lookup
+        serialId: client order id, resending the same one is idempotent
         '''
+        self._ensure_session()
         headers = self.build_req_headers(
             include_trade_token=True, include_time=True)
 
@@ -263,15 +400,17 @@ class WeBullApi():
             'orderType': orderType,
             'outsideRegularTradingHour': True,
             'quantity': int(quant),
-            'serialId': str(uuid.uuid4()),
-            'tickerId': self.get_ticker(stock),
+            'serialId': serialId or str(uuid.uuid4()),
+            'tickerId': tId if tId is not None else self.get_ticker(stock),
             'timeInForce': enforce
         }
 
-        response = requests.post(
+        response = self.transport.post(
             self.urls.place_orders(self.account_id),
             json=data,
-            headers=headers)
+            headers=headers,
+            endpoint='place_orders')
+        self.account_cache.invalidate()
         result = response.json()
 
         return result['orderId']
@@ -280,16 +419,19 @@ class WeBullApi():
         '''
         retract an order
         '''
+        self._ensure_session()
         headers = self.build_req_headers(
             include_trade_token=True, include_time=True)
 
         data = {}
 
-        response = requests.post(
+        response = self.transport.post(
             self.urls.cancel_order(self.account_id) + str(order_id) + '/' +
             str(uuid.uuid4()),
             json=data,
-            headers=headers)
+            headers=headers,
+            endpoint='cancel_order')
+        self.account_cache.invalidate()
         result = response.json()
 
         return result['success']
@@ -305,16 +447,159 @@ class WeBullApi():
         else:
             raise ValueError('Must provide a stock symbol or a stock id')
 
-        response = requests.get(self.urls.quotes(tId))
+        response = self.transport.get(self.urls.quotes(tId), endpoint='quotes')
         result = response.json()
 
         return result
 
+    def get_quotes(self,
+                   stocks=None,
+                   tIds=None,
+                   max_age=0.3,
+                   max_workers=16,
+                   as_numpy=False):
+        '''
+        snapshot of many quotes as one DataFrame indexed by tickerId
+        params:
+            stocks / tIds: symbols and/or ticker ids, duplicates are dropped
+            max_age: seconds a quote fetched by any caller can be reused
+            as_numpy: return a numpy structured array instead
+        '''
+        ids = list(tIds or [])
+        if stocks:
+            resolved = self.warm_tickers(stocks, max_workers=max_workers)
+            ids += [resolved[s] for s in stocks if resolved[s]]
+        if not ids and not stocks:
+            raise ValueError('Must provide stock symbols or stock ids')
+        ids = list(dict.fromkeys(int(tId) for tId in ids))
+        quotes = self.quote_cache.get_many(
+            ids,
+            lambda tId: self.transport.get(
+                self.urls.quotes(tId), endpoint='quotes').json(),
+            max_age=max_age,
+            max_workers=max_workers)
+        from quotes import quotes_frame
+        with self.metrics.timer('quotes', 'frame'):
+            return quotes_frame(quotes, as_numpy=as_numpy)
+
+    def _resolve(self, stock, tId):
+        if tId is not None:
+            return tId
+        elif stock is not None:
+            return self.get_ticker(stock)
+        raise ValueError('Must provide a stock symbol or a stock id')
+
+    def get_options_expiration_dates(self, stock=None, tId=None):
+        '''
+        option expirations of an underlying: [{'date': 'YYYY-MM-DD',
+        'days': ..., 'weekly': ...}]. the response carries every contract
+        too; get_option_chain keeps them instead of asking per expiry
+        '''
+        response = self.transport.get(
+            self.urls.options_exp_date(self._resolve(stock, tId)),
+            params={'count': -1, 'includeWeekly': 1},
+            headers=self.build_req_headers(),
+            endpoint='options_exp_date')
+        return [e['from'] for e in response.json()['expireDateList']]
+
+    def get_options(self,
+                    stock=None,
+                    tId=None,
+                    expireDate=None,
+                    direction='all',
+                    count=-1,
+                    includeWeekly=1,
+                    as_chain=False):
+        '''
+        option contracts of an underlying, one expiry or all of them
+        params:
+            expireDate: 'YYYY-MM-DD', every expiry when None
+            direction: all / call / put
+            count: strikes around the money, -1 for all
+            as_chain: return an options.OptionChain instead of the
+                expireDateList json
+        '''
+        params = {'count': count, 'includeWeekly': includeWeekly,
+                  'direction': direction, 'queryAll': 0}
+        if expireDate is not None:
+            params['expireDate'] = expireDate
+        response = self.transport.get(
+            self.urls.options(self._resolve(stock, tId)),
+            params=params,
+            headers=self.build_req_headers(),
+            endpoint='options')
+        expirations = response.json()['expireDateList']
+        if expireDate is not None:
+            expirations = [e for e in expirations
+                           if e['from']['date'] == expireDate]
+        if as_chain:
+            from options import OptionChain
+            with self.metrics.timer('options', 'frame'):
+                return OptionChain.parse(expirations)
+        return expirations
+
+    def get_option_quotes(self,
+                          derivativeIds,
+                          stock=None,
+                          tId=None,
+                          chunk=200,
+                          max_workers=8):
+        '''
+        quotes of many option contracts, `chunk` derivativeIds per request
+        and the requests in parallel. returns a list of quote json
+        '''
+        ids = [str(int(d)) for d in derivativeIds]
+        tId = (self._resolve(stock, tId)
+               if stock is not None or tId is not None else None)
+        headers = self.build_req_headers()
+
+        def fetch(part):
+            params = {'derivativeIds': ','.join(part)}
+            if tId is not None:
+                params['tickerId'] = tId
+            result = self.transport.get(
+                self.urls.option_quotes(), params=params, headers=headers,
+                endpoint='option_quotes').json()
+            return result.get('data', []) if isinstance(result,
+                                                        dict) else result
+
+        parts = [ids[i:i + chunk] for i in range(0, len(ids), chunk)]
+        if len(parts) <= 1:
+            return fetch(parts[0]) if parts else []
+        with ThreadPoolExecutor(
+                max_workers=min(max_workers, len(parts))) as pool:
+            return [q for quotes in pool.map(fetch, parts) for q in quotes]
+
+    def get_option_chain(self,
+                         stock=None,
+                         tId=None,
+                         expiries=None,
+                         max_age=None,
+                         quotes=True,
+                         chunk=200,
+                         max_workers=8):
+        '''
+        options.OptionChain of an underlying. contracts come from the
+        per-expiry cache (only expiries older than max_age are re-pulled),
+        quotes=True then refreshes every contract through option_quotes
+        '''
+        tId = self._resolve(stock, tId)
+        chain = self.option_cache.chain(tId, expiries, max_age)
+        if quotes and len(chain):
+            fresh = self.get_option_quotes(
+                chain.derivativeId, tId=tId, chunk=chunk,
+                max_workers=max_workers)
+            with self.metrics.timer('option_quotes', 'frame'):
+                chain.update(fresh)
+        return chain
+
     def get_tradable(self, stock=''):
         '''
         get if stock is tradable
         '''
-        response = requests.get(self.urls.is_tradable(self.get_ticker(stock)))
+        response = self.transport.get(
+            self.urls.is_tradable(self.get_ticker(stock)),
+            endpoint='is_tradable')
         return response.json()
 
     def get_active_gainer_loser(self, direction='gainer'):
@@ -325,51 +610,85 @@ class WeBullApi():
         headers = self.build_req_headers()
 
         params = {'regionId': 6, 'userRegionId': 6}
-        response = requests.get(
+        response = self.transport.get(
             self.urls.active_gainers_losers(direction),
             params=params,
-            headers=headers)
+            headers=headers,
+            endpoint='active_gainers_losers')
         result = response.json()
         result = sorted(result, key=lambda k: k['change'], reverse=True)
 
         return result
 
+    def screen_page(self, body):
+        '''
+        one page of the server side screener, body from
+        ScreenerQuery.body()
+        '''
+        response = self.transport.post(
+            self.urls.screener(),
+            json=body,
+            headers=self.build_req_headers(),
+            endpoint='screener')
+        return response.json()
+
+    def run_screener(self, query, max_rows=None, as_numpy=False):
+        '''
+        generator of typed batches (DataFrames indexed by tickerId) for a
+        screener.ScreenerQuery, one page in memory at a time; a repeat of
+        the same query within Screener.ttl is served from memory
+        '''
+        return self.screener.scan(query, max_rows=max_rows,
+                                  as_numpy=as_numpy)
+
     def get_analysis(self, stock=None):
         '''
         get analysis info and returns a dict of analysis ratings
         '''
-        return requests.get(self.urls.analysis(self.get_ticker(stock))).json()
+        return self.transport.get(
+            self.urls.analysis(self.get_ticker(stock)),
+            endpoint='analysis').json()
 
     def get_financials(self, stock=None):
         '''
         get financials info and returns a dict of financial info
         '''
-        return requests.get(self.urls.fundamentals(
-            self.get_ticker(stock))).json()
+        return self.transport.get(self.urls.fundamentals(
+            self.get_ticker(stock)),
+            endpoint='fundamentals').json()
 
-    def get_news(self, stock=None, Id=0, items=20):
+    def get_news(self, stock=None, Id=0, items=20, tId=None):
         '''
-        get news and returns a list of articles
+        get news and returns a list of articles, newest first
         params:
-            Id: 0 is latest news article
+            Id: 0 is latest news article, otherwise articles older than Id
             items: number of articles to return
+            tId: ticker id, skips the symbol lookup
+        see news.NewsFeed to poll many tickers into a local store
         '''
         params = {'currentNewsId': Id, 'pageSize': items}
-        return requests.get(
-            self.urls.news(self.get_ticker(stock)), params=params).json()
+        return self.transport.get(
+            self.urls.news(self._resolve(stock, tId)), params=params,
+            endpoint='news').json()
 
     def get_bars(self,
                  stock=None,
                  tId=None,
                  interval='m1',
                  count=1,
-                 extendTrading=0):
+                 extendTrading=0,
+                 timestamp=None,
+                 as_numpy=False,
+                 dtype='float64'):
         '''
-        get bars returns a pandas dataframe
+        get bars returns a pandas dataframe in ascending time order
         params:
             interval: m1, m5, m15, m30, h1, h2, h4, d1, w1
             count: number of bars to return
             extendTrading: change to 1 for pre-market and afterhours bars
+            timestamp: epoch seconds, only return bars before this time
+            as_numpy: return a dict of numpy arrays instead of a dataframe
+            dtype: float dtype of the columns, 'float32' halves the memory
         '''
         if not tId is None:
             pass
@@ -383,34 +702,22 @@ class WeBullApi():
             'count': count,
             'extendTrading': extendTrading
         }
-        df = DataFrame(
-            columns=['open', 'high', 'low', 'close', 'volume', 'vwap'])
-        df.index.name = 'timestamp'
-        response = requests.get(self.urls.bars(tId), params=params)
+        if timestamp is not None:
+            params['timestamp'] = int(timestamp)
+        response = self.transport.get(
+            self.urls.bars(tId), params=params, endpoint='bars')
         result = response.json()
-        time_zone = timezone(result[0]['timeZone'])
-        pdb.set_trace()
-        for row in result[0]['data']:
-            row = row.split(',')
-            row = ['0' if value == 'null' else value for value in row]
-            data = {
-                'open': float(row[1]),
-                'high': float(row[3]),
-                'low': float(row[4]),
-                'close': float(row[2]),
-                'volume': float(row[6]),
-                'vwap': float(row[7])
-            }
-            df.loc[datetime.fromtimestamp(int(
-                row[0])).astimezone(time_zone)] = data
-        return df.iloc[::-1]
+        from bars import parse_bars
+        with self.metrics.timer('bars', 'frame'):
+            return parse_bars(result, as_numpy=as_numpy, dtype=dtype)
 
     def get_dividends(self):
         """ Return account's dividend info """
         headers = self.build_req_headers()
         data = {}
-        response = requests.post(
-            self.urls.dividends(self.account_id), json=data, headers=headers)
+        response = self.transport.post(
+            self.urls.dividends(self.account_id), json=data, headers=headers,
+            endpoint='dividends')
         return response.json()
 
 
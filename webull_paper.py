@@ -1,20 +1,20 @@
-import pdb
 import uuid
 
-import requests
 from webull_open import WeBullApi
 
 
 class PaperApi(WeBullApi):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, **kwargs):
+        # set first, a restored session fills it in
         self.paper_account_id = ''
+        super().__init__(**kwargs)
 
     def get_account(self):
         """ Get important details of paper account """
         headers = self.build_req_headers()
-        response = requests.get(
-            self.urls.paper_account(self.paper_account_id), headers=headers)
+        response = self.transport.get(
+            self.urls.paper_account(self.paper_account_id), headers=headers,
+            endpoint='paper_account')
         return response.json()
 
     def get_account_id(self):
@@ -23,7 +23,9 @@ class PaperApi(WeBullApi):
         """
         headers = self.build_req_headers()
 
-        response = requests.get(self.urls.paper_account_id(), headers=headers)
+        response = self.transport.get(
+            self.urls.paper_account_id(), headers=headers,
+            endpoint='paper_account_id')
         result = response.json()
         self.paper_account_id = result[0]['id']
         return True
@@ -32,13 +34,13 @@ class PaperApi(WeBullApi):
         """
         Open paper trading orders
         """
-        return self.get_account()['openOrders']
+        return self.get_account_snapshot().raw['openOrders']
 
     def get_positions(self):
         """
         Current positions in paper trading account.
         """
-        return self.get_account()['positions']
+        return self.get_account_snapshot().raw['positions']
 
     def place_order(self,
                     stock=None,
@@ -47,9 +49,11 @@ class PaperApi(WeBullApi):
                     action='BUY',
                     orderType='LMT',
                     enforce='GTC',
-                    quant=0):
+                    quant=0,
+                    serialId=None):
         """
         Place a paper account order.
+        serialId: client order id, resending the same one is idempotent
         """
         if not tId is None:
             pass
@@ -58,6 +62,7 @@ class PaperApi(WeBullApi):
         else:
             raise ValueError('Must provide a stock symbol or a stock id')
 
+        self._ensure_session()
         headers = self.build_req_headers(
             include_trade_token=True, include_time=True)
 
@@ -67,15 +72,17 @@ class PaperApi(WeBullApi):
             'orderType': orderType,  # "LMT","MKT"
             'outsideRegularTradingHour': True,
             'quantity': int(quant),
-            'serialId': str(uuid.uuid4()),
+            'serialId': serialId or str(uuid.uuid4()),
             'tickerId': tId,
             'timeInForce': enforce
         }  # GTC or DAY
 
-        response = requests.post(
+        response = self.transport.post(
             self.urls.paper_place_order(self.paper_account_id, tId),
             json=data,
-            headers=headers)
+            headers=headers,
+            endpoint='paper_place_order')
+        self.account_cache.invalidate()
         return response.json()
 
     def modify_order(self,
@@ -88,6 +95,7 @@ class PaperApi(WeBullApi):
         """
         Modify a paper account order.
         """
+        self._ensure_session()
         headers = self.build_req_headers()
 
         data = {
@@ -106,11 +114,13 @@ class PaperApi(WeBullApi):
         else:
             data['quantity'] = int(quant)
 
-        response = requests.post(
+        response = self.transport.post(
             self.urls.paper_modify_order(self.paper_account_id,
                                          order['orderId']),
             json=data,
-            headers=headers)
+            headers=headers,
+            endpoint='paper_modify_order')
+        self.account_cache.invalidate()
         if response:
             return True
         else:
@@ -122,10 +132,13 @@ class PaperApi(WeBullApi):
         """
         Cancel a paper account order.
         """
+        self._ensure_session()
         headers = self.build_req_headers()
-        response = requests.post(
+        response = self.transport.post(
             self.urls.paper_cancel_order(self.paper_account_id, order_id),
-            headers=headers)
+            headers=headers,
+            endpoint='paper_cancel_order')
+        self.account_cache.invalidate()
         return bool(response)
 
 